@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Alerta, NotificacionTutor
+from .models import Alerta, DeviceToken, NotificacionTutor
 
 
 @admin.register(Alerta)
@@ -27,3 +27,13 @@ class NotificacionTutorAdmin(admin.ModelAdmin):
     list_filter = ['enviada_exitosamente', 'fecha_enviada']
     search_fields = ['tutor__usuario__first_name', 'tutor__usuario__last_name']
     readonly_fields = ['fecha_enviada', 'fecha_leida']
+
+
+@admin.register(DeviceToken)
+class DeviceTokenAdmin(admin.ModelAdmin):
+    list_display = ['usuario', 'plataforma', 'dispositivo', 'activo', 'ultimo_exito',
+                    'fallos_consecutivos', 'total_fallos']
+    list_filter = ['activo', 'plataforma']
+    search_fields = ['usuario__username', 'usuario__first_name', 'usuario__last_name', 'dispositivo']
+    readonly_fields = ['fecha_registro', 'fecha_actualizacion', 'ultimo_exito',
+                       'fallos_consecutivos', 'total_fallos']
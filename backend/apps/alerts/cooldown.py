@@ -0,0 +1,74 @@
+"""
+Cooldown de alertas por (niño, tipo) sin consultar la BD
+
+Mientras un niño sigue fuera del área, cada fix intentaba crear una
+alerta y pagaba una consulta para descubrir que ya había una reciente.
+Aquí se guarda en la caché de Django, por (nino_id, tipo), hasta cuándo
+rige el cooldown de ALERT_COOLDOWN_MINUTES.
+
+Solo si la caché no sabe nada (reinicio, caché vaciada) se consulta la BD,
+con el índice parcial de alertas abiertas (alerta_abierta_idx).
+
+El cooldown se inicia y se libera al confirmarse la transacción que
+creó o atendió la alerta: un rollback no deja en caché un cooldown sin
+alerta. Dos procesos no crean la misma alerta a la vez porque las
+alertas nacen de la máquina de geocerca, que serializa por niño
+(MaquinaGeocerca.bloqueo).
+
+Requiere una caché compartida (CACHE_URL): con la caché local, liberar()
+en un proceso no llega a los demás. Por eso ALERT_COOLDOWN_EN_CACHE es
+False sin CACHE_URL y entonces se consulta siempre la BD.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+class CooldownAlertas:
+    """Ventanas de silencio de alertas por (nino_id, tipo)"""
+
+    @staticmethod
+    def _clave(nino_id, tipo):
+        return f'alerta_cooldown_{nino_id}_{tipo}'
+
+    @staticmethod
+    def duracion():
+        return settings.ALERT_COOLDOWN_MINUTES * 60
+
+    def activo(self, nino_id, tipo):
+        """
+        True si (nino_id, tipo) está en cooldown según la caché (False
+        también cuando no se sabe: el llamador consulta la BD)
+        """
+        if not settings.ALERT_COOLDOWN_EN_CACHE:
+            return False
+        hasta = cache.get(self._clave(nino_id, tipo))
+        return hasta is not None and hasta > time.time()
+
+    def iniciar(self, nino_id, tipo, desde=None):
+        """Registra el cooldown a partir de `desde` (epoch, por defecto ahora)"""
+        if not settings.ALERT_COOLDOWN_EN_CACHE:
+            return
+        hasta = (desde if desde is not None else time.time()) + self.duracion()
+        restante = hasta - time.time()
+        if restante > 0:
+            cache.set(self._clave(nino_id, tipo), hasta, restante)
+
+    def iniciar_al_confirmar(self, nino_id, tipo):
+        """Inicia el cooldown cuando la transacción actual confirma"""
+        desde = time.time()
+        transaction.on_commit(lambda: self.iniciar(nino_id, tipo, desde))
+
+    def liberar(self, nino_id, tipo):
+        """Termina el cooldown (p. ej. la alerta se leyó o se resolvió)"""
+        if settings.ALERT_COOLDOWN_EN_CACHE:
+            cache.delete(self._clave(nino_id, tipo))
+
+    def liberar_al_confirmar(self, nino_id, tipo):
+        """Termina el cooldown cuando la transacción actual confirma"""
+        transaction.on_commit(lambda: self.liberar(nino_id, tipo))
+
+
+cooldown_alertas = CooldownAlertas()
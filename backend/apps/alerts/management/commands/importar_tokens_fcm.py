@@ -0,0 +1,27 @@
+"""
+Copia los tokens FCM guardados en Usuario.firebase_token al registro
+DeviceToken (una sola vez, al actualizar)
+
+Uso:
+    python manage.py importar_tokens_fcm
+"""
+from django.core.management.base import BaseCommand
+
+from apps.alerts.models import DeviceToken
+from apps.core.models import Usuario
+
+
+class Command(BaseCommand):
+    help = 'Registra en DeviceToken los tokens FCM existentes en Usuario.firebase_token'
+
+    def handle(self, *args, **options):
+        existentes = set(DeviceToken.objects.values_list('token', flat=True))
+        nuevos = [
+            DeviceToken(usuario_id=usuario_id, token=token)
+            for usuario_id, token in Usuario.objects.exclude(firebase_token='')
+            .values_list('id', 'firebase_token')
+            if token not in existentes
+        ]
+        DeviceToken.objects.bulk_create(nuevos, ignore_conflicts=True)
+
+        self.stdout.write(self.style.SUCCESS(f'✅ {len(nuevos)} token(s) importado(s)'))
@@ -1,10 +1,17 @@
 """
 Modelos para el sistema de alertas
 """
-from django.db import models
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Value, When
 from django.utils import timezone
 from apps.gis_tracking.models import Nino, PosicionGPS
-from apps.core.models import Tutor
+from apps.core.models import Tutor, Usuario
+
+logger = logging.getLogger(__name__)
 
 
 class Alerta(models.Model):
@@ -13,6 +20,7 @@ class Alerta(models.Model):
     """
     TIPO_ALERTA = [
         ('SALIDA_AREA', 'Salida del Área Segura'),
+        ('REGRESO_AREA', 'Regreso al Área Segura'),
         ('BATERIA_BAJA', 'Batería Baja'),
         ('SIN_SEÑAL', 'Sin Señal GPS'),
         ('MANUAL', 'Alerta Manual'),
@@ -25,6 +33,12 @@ class Alerta(models.Model):
         ('RESUELTA', 'Resuelta'),
     ]
     
+    # Estados que bloquean una nueva alerta del mismo tipo (cooldown)
+    ESTADOS_ABIERTOS = ['PENDIENTE', 'ENVIADA']
+    
+    # Solo informan (no cuentan como alertas activas)
+    TIPOS_INFORMATIVOS = ['REGRESO_AREA']
+    
     nino = models.ForeignKey(
         Nino,
         on_delete=models.CASCADE,
@@ -43,12 +57,14 @@ class Alerta(models.Model):
         default='PENDIENTE'
     )
     
-    # Posición GPS donde se generó la alerta
+    # Posición GPS donde se generó la alerta. Sin constraint en la BD:
+    # posiciongps está particionada y su PK es (id, timestamp)
     posicion_gps = models.ForeignKey(
         PosicionGPS,
         on_delete=models.SET_NULL,
         null=True,
         blank=True,
+        db_constraint=False,
         related_name='alertas_generadas'
     )
     
@@ -75,6 +91,12 @@ class Alerta(models.Model):
         indexes = [
             models.Index(fields=['nino', '-fecha_creacion']),
             models.Index(fields=['estado', '-fecha_creacion']),
+            # Solo alertas abiertas: las que cuentan para el cooldown
+            models.Index(
+                fields=['nino', 'tipo_alerta', '-fecha_creacion'],
+                name='alerta_abierta_idx',
+                condition=Q(estado__in=['PENDIENTE', 'ENVIADA']),
+            ),
         ]
     
     def __str__(self):
@@ -85,21 +107,37 @@ class Alerta(models.Model):
         """
         Crea una alerta cuando el niño sale del área
         Incluye cooldown para evitar spam de alertas
+
+        Durante el cooldown (ALERT_COOLDOWN_MINUTES) no se consulta la BD:
+        se resuelve con cooldown_alertas (ver apps/alerts/cooldown.py).
+        Un regreso al área termina el cooldown: solo cuentan las salidas
+        abiertas posteriores al último REGRESO_AREA del niño.
         """
-        from datetime import timedelta
-        
-        # Verificar si ya existe una alerta reciente (últimos 5 minutos)
-        tiempo_cooldown = timezone.now() - timedelta(minutes=5)
+        from .cooldown import cooldown_alertas
+
+        nino_id = posicion_gps.nino_id
+        if cooldown_alertas.activo(nino_id, 'SALIDA_AREA'):
+            return None  # No crear alerta duplicada
+
+        # La caché no sabe nada (reinicio, caché vaciada): consultar la BD
+        # (índice parcial alerta_abierta_idx)
+        tiempo_cooldown = timezone.now() - timedelta(minutes=settings.ALERT_COOLDOWN_MINUTES)
+        regreso_posterior = cls.objects.filter(
+            nino_id=nino_id,
+            tipo_alerta='REGRESO_AREA',
+            fecha_creacion__gte=OuterRef('fecha_creacion'),
+        )
         alerta_reciente = cls.objects.filter(
-            nino=posicion_gps.nino,
+            nino_id=nino_id,
             tipo_alerta='SALIDA_AREA',
             fecha_creacion__gte=tiempo_cooldown,
-            estado__in=['PENDIENTE', 'ENVIADA']
-        ).exists()
-        
+            estado__in=cls.ESTADOS_ABIERTOS
+        ).exclude(Exists(regreso_posterior)).values_list('fecha_creacion', flat=True).first()
+
         if alerta_reciente:
-            return None  # No crear alerta duplicada
-        
+            cooldown_alertas.iniciar(nino_id, 'SALIDA_AREA', alerta_reciente.timestamp())
+            return None
+
         # Crear nueva alerta
         mensaje = (
             f"⚠️ ALERTA: {posicion_gps.nino.nombre_completo()} ha salido del área segura "
@@ -113,80 +151,234 @@ class Alerta(models.Model):
             posicion_gps=posicion_gps,
             mensaje=mensaje
         )
+        cooldown_alertas.iniciar_al_confirmar(nino_id, 'SALIDA_AREA')
+        alerta.transmitir()
         
         # Enviar notificaciones a tutores
         alerta.enviar_notificaciones()
         
         return alerta
     
+    @classmethod
+    def crear_alerta_regreso(cls, posicion_gps):
+        """
+        Crea el aviso de que el niño volvió al área segura (transición
+        fuera -> dentro de la máquina de estados de geocerca)
+
+        Termina el cooldown de salida: si vuelve a salir, se alerta de nuevo.
+        """
+        from .cooldown import cooldown_alertas
+
+        nino = posicion_gps.nino
+        alerta = cls.objects.create(
+            nino=nino,
+            tipo_alerta='REGRESO_AREA',
+            posicion_gps=posicion_gps,
+            mensaje=(
+                f"✅ {nino.nombre_completo()} regresó al área segura "
+                f"de {nino.centro_educativo.nombre}. "
+                f"Hora: {posicion_gps.timestamp.strftime('%H:%M:%S')}"
+            )
+        )
+        cooldown_alertas.liberar_al_confirmar(nino.id, 'SALIDA_AREA')
+        alerta.transmitir()
+
+        # Enviar notificaciones a tutores
+        alerta.enviar_notificaciones()
+
+        return alerta
+    
+    def transmitir(self):
+        """
+        Envía la alerta a los tutores conectados por WebSocket (grupo
+        tracking_nino_{id}) cuando la transacción actual confirma
+        """
+        transaction.on_commit(self._transmitir)
+    
+    def _transmitir(self):
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from apps.gis_tracking import protocolo
+        from apps.gis_tracking.consumers import grupo_nino
+        
+        capa = get_channel_layer()
+        if capa is None:
+            return
+        try:
+            async_to_sync(capa.group_send)(grupo_nino(self.nino_id), protocolo.evento_alerta(
+                self.nino_id, self.nino.nombre_completo(), self.mensaje, self.fecha_creacion
+            ))
+        except Exception:
+            # Sin capa de canales la alerta igual llega por push
+            logger.exception(f'❌ No se pudo transmitir la alerta {self.pk} por WebSocket')
+    
     def enviar_notificaciones(self):
         """
-        Envía notificaciones push tipificadas a todos los tutores
-        Usa el nuevo sistema de NotificationService mejorado
+        Programa el envío de notificaciones a los tutores
+
+        El envío se hace en Celery (tarea enviar_notificaciones_alerta)
+        cuando la transacción actual confirma, fuera del request que
+        registró la posición. Con ALERTAS_ENVIO_ASINCRONO=False, o si el
+        broker no está disponible, se envía en el mismo proceso, sin
+        reintentos (ver entregar_sin_reintentos), también tras el commit:
+        fuera de la transacción y del bloqueo de geocerca del llamador.
+        """
+        from django.conf import settings
+        from django.db import transaction
+
+        alerta_id = self.pk
+
+        def entregar():
+            try:
+                Alerta.objects.get(pk=alerta_id).entregar_sin_reintentos()
+            except Exception:
+                # La posición ya se guardó: un fallo aquí no debe llegar al request
+                logger.exception(f'❌ Error en el envío síncrono de la alerta {alerta_id}')
+
+        def programar():
+            from .tasks import enviar_notificaciones_alerta
+            try:
+                enviar_notificaciones_alerta.delay(alerta_id)
+            except Exception as e:
+                logger.warning(f'⚠️ Broker no disponible, envío síncrono de la alerta {alerta_id}: {e}')
+                entregar()
+
+        transaction.on_commit(programar if settings.ALERTAS_ENVIO_ASINCRONO else entregar)
+
+    def entregar_sin_reintentos(self):
+        """
+        Envío en el mismo proceso (sin Celery): un error transitorio de FCM
+        se registra y la alerta queda PENDIENTE, sin propagar la excepción
+        (que solo sirve para el autoretry de la tarea) a quien registró la
+        posición ni deshacer su transacción.
         """
+        from .notifications import EnvioTransitorioError
+
+        try:
+            return self.entregar_notificaciones()
+        except EnvioTransitorioError as e:
+            logger.warning(f'⚠️ Alerta {self.pk} queda PENDIENTE: {e}')
+            return None
+
+    def _contenido_notificacion(self):
+        """Tipo, texto y datos de la notificación push según el tipo de alerta"""
         from .notifications import NotificationService, TipoAlerta
-        
-        # Obtener todos los tutores (principal + adicionales)
-        tutores = [self.nino.tutor_principal]
-        if hasattr(self.nino, 'tutores_adicionales'):
-            tutores.extend(self.nino.tutores_adicionales.all())
-        
-        # Enviar notificación tipificada según el tipo de alerta
-        for tutor in tutores:
-            if not tutor.fcm_token:
-                continue  # Saltar si no tiene token FCM
-            
-            enviada = False
-            
-            # Seleccionar método según tipo de alerta
-            if self.tipo_alerta == 'SALIDA_AREA' and self.posicion_gps:
-                enviada = NotificationService.notificar_salida_area(
-                    fcm_token=tutor.fcm_token,
-                    nino_nombre=self.nino.nombre_completo(),
-                    kinder_nombre=self.nino.centro_educativo.nombre,
-                    distancia_metros=getattr(self.posicion_gps, 'distancia_centro', 0) or 0,
-                    ubicacion_actual=f"{self.posicion_gps.ubicacion.y}, {self.posicion_gps.ubicacion.x}"
-                )
-            
-            elif self.tipo_alerta == 'BATERIA_BAJA':
-                nivel_bateria = int(self.mensaje.split('%')[0].split()[-1]) if '%' in self.mensaje else 20
-                enviada = NotificationService.notificar_bateria_baja(
-                    fcm_token=tutor.fcm_token,
-                    nino_nombre=self.nino.nombre_completo(),
-                    nivel_bateria=nivel_bateria
-                )
-            
-            else:
-                # Notificación genérica para otros tipos
-                enviada = NotificationService.enviar_notificacion(
-                    fcm_token=tutor.fcm_token,
-                    tipo=TipoAlerta.SALIDA_AREA,  # Default
-                    nino_nombre=self.nino.nombre_completo(),
-                    mensaje_extra=self.mensaje[:100]
-                )
-            
-            # Registrar notificación
-            NotificacionTutor.objects.create(
+
+        nino_nombre = self.nino.nombre_completo()
+        if self.tipo_alerta == 'SALIDA_AREA' and self.posicion_gps:
+            return NotificationService.contenido_salida_area(
+                nino_nombre=nino_nombre,
+                kinder_nombre=self.nino.centro_educativo.nombre,
+                distancia_metros=self.posicion_gps.distancia_al_centro() or 0,
+                ubicacion_actual=f"{self.posicion_gps.ubicacion.y}, {self.posicion_gps.ubicacion.x}"
+            )
+        if self.tipo_alerta == 'REGRESO_AREA':
+            return NotificationService.contenido_regreso_area(
+                nino_nombre, self.nino.centro_educativo.nombre
+            )
+        if self.tipo_alerta == 'BATERIA_BAJA':
+            nivel_bateria = int(self.mensaje.split('%')[0].split()[-1]) if '%' in self.mensaje else 20
+            return NotificationService.contenido_bateria_baja(nino_nombre, nivel_bateria)
+        # Notificación genérica para otros tipos
+        return {
+            'tipo': TipoAlerta.SALIDA_AREA,  # Default
+            'nino_nombre': nino_nombre,
+            'mensaje_extra': self.mensaje[:100],
+            'data': None,
+        }
+
+    def entregar_notificaciones(self):
+        """
+        Envía la notificación push a todos los tutores en un solo lote FCM
+
+        Es idempotente: los tutores que ya recibieron la notificación con
+        éxito no se vuelven a notificar, así la tarea puede reintentarse.
+
+        Returns:
+            dict: {'exitosos', 'fallidos', 'reintentables'}
+
+        Raises:
+            EnvioTransitorioError: si algún envío falló por un error
+                transitorio de FCM (la tarea lo reintenta con backoff; la
+                alerta sigue PENDIENTE)
+        """
+        from .notifications import NotificationService, EnvioTransitorioError
+
+        ya_notificados = set(
+            self.notificaciontutor_set.filter(enviada_exitosamente=True)
+            .values_list('tutor_id', flat=True)
+        )
+        # Tokens vivos de todos los tutores (principal + adicionales) en una consulta
+        destinatarios = {
+            token: tutor_id
+            for token, tutor_id in DeviceToken.tokens_de_nino(self.nino_id)
+            if tutor_id not in ya_notificados
+        }
+
+        resultado = NotificationService.enviar_notificacion_multiple(
+            list(destinatarios), **self._contenido_notificacion()
+        )
+
+        # Un tutor con varios dispositivos cuenta como notificado si al
+        # menos uno recibió el mensaje
+        por_tutor = {}
+        for envio in resultado['resultados']:
+            por_tutor.setdefault(destinatarios[envio['token']], []).append(envio)
+
+        # Registrar notificación (una fila por tutor, actualizada en cada intento)
+        reintentables = 0
+        for tutor_id, envios in por_tutor.items():
+            exitoso = next((envio for envio in envios if envio['exito']), None)
+            if exitoso is None:
+                reintentables += any(envio['reintentable'] for envio in envios)
+            NotificacionTutor.objects.update_or_create(
                 alerta=self,
-                tutor=tutor,
-                enviada_exitosamente=enviada
+                tutor_id=tutor_id,
+                defaults={
+                    'enviada_exitosamente': exitoso is not None,
+                    # TransporteNulo no devuelve mensaje_id (None)
+                    'mensaje_id': (exitoso['mensaje_id'] or '') if exitoso else '',
+                    'error_mensaje': '' if exitoso else '; '.join(
+                        envio['error'] or '' for envio in envios
+                    ),
+                }
             )
-        
-        self.estado = 'ENVIADA'
-        self.fecha_enviada = timezone.now()
-        self.save()
+
+        if reintentables:
+            # Sigue PENDIENTE hasta que los reintentos lleguen a todos
+            raise EnvioTransitorioError(
+                f'{reintentables} tutor(es) de la alerta {self.pk} con error transitorio'
+            )
+
+        if self.estado == 'PENDIENTE':
+            self.estado = 'ENVIADA'
+            self.fecha_enviada = timezone.now()
+            self.save(update_fields=['estado', 'fecha_enviada'])
+        return {
+            'exitosos': resultado['exitosos'],
+            'fallidos': resultado['fallidos'],
+            'reintentables': reintentables,
+        }
     
     def marcar_como_leida(self):
         """Marca la alerta como leída"""
         self.estado = 'LEIDA'
         self.fecha_leida = timezone.now()
         self.save()
+        self._liberar_cooldown()
     
     def resolver(self):
         """Marca la alerta como resuelta"""
         self.estado = 'RESUELTA'
         self.fecha_resuelta = timezone.now()
         self.save()
+        self._liberar_cooldown()
+    
+    def _liberar_cooldown(self):
+        # Una alerta atendida ya no bloquea la siguiente (como antes: el
+        # cooldown solo contaba alertas PENDIENTE/ENVIADA)
+        from .cooldown import cooldown_alertas
+        cooldown_alertas.liberar_al_confirmar(self.nino_id, self.tipo_alerta)
 
 
 class NotificacionTutor(models.Model):
@@ -228,3 +420,148 @@ class NotificacionTutor(models.Model):
     
     def __str__(self):
         return f"{self.alerta.tipo_alerta} -> {self.tutor.usuario.get_full_name()}"
+
+
+class DeviceToken(models.Model):
+    """
+    Token FCM de un dispositivo (un usuario puede tener varios)
+
+    Lleva la salud del token: los envíos exitosos actualizan
+    ultimo_exito; los fallidos suman fallos. Un token que FCM reporta como
+    no registrado, o que acumula PUSH_TOKEN_MAX_FALLOS fallos seguidos,
+    se desactiva; podar() elimina los desactivados y los que llevan
+    PUSH_TOKEN_DIAS_SIN_EXITO días sin un envío exitoso.
+    """
+    PLATAFORMAS = [
+        ('ANDROID', 'Android'),
+        ('IOS', 'iOS'),
+        ('WEB', 'Web'),
+    ]
+
+    usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.CASCADE,
+        related_name='device_tokens'
+    )
+    token = models.CharField(max_length=255, unique=True)
+    plataforma = models.CharField(max_length=10, choices=PLATAFORMAS, blank=True)
+    dispositivo = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text='Identificador del dispositivo (reemplaza su token anterior)'
+    )
+    activo = models.BooleanField(default=True)
+
+    fecha_registro = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    ultimo_exito = models.DateTimeField(null=True, blank=True)
+    fallos_consecutivos = models.PositiveIntegerField(default=0)
+    total_fallos = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Token de Dispositivo'
+        verbose_name_plural = 'Tokens de Dispositivos'
+        indexes = [
+            models.Index(
+                fields=['usuario'],
+                name='device_token_activo_idx',
+                condition=Q(activo=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario.username} - {self.plataforma or 'dispositivo'} ({self.token[:12]}...)"
+
+    @classmethod
+    def registrar(cls, usuario, token, plataforma='', dispositivo=''):
+        """
+        Registra (o reactiva) el token de un dispositivo del usuario
+
+        Si el token ya existía (de este u otro usuario) pasa a este
+        usuario con los contadores en cero. Con `dispositivo`, el token
+        anterior del mismo dispositivo se desactiva.
+        """
+        device_token, _ = cls.objects.update_or_create(
+            token=token,
+            defaults={
+                'usuario': usuario,
+                'plataforma': plataforma,
+                'dispositivo': dispositivo,
+                'activo': True,
+                'fallos_consecutivos': 0,
+            }
+        )
+        if dispositivo:
+            cls.objects.filter(
+                usuario=usuario, dispositivo=dispositivo, activo=True
+            ).exclude(pk=device_token.pk).update(activo=False)
+        return device_token
+
+    @classmethod
+    def tokens_de_nino(cls, nino_id):
+        """
+        Tokens activos de los tutores (principal y adicionales) de un niño
+        con notificaciones activas, en una sola consulta
+
+        Returns:
+            list: [(token, tutor_id), ...]
+        """
+        return list(
+            cls.objects.filter(activo=True, usuario__notificaciones_activas=True)
+            .filter(
+                Q(usuario__tutor_profile__ninos_principal=nino_id)
+                | Q(usuario__tutor_profile__ninos_adicional=nino_id)
+            )
+            .values_list('token', 'usuario__tutor_profile')
+            .distinct()
+        )
+
+    @classmethod
+    def registrar_resultados(cls, exitosos=(), fallidos=(), invalidos=()):
+        """
+        Actualiza en bloque la salud de los tokens después de un envío
+        (como máximo una consulta por grupo)
+        """
+        if exitosos:
+            cls.objects.filter(token__in=exitosos).update(
+                ultimo_exito=timezone.now(), fallos_consecutivos=0
+            )
+        if fallidos:
+            cls.objects.filter(token__in=fallidos).update(
+                fallos_consecutivos=F('fallos_consecutivos') + 1,
+                total_fallos=F('total_fallos') + 1,
+                activo=Case(
+                    When(
+                        fallos_consecutivos__gte=settings.PUSH_TOKEN_MAX_FALLOS - 1,
+                        then=Value(False)
+                    ),
+                    default=F('activo'),
+                ),
+            )
+        if invalidos:
+            cls.objects.filter(token__in=invalidos).update(
+                activo=False,
+                fallos_consecutivos=F('fallos_consecutivos') + 1,
+                total_fallos=F('total_fallos') + 1,
+            )
+
+    @classmethod
+    def podar(cls, dias_sin_exito=None):
+        """
+        Elimina los tokens desactivados y los que no tienen un envío
+        exitoso en `dias_sin_exito` días
+
+        Returns:
+            int: Tokens eliminados
+        """
+        if dias_sin_exito is None:
+            dias_sin_exito = settings.PUSH_TOKEN_DIAS_SIN_EXITO
+        limite = timezone.now() - timedelta(days=dias_sin_exito)
+        eliminados, _ = cls.objects.filter(
+            Q(activo=False)
+            | Q(ultimo_exito__lt=limite)
+            | Q(ultimo_exito__isnull=True, fecha_registro__lt=limite)
+        ).delete()
+        if eliminados:
+            logger.info(f'🧹 {eliminados} token(s) de dispositivo eliminados')
+        return eliminados
@@ -4,9 +4,12 @@ Sistema de Notificaciones Tipificadas para Monitor Infantil SIG
 Inspirado en las mejores prácticas del clon de Uber/InDriver
 """
 
-from firebase_admin import messaging
 from typing import Optional, Dict, Any
 import logging
+import time
+
+# firebase_admin se importa solo en TransporteFCM (apps/alerts/transportes.py)
+# al primer envío: cargar este módulo no arrastra el SDK ni google-auth
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +26,10 @@ class TipoAlerta:
     SALIDA_KINDER = 'SALIDA_KINDER'
 
 
+class EnvioTransitorioError(Exception):
+    """Envío fallido por un error transitorio de FCM (se puede reintentar)"""
+
+
 class NotificationService:
     """
     Servicio de notificaciones mejorado con tipificación
@@ -101,6 +108,61 @@ class NotificationService:
         },
     }
     
+    # Errores de FCM que conviene reintentar (el resto son definitivos,
+    # p. ej. token inválido o mensaje mal formado)
+    ERRORES_REINTENTABLES = ('UNAVAILABLE', 'INTERNAL', 'RESOURCE_EXHAUSTED', 'UNKNOWN')
+    
+    # Límite de tokens por MulticastMessage que acepta FCM
+    MAX_TOKENS_MULTICAST = 500
+    
+    @classmethod
+    def _construir_mensaje(
+        cls,
+        fcm_tokens: list[str],
+        tipo: str,
+        nino_nombre: str,
+        mensaje_extra: str = '',
+        data: Optional[Dict[str, Any]] = None,
+        imagen_url: Optional[str] = None
+    ) -> 'MensajePush':
+        """
+        Arma el mensaje tipificado para varios tokens, independiente del
+        SDK (el transporte lo convierte a su formato, p. ej. MulticastMessage)
+        """
+        from .transportes import MensajePush
+        
+        # Obtener configuración del tipo de alerta
+        config = cls.CONFIGURACIONES.get(
+            tipo,
+            cls.CONFIGURACIONES[TipoAlerta.SALIDA_AREA]  # Default
+        )
+        
+        # Construir mensaje completo
+        if mensaje_extra:
+            mensaje_completo = f"{nino_nombre} - {mensaje_extra}"
+        else:
+            mensaje_completo = nino_nombre
+        
+        # Preparar datos adicionales
+        notification_data = dict(data or {})
+        notification_data.update({
+            'tipo_alerta': tipo,
+            'nino': nino_nombre,
+            'timestamp': str(time.time()),
+            'click_action': 'FLUTTER_NOTIFICATION_CLICK',
+        })
+        
+        return MensajePush(
+            tokens=fcm_tokens,
+            tipo=tipo,
+            titulo=config['titulo'],
+            cuerpo=mensaje_completo,
+            data=notification_data,
+            config=config,
+            grupo=f"nino_{nino_nombre}",  # Agrupa por niño (iOS)
+            imagen_url=imagen_url,
+        )
+    
     @classmethod
     def enviar_notificacion(
         cls,
@@ -125,98 +187,10 @@ class NotificationService:
         Returns:
             bool: True si se envió correctamente
         """
-        try:
-            # Obtener configuración del tipo de alerta
-            config = cls.CONFIGURACIONES.get(
-                tipo,
-                cls.CONFIGURACIONES[TipoAlerta.SALIDA_AREA]  # Default
-            )
-            
-            # Construir mensaje completo
-            if mensaje_extra:
-                mensaje_completo = f"{nino_nombre} - {mensaje_extra}"
-            else:
-                mensaje_completo = nino_nombre
-            
-            # Preparar datos adicionales
-            notification_data = data or {}
-            notification_data.update({
-                'tipo_alerta': tipo,
-                'nino': nino_nombre,
-                'timestamp': str(messaging.time.time()),
-                'click_action': 'FLUTTER_NOTIFICATION_CLICK',
-            })
-            
-            # Construir notificación base
-            notification = messaging.Notification(
-                title=config['titulo'],
-                body=mensaje_completo,
-                image=imagen_url,
-            )
-            
-            # Configuración específica de Android
-            android_config = messaging.AndroidConfig(
-                priority=config['prioridad'],
-                notification=messaging.AndroidNotification(
-                    icon=config['icono'],
-                    sound=f"{config['sonido']}.mp3",
-                    channel_id=config['channel_id'],
-                    color=config['color'],
-                    tag=tipo,  # Agrupa notificaciones del mismo tipo
-                    vibrate_timings_millis=config['vibration'],
-                    notification_priority=messaging.Priority.HIGH 
-                        if config['prioridad'] == 'high' 
-                        else messaging.Priority.DEFAULT,
-                ),
-                ttl=3600,  # Time to live: 1 hora
-            )
-            
-            # Configuración específica de iOS (APNS)
-            apns_config = messaging.APNSConfig(
-                headers={
-                    'apns-priority': '10' if config['prioridad'] == 'high' else '5',
-                },
-                payload=messaging.APNSPayload(
-                    aps=messaging.Aps(
-                        alert=messaging.ApsAlert(
-                            title=config['titulo'],
-                            body=mensaje_completo,
-                        ),
-                        badge=1,
-                        sound=f"{config['sonido']}.aiff",
-                        category=tipo,
-                        thread_id=f"nino_{nino_nombre}",  # Agrupa por niño
-                    ),
-                ),
-            )
-            
-            # Crear mensaje completo
-            message = messaging.Message(
-                notification=notification,
-                data=notification_data,
-                android=android_config,
-                apns=apns_config,
-                token=fcm_token,
-            )
-            
-            # Enviar notificación
-            response = messaging.send(message)
-            logger.info(
-                f'✅ Notificación enviada exitosamente: {tipo} → {nino_nombre}'
-                f' | Response: {response}'
-            )
-            return True
-            
-        except messaging.UnregisteredError:
-            logger.error(f'❌ Token FCM no registrado o inválido: {fcm_token}')
-            return False
-            
-        except Exception as e:
-            logger.error(
-                f'❌ Error enviando notificación {tipo}: {str(e)}',
-                exc_info=True
-            )
-            return False
+        resultado = cls.enviar_notificacion_multiple(
+            [fcm_token], tipo, nino_nombre, mensaje_extra, data, imagen_url
+        )
+        return resultado['exitosos'] == 1
     
     @classmethod
     def enviar_notificacion_multiple(
@@ -225,10 +199,16 @@ class NotificationService:
         tipo: str,
         nino_nombre: str,
         mensaje_extra: str = '',
-        data: Optional[Dict[str, Any]] = None
-    ) -> Dict[str, int]:
+        data: Optional[Dict[str, Any]] = None,
+        imagen_url: Optional[str] = None,
+        transporte=None
+    ) -> Dict[str, Any]:
         """
-        Enviar notificación a múltiples dispositivos
+        Enviar notificación a múltiples dispositivos en multicast
+        (una llamada al transporte cada MAX_TOKENS_MULTICAST tokens)
+        
+        Al final se actualiza en bloque la salud de los tokens en
+        DeviceToken; los que FCM reporta como no registrados se desactivan.
         
         Args:
             fcm_tokens: Lista de tokens FCM
@@ -236,31 +216,122 @@ class NotificationService:
             nino_nombre: Nombre del niño
             mensaje_extra: Información adicional
             data: Datos extra
+            imagen_url: URL de imagen (opcional)
+            transporte: Transporte a usar (por defecto NOTIFICACIONES_TRANSPORTE)
             
         Returns:
-            dict: {'exitosos': int, 'fallidos': int}
+            dict: {'exitosos': int, 'fallidos': int, 'invalidos': int,
+            'resultados': list} con un resultado por token, en el mismo orden:
+            {'token', 'exito', 'mensaje_id', 'error', 'reintentable', 'invalido'}
         """
-        exitosos = 0
-        fallidos = 0
+        from .transportes import TOKEN_NO_REGISTRADO, obtener_transporte
         
-        for token in fcm_tokens:
-            if cls.enviar_notificacion(
-                fcm_token=token,
-                tipo=tipo,
-                nino_nombre=nino_nombre,
-                mensaje_extra=mensaje_extra,
-                data=data
-            ):
-                exitosos += 1
-            else:
-                fallidos += 1
+        if transporte is None:
+            transporte = obtener_transporte()
         
+        resultados = []
+        for inicio in range(0, len(fcm_tokens), cls.MAX_TOKENS_MULTICAST):
+            lote = fcm_tokens[inicio:inicio + cls.MAX_TOKENS_MULTICAST]
+            try:
+                mensaje = cls._construir_mensaje(
+                    lote, tipo, nino_nombre, mensaje_extra, data, imagen_url
+                )
+                envios = transporte.enviar_multicast(mensaje)
+            except Exception as e:
+                # Falla del lote completo (red, credenciales...): todo reintentable
+                logger.error(f'❌ Error enviando lote de notificaciones {tipo}: {str(e)}', exc_info=True)
+                resultados.extend(
+                    {'token': token, 'exito': False, 'mensaje_id': None,
+                     'error': str(e), 'reintentable': True, 'invalido': False}
+                    for token in lote
+                )
+                continue
+            
+            for token, envio in zip(lote, envios):
+                resultados.append({
+                    'token': token,
+                    'exito': envio.exito,
+                    'mensaje_id': envio.mensaje_id,
+                    'error': envio.error,
+                    'reintentable': envio.codigo in cls.ERRORES_REINTENTABLES,
+                    'invalido': envio.codigo == TOKEN_NO_REGISTRADO,
+                })
+        
+        invalidos = [resultado['token'] for resultado in resultados if resultado['invalido']]
+        cls.registrar_salud_tokens(resultados)
+        
+        exitosos = sum(1 for resultado in resultados if resultado['exito'])
+        fallidos = len(resultados) - exitosos
         logger.info(
-            f'📊 Notificaciones enviadas: '
-            f'{exitosos} exitosas, {fallidos} fallidas'
+            f'📊 Notificaciones enviadas ({tipo} → {nino_nombre}): '
+            f'{exitosos} exitosas, {fallidos} fallidas, {len(invalidos)} tokens inválidos'
         )
         
-        return {'exitosos': exitosos, 'fallidos': fallidos}
+        return {
+            'exitosos': exitosos,
+            'fallidos': fallidos,
+            'invalidos': len(invalidos),
+            'resultados': resultados,
+        }
+    
+    @staticmethod
+    def registrar_salud_tokens(resultados: list[Dict[str, Any]]) -> None:
+        """
+        Actualiza en bloque los contadores de DeviceToken: éxito, fallo o
+        token no registrado (que queda desactivado)
+        """
+        from .models import DeviceToken
+        
+        grupos = {'exitosos': [], 'fallidos': [], 'invalidos': []}
+        for resultado in resultados:
+            if resultado['exito']:
+                grupos['exitosos'].append(resultado['token'])
+            elif resultado['invalido']:
+                grupos['invalidos'].append(resultado['token'])
+            else:
+                grupos['fallidos'].append(resultado['token'])
+        DeviceToken.registrar_resultados(**grupos)
+        if grupos['invalidos']:
+            logger.warning(f"🗑️ {len(grupos['invalidos'])} token(s) FCM no registrados desactivados")
+    
+    @staticmethod
+    def contenido_salida_area(
+        nino_nombre: str,
+        kinder_nombre: str,
+        distancia_metros: float,
+        ubicacion_actual: str
+    ) -> Dict[str, Any]:
+        """Tipo, texto y datos de la notificación de salida del área segura"""
+        return {
+            'tipo': TipoAlerta.SALIDA_AREA,
+            'nino_nombre': nino_nombre,
+            'mensaje_extra': f"salió de {kinder_nombre} ({distancia_metros:.0f}m)",
+            'data': {
+                'kinder': kinder_nombre,
+                'distancia': str(distancia_metros),
+                'ubicacion': ubicacion_actual,
+            },
+        }
+    
+    @staticmethod
+    def contenido_bateria_baja(nino_nombre: str, nivel_bateria: int) -> Dict[str, Any]:
+        """Tipo, texto y datos de la notificación de batería baja"""
+        return {
+            'tipo': TipoAlerta.BATERIA_BAJA,
+            'nino_nombre': nino_nombre,
+            'mensaje_extra': f"batería al {nivel_bateria}%",
+            'data': {'bateria': str(nivel_bateria)},
+        }
+    
+    @staticmethod
+    def contenido_regreso_area(nino_nombre: str, kinder_nombre: str) -> Dict[str, Any]:
+        """Tipo, texto y datos de la notificación de regreso al área segura"""
+        return {
+            'tipo': TipoAlerta.REGRESO_AREA,
+            'nino_nombre': nino_nombre,
+            'mensaje_extra': f"regresó a {kinder_nombre}",
+            'data': {'kinder': kinder_nombre},
+        }
     
     @classmethod
     def notificar_salida_area(
@@ -274,14 +345,9 @@ class NotificationService:
         """Notificación específica: niño salió del área segura"""
         return cls.enviar_notificacion(
             fcm_token=fcm_token,
-            tipo=TipoAlerta.SALIDA_AREA,
-            nino_nombre=nino_nombre,
-            mensaje_extra=f"salió de {kinder_nombre} ({distancia_metros:.0f}m)",
-            data={
-                'kinder': kinder_nombre,
-                'distancia': str(distancia_metros),
-                'ubicacion': ubicacion_actual,
-            }
+            **cls.contenido_salida_area(
+                nino_nombre, kinder_nombre, distancia_metros, ubicacion_actual
+            )
         )
     
     @classmethod
@@ -310,10 +376,7 @@ class NotificationService:
         """Notificación específica: batería baja"""
         return cls.enviar_notificacion(
             fcm_token=fcm_token,
-            tipo=TipoAlerta.BATERIA_BAJA,
-            nino_nombre=nino_nombre,
-            mensaje_extra=f"batería al {nivel_bateria}%",
-            data={'bateria': str(nivel_bateria)}
+            **cls.contenido_bateria_baja(nino_nombre, nivel_bateria)
         )
     
     @classmethod
@@ -326,10 +389,7 @@ class NotificationService:
         """Notificación específica: niño regresó al área segura"""
         return cls.enviar_notificacion(
             fcm_token=fcm_token,
-            tipo=TipoAlerta.REGRESO_AREA,
-            nino_nombre=nino_nombre,
-            mensaje_extra=f"regresó a {kinder_nombre}",
-            data={'kinder': kinder_nombre}
+            **cls.contenido_regreso_area(nino_nombre, kinder_nombre)
         )
 
 
@@ -0,0 +1,37 @@
+"""
+Tareas (Celery) de envío de alertas
+"""
+from celery import shared_task
+
+from .notifications import EnvioTransitorioError
+
+
+@shared_task(
+    ignore_result=True,
+    autoretry_for=(EnvioTransitorioError,),
+    retry_backoff=2,  # 2s, 4s, 8s, ... (exponencial)
+    retry_backoff_max=300,
+    retry_jitter=True,
+    max_retries=6,
+)
+def enviar_notificaciones_alerta(alerta_id):
+    """
+    Envía en un solo lote FCM la notificación de una alerta a todos sus
+    tutores; los errores transitorios se reintentan con backoff exponencial
+    """
+    from .models import Alerta
+
+    alerta = Alerta.objects.select_related(
+        'nino__centro_educativo', 'nino__tutor_principal__usuario', 'posicion_gps'
+    ).filter(pk=alerta_id).first()
+    if alerta is None:
+        return None  # Alerta eliminada antes del envío
+    return alerta.entregar_notificaciones()
+
+
+@shared_task(ignore_result=True)
+def podar_tokens_dispositivo():
+    """Elimina los tokens FCM desactivados o sin envíos exitosos recientes"""
+    from .models import DeviceToken
+
+    return DeviceToken.podar()
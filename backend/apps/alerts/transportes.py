@@ -0,0 +1,200 @@
+"""
+Transportes de notificaciones push
+
+NotificationService arma un MensajePush por alerta (independiente del
+SDK) y lo entrega a través del transporte configurado en
+NOTIFICACIONES_TRANSPORTE:
+
+- TransporteFCM: Firebase Cloud Messaging (send_each_for_multicast)
+- TransporteLocal: fake en memoria para tests y benchmarks; registra
+  los envíos y puede simular latencia por llamada y errores por token
+- TransporteNulo: descarta los mensajes (entornos sin credenciales)
+
+firebase_admin se importa dentro de TransporteFCM, la primera vez que se
+usa: los procesos que no envían push (web, ASGI, workers de otras
+colas) no pagan el import del SDK y de google-auth al arrancar.
+
+Cada transporte devuelve un ResultadoEnvio por token, en el mismo orden.
+"""
+import logging
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Código de error para tokens que FCM ya no reconoce (app desinstalada, etc.)
+TOKEN_NO_REGISTRADO = 'UNREGISTERED'
+
+
+class MensajePush(NamedTuple):
+    """Notificación tipificada para varios tokens"""
+    tokens: List[str]
+    tipo: str
+    titulo: str
+    cuerpo: str
+    data: Dict[str, str]
+    config: Dict[str, Any]  # NotificationService.CONFIGURACIONES[tipo]
+    grupo: str
+    imagen_url: Optional[str] = None
+
+
+class ResultadoEnvio(NamedTuple):
+    """Resultado del envío a un token"""
+    exito: bool
+    mensaje_id: Optional[str] = None
+    codigo: Optional[str] = None  # Código de error de FCM si falló
+    error: Optional[str] = None
+
+
+class TransporteFCM:
+    """Envío real a Firebase Cloud Messaging"""
+
+    def __init__(self):
+        self._messaging = None
+
+    @property
+    def messaging(self):
+        """Módulo firebase_admin.messaging (importa e inicializa la app la primera vez)"""
+        if self._messaging is None:
+            import firebase_admin
+            from firebase_admin import credentials, messaging
+
+            if not firebase_admin._apps:
+                firebase_admin.initialize_app(
+                    credentials.Certificate(settings.FIREBASE_CREDENTIALS_PATH)
+                )
+            self._messaging = messaging
+        return self._messaging
+
+    def enviar_multicast(self, mensaje: MensajePush) -> List[ResultadoEnvio]:
+        respuesta = self.messaging.send_each_for_multicast(self.construir_multicast(mensaje))
+        return [self._resultado(r) for r in respuesta.responses]
+
+    def construir_multicast(self, mensaje: MensajePush):
+        """MulticastMessage tipificado (Android + iOS)"""
+        messaging = self.messaging
+        config = mensaje.config
+
+        # Construir notificación base
+        notification = messaging.Notification(
+            title=mensaje.titulo,
+            body=mensaje.cuerpo,
+            image=mensaje.imagen_url,
+        )
+
+        # Configuración específica de Android
+        android_config = messaging.AndroidConfig(
+            priority=config['prioridad'],
+            notification=messaging.AndroidNotification(
+                icon=config['icono'],
+                sound=f"{config['sonido']}.mp3",
+                channel_id=config['channel_id'],
+                color=config['color'],
+                tag=mensaje.tipo,  # Agrupa notificaciones del mismo tipo
+                vibrate_timings_millis=config['vibration'],
+                notification_priority=messaging.Priority.HIGH
+                    if config['prioridad'] == 'high'
+                    else messaging.Priority.DEFAULT,
+            ),
+            ttl=3600,  # Time to live: 1 hora
+        )
+
+        # Configuración específica de iOS (APNS)
+        apns_config = messaging.APNSConfig(
+            headers={
+                'apns-priority': '10' if config['prioridad'] == 'high' else '5',
+            },
+            payload=messaging.APNSPayload(
+                aps=messaging.Aps(
+                    alert=messaging.ApsAlert(
+                        title=mensaje.titulo,
+                        body=mensaje.cuerpo,
+                    ),
+                    badge=1,
+                    sound=f"{config['sonido']}.aiff",
+                    category=mensaje.tipo,
+                    thread_id=mensaje.grupo,
+                ),
+            ),
+        )
+
+        return messaging.MulticastMessage(
+            tokens=mensaje.tokens,
+            notification=notification,
+            data=mensaje.data,
+            android=android_config,
+            apns=apns_config,
+        )
+
+    def _resultado(self, respuesta):
+        error = respuesta.exception
+        if error is None:
+            return ResultadoEnvio(True, respuesta.message_id)
+        if isinstance(error, self.messaging.UnregisteredError):
+            codigo = TOKEN_NO_REGISTRADO
+        else:
+            codigo = getattr(error, 'code', None) or 'UNKNOWN'
+        return ResultadoEnvio(False, codigo=codigo, error=str(error))
+
+
+class TransporteLocal:
+    """
+    Transporte fake: no sale a la red
+
+    Attributes:
+        latencia_ms: Demora simulada por llamada (un round trip a FCM)
+        errores: {token: código} para simular fallos por token
+        enviados: Mensajes recibidos, en orden
+    """
+
+    def __init__(self, latencia_ms=0, errores=None):
+        self.latencia_ms = latencia_ms
+        self.errores = dict(errores or {})
+        self.enviados = []
+
+    def enviar_multicast(self, mensaje: MensajePush) -> List[ResultadoEnvio]:
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000)
+        self.enviados.append(mensaje)
+
+        resultados = []
+        for token in mensaje.tokens:
+            codigo = self.errores.get(token)
+            if codigo:
+                resultados.append(ResultadoEnvio(False, codigo=codigo, error=f'Error simulado: {codigo}'))
+            else:
+                resultados.append(ResultadoEnvio(True, f'local/{len(self.enviados)}/{token}'))
+        return resultados
+
+    def limpiar(self):
+        self.errores.clear()
+        self.enviados.clear()
+
+
+class TransporteNulo:
+    """
+    Descarta los mensajes (sin credenciales de Firebase configuradas)
+
+    Los reporta como enviados para que las alertas sigan su flujo normal.
+    """
+
+    def __init__(self):
+        logger.warning('⚠️ Notificaciones push desactivadas (TransporteNulo)')
+
+    def enviar_multicast(self, mensaje: MensajePush) -> List[ResultadoEnvio]:
+        logger.debug(f'🔕 Notificación {mensaje.tipo} descartada ({len(mensaje.tokens)} tokens)')
+        return [ResultadoEnvio(True) for _ in mensaje.tokens]
+
+
+_transportes = {}
+
+
+def obtener_transporte():
+    """Instancia (única por proceso) del transporte configurado"""
+    ruta = settings.NOTIFICACIONES_TRANSPORTE
+    if ruta not in _transportes:
+        _transportes[ruta] = import_string(ruta)()
+    return _transportes[ruta]
@@ -0,0 +1,250 @@
+"""
+Serializadores rápidos para los endpoints de lectura más usados
+
+Construyen exactamente los mismos dicts que NinoSerializer,
+PosicionGPSSerializer y AlertaSerializer, pero a partir de filas de
+.values() (una sola consulta, sin instanciar modelos ni recorrer los
+campos de DRF por cada objeto). El JSON resultante es idéntico byte a
+byte; scripts/benchmark_serializadores.py lo verifica y compara tiempos.
+
+Las conversiones con formato (fechas, geometrías) reutilizan los campos
+de DRF para no duplicar sus reglas (zona horaria, "Z", GeoJSON).
+
+Se activan por vista con SerializacionRapidaMixin.
+"""
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework_gis.fields import GeometryField
+
+from apps.gis_tracking.models import Nino, PosicionGPSQuerySet
+
+_fecha = serializers.DateField()
+_fecha_hora = serializers.DateTimeField()
+_geometria = GeometryField()
+
+
+def _representar_fecha_hora(valor):
+    return _fecha_hora.to_representation(valor) if valor is not None else None
+
+
+class SerializadorRapido:
+    """
+    Base de los serializadores rápidos
+
+    Subclases definen `campos` (columnas propias) y `anidados`
+    ({nombre: (clase, relación)}), e implementan representar(fila).
+    Con `prefijo` el mismo serializador sirve anidado en otro
+    (p. ej. 'nino__' dentro de Alerta).
+    """
+    campos = ()
+    anidados = {}
+
+    def __init__(self, prefijo='', context=None):
+        self.prefijo = prefijo
+        self.context = context or {}
+        self.k = {campo: f'{prefijo}{campo}' for campo in self.campos}
+        for nombre, (clase, relacion) in self.anidados.items():
+            setattr(self, nombre, clase(f'{prefijo}{relacion}__', self.context))
+
+    def columnas(self):
+        columnas = list(self.k.values())
+        for nombre in self.anidados:
+            columnas += getattr(self, nombre).columnas()
+        return columnas
+
+    def anotaciones(self):
+        anotaciones = {}
+        for nombre in self.anidados:
+            anotaciones.update(getattr(self, nombre).anotaciones())
+        return anotaciones
+
+    def valores(self, queryset):
+        """Queryset de .values() con todas las columnas necesarias"""
+        anotaciones = {
+            alias: expresion for alias, expresion in self.anotaciones().items()
+            if alias not in queryset.query.annotations
+        }
+        return queryset.prefetch_related(None).annotate(**anotaciones).values(*self.columnas())
+
+    def representar(self, fila):
+        raise NotImplementedError
+
+    def representar_lista(self, filas):
+        return [self.representar(fila) for fila in filas]
+
+
+class UsuarioRapido(SerializadorRapido):
+    """Equivalente a UsuarioSerializer"""
+    campos = ('id', 'username', 'email', 'first_name', 'last_name',
+              'tipo_usuario', 'telefono', 'notificaciones_activas')
+
+    def representar(self, fila):
+        return {campo: fila[clave] for campo, clave in self.k.items()}
+
+
+class TutorRapido(SerializadorRapido):
+    """Equivalente a TutorSerializer"""
+    campos = ('id', 'relacion', 'ci', 'telefono_emergencia', 'activo')
+    anidados = {'usuario': (UsuarioRapido, 'usuario')}
+
+    def representar(self, fila):
+        k = self.k
+        return {
+            'id': fila[k['id']],
+            'usuario': self.usuario.representar(fila),
+            'relacion': fila[k['relacion']],
+            'ci': fila[k['ci']],
+            'telefono_emergencia': fila[k['telefono_emergencia']],
+            'activo': fila[k['activo']],
+        }
+
+
+class CentroEducativoSimpleRapido(SerializadorRapido):
+    """Equivalente a CentroEducativoSimpleSerializer"""
+    campos = ('id', 'nombre', 'codigo', 'direccion', 'telefono', 'activo')
+
+    def representar(self, fila):
+        return {campo: fila[clave] for campo, clave in self.k.items()}
+
+
+class NinoRapido(SerializadorRapido):
+    """Equivalente a NinoSerializer"""
+    campos = ('id', 'nombre', 'apellido_paterno', 'apellido_materno',
+              'fecha_nacimiento', 'sexo', 'foto', 'dispositivo_id',
+              'tracking_activo', 'activo')
+    anidados = {
+        'centro_educativo': (CentroEducativoSimpleRapido, 'centro_educativo'),
+        'tutor_principal': (TutorRapido, 'tutor_principal'),
+    }
+
+    def representar(self, fila):
+        k = self.k
+        fecha_nacimiento = fila[k['fecha_nacimiento']]
+        return {
+            'id': fila[k['id']],
+            'nombre': fila[k['nombre']],
+            'apellido_paterno': fila[k['apellido_paterno']],
+            'apellido_materno': fila[k['apellido_materno']],
+            'nombre_completo': Nino.formatear_nombre_completo(
+                fila[k['nombre']], fila[k['apellido_paterno']], fila[k['apellido_materno']]
+            ),
+            'fecha_nacimiento': _fecha.to_representation(fecha_nacimiento),
+            'edad': Nino.calcular_edad(fecha_nacimiento),
+            'sexo': fila[k['sexo']],
+            'foto': self._url_foto(fila[k['foto']]),
+            'centro_educativo': self.centro_educativo.representar(fila),
+            'tutor_principal': self.tutor_principal.representar(fila),
+            'dispositivo_id': fila[k['dispositivo_id']],
+            'tracking_activo': fila[k['tracking_activo']],
+            'activo': fila[k['activo']],
+        }
+
+    def _url_foto(self, nombre):
+        # Mismo criterio que serializers.ImageField (URL absoluta si hay request)
+        if not nombre:
+            return None
+        url = Nino._meta.get_field('foto').storage.url(nombre)
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class PosicionGPSRapido(SerializadorRapido):
+    """Equivalente a PosicionGPSSerializer (Feature GeoJSON)"""
+    campos = ('id', 'ubicacion', 'nino', 'timestamp', 'dentro_area_segura',
+              'precision_metros', 'altitud', 'velocidad_kmh', 'nivel_bateria',
+              'nino__nombre', 'nino__apellido_paterno', 'nino__apellido_materno')
+
+    def __init__(self, prefijo='', context=None):
+        super().__init__(prefijo, context)
+        # Sin '__' en el alias: Django no lo admite en anotaciones
+        self.alias_distancia = f"{prefijo.replace('__', '_')}distancia_centro_metros"
+        self.k['distancia_centro'] = self.alias_distancia
+
+    def anotaciones(self):
+        return {
+            self.alias_distancia: PosicionGPSQuerySet.expresion_distancia_centro(self.prefijo)
+        }
+
+    def representar(self, fila):
+        k = self.k
+        return {
+            'id': fila[k['id']],
+            'type': 'Feature',
+            'geometry': _geometria.to_representation(fila[k['ubicacion']]),
+            'properties': {
+                'nino': fila[k['nino']],
+                'nino_nombre': Nino.formatear_nombre_completo(
+                    fila[k['nino__nombre']],
+                    fila[k['nino__apellido_paterno']],
+                    fila[k['nino__apellido_materno']],
+                ),
+                'timestamp': _representar_fecha_hora(fila[k['timestamp']]),
+                'dentro_area_segura': fila[k['dentro_area_segura']],
+                'precision_metros': fila[k['precision_metros']],
+                'altitud': fila[k['altitud']],
+                'velocidad_kmh': fila[k['velocidad_kmh']],
+                'nivel_bateria': fila[k['nivel_bateria']],
+                'distancia_centro': fila[k['distancia_centro']],
+            },
+        }
+
+    def representar_lista(self, filas):
+        return {
+            'type': 'FeatureCollection',
+            'features': [self.representar(fila) for fila in filas],
+        }
+
+
+class AlertaRapido(SerializadorRapido):
+    """Equivalente a AlertaSerializer"""
+    campos = ('id', 'tipo_alerta', 'estado', 'fecha_creacion', 'fecha_enviada',
+              'fecha_leida', 'fecha_resuelta', 'mensaje')
+    anidados = {
+        'nino': (NinoRapido, 'nino'),
+        'posicion': (PosicionGPSRapido, 'posicion_gps'),
+    }
+
+    def representar(self, fila):
+        k = self.k
+        # posicion_gps_id puede apuntar a una posición ya eliminada
+        # (sin FK en la BD): se comprueba el id obtenido por el JOIN
+        posicion_gps = None
+        if fila[self.posicion.k['id']] is not None:
+            posicion_gps = self.posicion.representar(fila)
+        return {
+            'id': fila[k['id']],
+            'nino': self.nino.representar(fila),
+            'tipo_alerta': fila[k['tipo_alerta']],
+            'estado': fila[k['estado']],
+            'posicion_gps': posicion_gps,
+            'fecha_creacion': _representar_fecha_hora(fila[k['fecha_creacion']]),
+            'fecha_enviada': _representar_fecha_hora(fila[k['fecha_enviada']]),
+            'fecha_leida': _representar_fecha_hora(fila[k['fecha_leida']]),
+            'fecha_resuelta': _representar_fecha_hora(fila[k['fecha_resuelta']]),
+            'mensaje': fila[k['mensaje']],
+        }
+
+
+class SerializacionRapidaMixin:
+    """
+    Usa `serializador_rapido` en list() en lugar de serializer_class
+
+    Respeta filtros y paginación de la vista. Se desactiva globalmente
+    con API_SERIALIZACION_RAPIDA=False (vuelve a los serializers de DRF).
+    """
+    serializador_rapido = None
+
+    def list(self, request, *args, **kwargs):
+        if self.serializador_rapido is None or not settings.API_SERIALIZACION_RAPIDA:
+            return super().list(request, *args, **kwargs)
+
+        serializador = self.serializador_rapido(context=self.get_serializer_context())
+        filas = serializador.valores(self.filter_queryset(self.get_queryset()))
+
+        pagina = self.paginate_queryset(filas)
+        if pagina is not None:
+            return self.get_paginated_response(serializador.representar_lista(pagina))
+        return Response(serializador.representar_lista(filas))
@@ -1,9 +1,10 @@
 """
 Serializers para la API REST
 """
+from django.conf import settings
 from rest_framework import serializers
 from rest_framework_gis.serializers import GeoFeatureModelSerializer
-from apps.gis_tracking.models import CentroEducativo, Nino, PosicionGPS
+from apps.gis_tracking.models import CentroEducativo, Nino, PosicionGPS, ResumenPosicion
 from apps.alerts.models import Alerta, NotificacionTutor
 from apps.core.models import Tutor, Usuario
 
@@ -46,7 +47,7 @@ class NinoSerializer(serializers.ModelSerializer):
     centro_educativo = CentroEducativoSimpleSerializer(read_only=True)
     tutor_principal = TutorSerializer(read_only=True)
     edad = serializers.IntegerField(read_only=True)
-    nombre_completo = serializers.CharField(source='nombre_completo', read_only=True)
+    nombre_completo = serializers.CharField(read_only=True)
     
     class Meta:
         model = Nino
@@ -97,9 +98,20 @@ class PosicionGPSSerializer(GeoFeatureModelSerializer):
         return obj.distancia_al_centro()
 
 
-class RegistrarPosicionSerializer(serializers.Serializer):
-    """Serializer para registrar una nueva posición GPS desde móvil"""
-    nino_id = serializers.IntegerField()
+class ResumenPosicionSerializer(GeoFeatureModelSerializer):
+    """Serializer geoespacial para los resúmenes de posiciones antiguas"""
+    dentro_area_segura = serializers.BooleanField(read_only=True)
+    
+    class Meta:
+        model = ResumenPosicion
+        geo_field = 'centroide'
+        fields = ['id', 'nino', 'resolucion_segundos', 'inicio', 'primera_posicion',
+                 'ultima_posicion', 'total_posiciones', 'proporcion_dentro',
+                 'dentro_area_segura', 'velocidad_max_kmh', 'bateria_min']
+
+
+class PosicionEntradaSerializer(serializers.Serializer):
+    """Campos de una posición GPS enviada por el dispositivo"""
     latitud = serializers.FloatField(min_value=-90, max_value=90)
     longitud = serializers.FloatField(min_value=-180, max_value=180)
     precision_metros = serializers.FloatField(required=False, allow_null=True)
@@ -113,6 +125,29 @@ class RegistrarPosicionSerializer(serializers.Serializer):
     )
 
 
+class RegistrarPosicionSerializer(PosicionEntradaSerializer):
+    """Serializer para registrar una nueva posición GPS desde móvil"""
+    nino_id = serializers.IntegerField()
+
+
+class PosicionLoteItemSerializer(PosicionEntradaSerializer):
+    """Posición dentro de un lote (puede traer la hora real de captura)"""
+    timestamp = serializers.DateTimeField(required=False)
+
+
+class RegistrarPosicionesLoteSerializer(serializers.Serializer):
+    """Serializer para registrar varias posiciones GPS en una sola petición"""
+    posiciones = PosicionLoteItemSerializer(many=True, allow_empty=False)
+    
+    def validate_posiciones(self, value):
+        maximo = settings.GPS_BATCH_MAX_POSICIONES
+        if len(value) > maximo:
+            raise serializers.ValidationError(
+                f'Máximo {maximo} posiciones por lote'
+            )
+        return value
+
+
 class AlertaSerializer(serializers.ModelSerializer):
     nino = NinoSerializer(read_only=True)
     posicion_gps = PosicionGPSSerializer(read_only=True)
@@ -145,3 +180,7 @@ class EstadoNinoSerializer(serializers.Serializer):
 class ActualizarFirebaseTokenSerializer(serializers.Serializer):
     """Serializer para actualizar el token FCM del usuario"""
     firebase_token = serializers.CharField(max_length=255)
+    plataforma = serializers.ChoiceField(
+        choices=['ANDROID', 'IOS', 'WEB'], required=False, default=''
+    )
+    dispositivo = serializers.CharField(max_length=100, required=False, default='')
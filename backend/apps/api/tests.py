@@ -1,21 +1,21 @@
 """
 Tests para la API
 """
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.contrib.gis.geos import Point, Polygon
 from rest_framework.test import APIClient
 from rest_framework import status
 
 from apps.core.models import Usuario, Tutor
-from apps.gis_tracking.models import CentroEducativo, Nino, PosicionGPS
+from apps.gis_tracking.models import CentroEducativo, Nino, PosicionGPS, UltimaPosicion
 from apps.alerts.models import Alerta
 
 User = get_user_model()
 
 
-class TrackingAPITestCase(TestCase):
-    """Tests para el tracking GPS"""
+class DatosTrackingMixin:
+    """Tutor, kinder y niño comunes a los tests de tracking"""
     
     def setUp(self):
         """Configuración inicial para los tests"""
@@ -67,6 +67,12 @@ class TrackingAPITestCase(TestCase):
         
         # Autenticar cliente
         self.client.force_authenticate(user=self.usuario)
+
+
+# Las alertas se transmiten por la capa de canales al confirmar (sin Redis en los tests)
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class TrackingAPITestCase(DatosTrackingMixin, TestCase):
+    """Tests para el tracking GPS"""
     
     def test_registrar_posicion_dentro_area(self):
         """Test: Registrar posición dentro del área segura"""
@@ -136,6 +142,39 @@ class TrackingAPITestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['features']), 5)
     
+    def test_historial_paginado_y_streaming(self):
+        """Test: Historial paginado por cursor y en streaming NDJSON"""
+        import json
+        
+        for i in range(5):
+            PosicionGPS.objects.create(
+                nino=self.nino,
+                ubicacion=Point(-63.1815 + i*0.0001, -17.7835, srid=4326)
+            )
+        
+        url = f'/api/ninos/{self.nino.id}/historial/'
+        ids = []
+        cursor = None
+        while True:
+            params = {'limite': 2, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [feature['id'] for feature in response.data['features']]
+            cursor = response.data['siguiente_cursor']
+            if cursor is None:
+                break
+        
+        esperados = list(
+            PosicionGPS.objects.order_by('-timestamp', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(ids, esperados)
+        
+        response = self.client.get(url, {'formato': 'ndjson'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lineas = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(linea)['id'] for linea in lineas], esperados)
+    
     def test_mis_alertas(self):
         """Test: Tutor puede ver sus alertas"""
         # Crear alerta
@@ -159,3 +198,1320 @@ class TrackingAPITestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]['id'], alerta.id)
+    
+    def test_registrar_posiciones_lote(self):
+        """Test: Lote de posiciones - una sola alerta por salida del área"""
+        url = f'/api/ninos/{self.nino.id}/posiciones/batch/'
+        data = {
+            'posiciones': [
+                # Enviadas desordenadas: el servidor las ordena por timestamp
+                {'latitud': -17.7900, 'longitud': -63.1900,
+                 'timestamp': '2024-05-10T08:01:00-04:00'},
+                {'latitud': -17.7835, 'longitud': -63.1815,
+                 'timestamp': '2024-05-10T08:00:00-04:00'},
+                {'latitud': -17.7901, 'longitud': -63.1901,
+                 'timestamp': '2024-05-10T08:01:30-04:00', 'nivel_bateria': 70},
+            ]
+        }
+        
+        response = self.client.post(url, data, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['registradas'], 3)
+        self.assertEqual(response.data['fuera_area'], 2)
+        self.assertEqual(response.data['ultima_posicion']['nivel_bateria'], 70)
+        self.assertEqual(PosicionGPS.objects.filter(nino=self.nino).count(), 3)
+        
+        # Solo la transición dentro -> fuera genera alerta
+        self.assertEqual(len(response.data['alertas_generadas']), 1)
+        self.assertEqual(Alerta.objects.filter(tipo_alerta='SALIDA_AREA').count(), 1)
+    
+    def test_registrar_posiciones_lote_vacio(self):
+        """Test: Un lote vacío es rechazado"""
+        url = f'/api/ninos/{self.nino.id}/posiciones/batch/'
+        response = self.client.post(url, {'posiciones': []}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(PosicionGPS.objects.count(), 0)
+    
+    def test_ultima_posicion_no_retrocede_con_lote_atrasado(self):
+        """Test: Un lote con posiciones antiguas no pisa la última posición"""
+        PosicionGPS.objects.create(
+            nino=self.nino,
+            ubicacion=Point(-63.1815, -17.7835, srid=4326),
+            nivel_bateria=90
+        )
+        
+        url = f'/api/ninos/{self.nino.id}/posiciones/batch/'
+        data = {
+            'posiciones': [
+                {'latitud': -17.7834, 'longitud': -63.1814,
+                 'timestamp': '2020-01-01T08:00:00-04:00', 'nivel_bateria': 10},
+            ]
+        }
+        self.client.post(url, data, format='json')
+        
+        ultima = UltimaPosicion.objects.get(nino=self.nino)
+        self.assertEqual(ultima.nivel_bateria, 90)
+        
+        response = self.client.get(f'/api/ninos/{self.nino.id}/estado/')
+        self.assertEqual(response.data['nivel_bateria'], 90)
+    
+    def test_ninos_cercanos_paginado(self):
+        """Test: Búsqueda de cercanos con limit y cursor"""
+        from datetime import date
+        
+        otro = Nino.objects.create(
+            nombre='Lucía',
+            apellido_paterno='Pérez',
+            fecha_nacimiento=date(2020, 3, 1),
+            sexo='F',
+            centro_educativo=self.kinder,
+            tutor_principal=self.tutor,
+        )
+        PosicionGPS.objects.create(nino=self.nino, ubicacion=Point(-63.1815, -17.7835, srid=4326))
+        PosicionGPS.objects.create(nino=otro, ubicacion=Point(-63.1830, -17.7835, srid=4326))
+        
+        url = '/api/busqueda-cercanos/ninos-cercanos/-17.7835/-63.1815/'
+        response = self.client.get(url, {'radius': 1000, 'limit': 1})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([n['id'] for n in response.data['ninos']], [self.nino.id])
+        self.assertIsNotNone(response.data['siguiente_cursor'])
+        
+        response = self.client.get(url, {
+            'radius': 1000, 'limit': 1, 'cursor': response.data['siguiente_cursor']
+        })
+        
+        self.assertEqual([n['id'] for n in response.data['ninos']], [otro.id])
+        self.assertIsNone(response.data['siguiente_cursor'])
+    
+    def test_ninos_cercanos_compacto(self):
+        """Test: Formato compacto (arreglo de arreglos) para mapas"""
+        PosicionGPS.objects.create(
+            nino=self.nino,
+            ubicacion=Point(-63.1815, -17.7835, srid=4326),
+            nivel_bateria=77
+        )
+        
+        url = '/api/busqueda-cercanos/ninos-cercanos/-17.7835/-63.1815/'
+        response = self.client.get(url, {'formato': 'compacto'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        fila = dict(zip(response.data['columnas'], response.data['ninos'][0]))
+        self.assertEqual(fila['id'], self.nino.id)
+        self.assertAlmostEqual(fila['lat'], -17.7835)
+        self.assertAlmostEqual(fila['lng'], -63.1815)
+        self.assertEqual(fila['nivel_bateria'], 77)
+    
+    def test_historial_resumido(self):
+        """Test: Las posiciones antiguas se resumen por minuto y se eliminan"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from apps.gis_tracking.retencion import resumir_posiciones_antiguas
+        
+        minuto = (timezone.now() - timedelta(days=40)).replace(second=0, microsecond=0)
+        for segundos, velocidad, bateria in [(10, 5.0, 80), (40, 12.0, 70)]:
+            PosicionGPS.objects.create(
+                nino=self.nino,
+                ubicacion=Point(-63.1815, -17.7835, srid=4326),
+                timestamp=minuto + timedelta(seconds=segundos),
+                velocidad_kmh=velocidad,
+                nivel_bateria=bateria
+            )
+        
+        resultado = resumir_posiciones_antiguas(dias_crudos=30)
+        
+        self.assertEqual(resultado['resumidas'], 2)
+        self.assertEqual(PosicionGPS.objects.count(), 0)
+        
+        url = f'/api/ninos/{self.nino.id}/historial/'
+        response = self.client.get(url, {'dias': 60, 'resumido': 'true'})
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        resumen = response.data['features'][0]['properties']
+        self.assertEqual(resumen['total_posiciones'], 2)
+        self.assertEqual(resumen['velocidad_max_kmh'], 12.0)
+        self.assertEqual(resumen['bateria_min'], 70)
+        self.assertEqual(resumen['proporcion_dentro'], 1.0)
+    
+    def test_distancia_centro_anotada(self):
+        """Test: La distancia al centro se calcula en SQL y coincide con Python"""
+        posicion = PosicionGPS.objects.create(
+            nino=self.nino,
+            ubicacion=Point(-63.1900, -17.7900, srid=4326)
+        )
+        
+        anotada = PosicionGPS.objects.con_distancia_centro().get(pk=posicion.pk)
+        
+        self.assertAlmostEqual(
+            anotada.distancia_al_centro(), posicion.distancia_al_centro(), delta=1
+        )
+        
+        url = f'/api/ninos/{self.nino.id}/historial/'
+        response = self.client.get(url)
+        
+        self.assertAlmostEqual(
+            response.data['features'][0]['properties']['distancia_centro'],
+            anotada.distancia_centro_metros
+        )
+    
+    @override_settings(ALERTAS_ENVIO_ASINCRONO=False)
+    def test_estadisticas_dashboard(self):
+        """Test: Estadísticas en una consulta agregada, invalidadas al commit"""
+        from django.core.cache import cache
+        from apps.gis_tracking.services import DashboardService
+        
+        cache.clear()
+        with self.assertNumQueries(1):
+            estadisticas = DashboardService.obtener_estadisticas()
+        self.assertEqual(estadisticas, {
+            'total_ninos': 1, 'total_centros': 1, 'dentro_area': 0, 'alertas_activas': 0,
+        })
+        with self.assertNumQueries(0):
+            DashboardService.obtener_estadisticas()
+        
+        # Posición dentro del área: cambia el estado del niño
+        with self.captureOnCommitCallbacks(execute=True):
+            PosicionGPS.objects.create(nino=self.nino, ubicacion=Point(-63.1815, -17.7835, srid=4326))
+        self.assertEqual(DashboardService.obtener_estadisticas()['dentro_area'], 1)
+        
+        # Alerta nueva: se invalida recién al confirmar
+        fuera, = PosicionGPS.objects.bulk_create([
+            PosicionGPS(nino=self.nino, ubicacion=Point(-63.1900, -17.7900, srid=4326))
+        ])
+        with self.captureOnCommitCallbacks() as callbacks:
+            alerta = Alerta.crear_alerta_salida(fuera)
+        self.assertEqual(DashboardService.obtener_estadisticas()['alertas_activas'], 0)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(DashboardService.obtener_estadisticas()['alertas_activas'], 1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            alerta.resolver()
+        self.assertEqual(DashboardService.obtener_estadisticas()['alertas_activas'], 0)
+    
+    def test_serializacion_rapida_identica(self):
+        """Test: Los serializadores rápidos generan el mismo JSON que DRF"""
+        
+        # La posición fuera del área genera además una alerta
+        PosicionGPS.objects.create(
+            nino=self.nino,
+            ubicacion=Point(-63.1900, -17.7900, srid=4326),
+            velocidad_kmh=4.5,
+            nivel_bateria=60
+        )
+        Alerta.objects.create(nino=self.nino, tipo_alerta='MANUAL', mensaje='Sin posición')
+        
+        for url in ['/api/mis-alertas/', '/api/alertas/', '/api/ninos/', '/api/posiciones/']:
+            with override_settings(API_SERIALIZACION_RAPIDA=False):
+                esperado = self.client.get(url)
+            with override_settings(API_SERIALIZACION_RAPIDA=True):
+                rapido = self.client.get(url)
+            
+            self.assertEqual(esperado.status_code, status.HTTP_200_OK, url)
+            self.assertEqual(rapido.content, esperado.content, url)
+    
+    def test_alertas_consultas_constantes(self):
+        """Test: Listar alertas cuesta las mismas consultas con 1 o 10 alertas"""
+        
+        # DRF: count + página + prefetch de posiciones | rápido: count + página
+        for rapido, consultas in ((False, 3), (True, 2)):
+            for total in (1, 10):
+                Alerta.objects.all().delete()
+                for _ in range(total):
+                    posicion = PosicionGPS.objects.create(
+                        nino=self.nino,
+                        ubicacion=Point(-63.1815, -17.7835, srid=4326)
+                    )
+                    Alerta.objects.create(
+                        nino=self.nino,
+                        tipo_alerta='MANUAL',
+                        posicion_gps=posicion,
+                        mensaje='Test alerta'
+                    )
+                
+                for url in ('/api/alertas/', '/api/mis-alertas/'):
+                    with override_settings(API_SERIALIZACION_RAPIDA=rapido):
+                        with self.assertNumQueries(consultas):
+                            response = self.client.get(url)
+                    
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+                    self.assertEqual(response.data['count'], total)
+    
+    @override_settings(NOTIFICACIONES_TRANSPORTE='apps.alerts.transportes.TransporteLocal')
+    def test_notificaciones_alerta_en_lote(self):
+        """Test: La alerta se notifica en Celery con un solo lote FCM y reintenta errores transitorios"""
+        from unittest import mock
+        from apps.alerts.models import DeviceToken, NotificacionTutor
+        from apps.alerts.notifications import EnvioTransitorioError
+        from apps.alerts.tasks import enviar_notificaciones_alerta
+        from apps.alerts.transportes import obtener_transporte
+        
+        usuario_padre = Usuario.objects.create_user(
+            username='tutor2', password='test123', tipo_usuario='TUTOR'
+        )
+        padre = Tutor.objects.create(
+            usuario=usuario_padre, relacion='PADRE', ci='87654321',
+            telefono_emergencia='70654321'
+        )
+        self.nino.tutores_adicionales.add(padre)
+        DeviceToken.registrar(self.usuario, 'token-madre')
+        DeviceToken.registrar(usuario_padre, 'token-padre')
+        
+        # bulk_create: sin pasar por save(), que ya generaría la alerta
+        posicion, = PosicionGPS.objects.bulk_create([
+            PosicionGPS(nino=self.nino, ubicacion=Point(-63.1900, -17.7900, srid=4326))
+        ])
+        
+        # La tarea se encola al confirmar la transacción, no dentro del request
+        with mock.patch.object(enviar_notificaciones_alerta, 'delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                alerta = Alerta.crear_alerta_salida(posicion)
+                delay.assert_not_called()
+        delay.assert_called_once_with(alerta.id)
+        
+        transporte = obtener_transporte()
+        transporte.limpiar()
+        
+        # Primer intento: la madre recibe, el padre falla por error transitorio
+        transporte.errores['token-padre'] = 'UNAVAILABLE'
+        with self.assertRaises(EnvioTransitorioError):
+            Alerta.objects.get(pk=alerta.pk).entregar_notificaciones()
+        self.assertEqual(len(transporte.enviados), 1)
+        self.assertEqual(sorted(transporte.enviados[0].tokens), ['token-madre', 'token-padre'])
+        
+        # Reintento: solo se envía al padre
+        transporte.limpiar()
+        enviar_notificaciones_alerta.apply(args=[alerta.id])
+        self.assertEqual(len(transporte.enviados), 1)
+        self.assertEqual(transporte.enviados[0].tokens, ['token-padre'])
+        
+        alerta.refresh_from_db()
+        self.assertEqual(alerta.estado, 'ENVIADA')
+        self.assertEqual(
+            NotificacionTutor.objects.filter(alerta=alerta, enviada_exitosamente=True).count(), 2
+        )
+    
+    @override_settings(
+        NOTIFICACIONES_TRANSPORTE='apps.alerts.transportes.TransporteLocal',
+        ALERTAS_ENVIO_ASINCRONO=False,
+    )
+    def test_envio_sincrono_error_transitorio(self):
+        """Test: Sin Celery, un error transitorio de FCM no deshace el lote de posiciones"""
+        from django.core.cache import cache
+        from apps.alerts.models import DeviceToken, NotificacionTutor
+        from apps.alerts.transportes import obtener_transporte
+        
+        cache.clear()
+        DeviceToken.registrar(self.usuario, 'token-madre')
+        transporte = obtener_transporte()
+        transporte.limpiar()
+        transporte.errores['token-madre'] = 'UNAVAILABLE'
+        
+        url = f'/api/ninos/{self.nino.id}/posiciones/batch/'
+        posiciones = [
+            {'latitud': -17.7835, 'longitud': -63.1815},
+            {'latitud': -17.7900, 'longitud': -63.1900},  # Fuera: alerta de salida
+        ]
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(url, {'posiciones': posiciones}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # Nada se envía dentro de la transacción que registró las posiciones
+        self.assertEqual(len(transporte.enviados), 0)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(PosicionGPS.objects.filter(nino=self.nino).count(), 2)
+        alerta = Alerta.objects.get(tipo_alerta='SALIDA_AREA')
+        self.assertEqual(alerta.estado, 'PENDIENTE')
+        self.assertFalse(NotificacionTutor.objects.get(alerta=alerta).enviada_exitosamente)
+        self.assertEqual(len(transporte.enviados), 1)
+    
+    @override_settings(
+        ALERTAS_ENVIO_ASINCRONO=False,
+        NOTIFICACIONES_TRANSPORTE='apps.alerts.transportes.TransporteNulo',
+    )
+    def test_envio_con_transporte_por_defecto(self):
+        """Test: Sin credenciales de Firebase (TransporteNulo) la posición y la alerta se registran"""
+        from django.core.cache import cache
+        from apps.alerts.models import DeviceToken, NotificacionTutor
+        
+        cache.clear()
+        DeviceToken.registrar(self.usuario, 'token-madre')
+        
+        url = f'/api/ninos/{self.nino.id}/registrar_posicion/'
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'latitud': -17.7900, 'longitud': -63.1900}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        alerta = Alerta.objects.get(tipo_alerta='SALIDA_AREA')
+        self.assertEqual(alerta.estado, 'ENVIADA')
+        notificacion = NotificacionTutor.objects.get(alerta=alerta)
+        self.assertTrue(notificacion.enviada_exitosamente)
+        self.assertEqual(notificacion.mensaje_id, '')
+    
+    @override_settings(NOTIFICACIONES_TRANSPORTE='apps.alerts.transportes.TransporteLocal')
+    def test_notificacion_multicast_por_lotes(self):
+        """Test: Un multicast cada 500 tokens y los tokens no registrados se invalidan en bloque"""
+        from apps.alerts.models import DeviceToken
+        from apps.alerts.notifications import NotificationService, TipoAlerta
+        from apps.alerts.transportes import TOKEN_NO_REGISTRADO, obtener_transporte
+        
+        DeviceToken.registrar(self.usuario, 'token-0')
+        
+        transporte = obtener_transporte()
+        transporte.limpiar()
+        transporte.errores.update({'token-0': TOKEN_NO_REGISTRADO, 'token-700': 'UNAVAILABLE'})
+        
+        tokens = [f'token-{i}' for i in range(1001)]
+        with self.assertNumQueries(3):  # UPDATE de exitosos, fallidos e inválidos
+            resultado = NotificationService.enviar_notificacion_multiple(
+                tokens, TipoAlerta.SALIDA_AREA, 'Pedrito González'
+            )
+        
+        self.assertEqual([len(m.tokens) for m in transporte.enviados], [500, 500, 1])
+        self.assertEqual(resultado['exitosos'], 999)
+        self.assertEqual(resultado['invalidos'], 1)
+        self.assertEqual([r['token'] for r in resultado['resultados']], tokens)
+        self.assertTrue(resultado['resultados'][700]['reintentable'])
+        self.assertTrue(resultado['resultados'][0]['invalido'])
+        
+        self.assertFalse(DeviceToken.objects.get(token='token-0').activo)
+    
+    def test_registro_tokens_dispositivo(self):
+        """Test: Tokens por dispositivo, resueltos en una consulta y desactivados tras fallos repetidos"""
+        from apps.alerts.models import DeviceToken
+        
+        url = '/api/configuracion/actualizar_firebase_token/'
+        for token in ('token-viejo', 'token-nuevo'):
+            response = self.client.post(url, {
+                'firebase_token': token, 'plataforma': 'ANDROID', 'dispositivo': 'telefono-1'
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.post(url, {'firebase_token': 'token-tablet'}, format='json')
+        
+        # El token anterior del mismo dispositivo queda desactivado
+        self.assertFalse(DeviceToken.objects.get(token='token-viejo').activo)
+        
+        with self.assertNumQueries(1):
+            tokens = DeviceToken.tokens_de_nino(self.nino.id)
+        self.assertEqual(
+            sorted(tokens), [('token-nuevo', self.tutor.id), ('token-tablet', self.tutor.id)]
+        )
+        
+        # Fallos seguidos hasta el máximo: el token se desactiva y se poda
+        with self.settings(PUSH_TOKEN_MAX_FALLOS=3):
+            for _ in range(3):
+                DeviceToken.registrar_resultados(fallidos=['token-tablet'])
+        self.assertFalse(DeviceToken.objects.get(token='token-tablet').activo)
+        
+        DeviceToken.registrar_resultados(exitosos=['token-nuevo'])
+        self.assertEqual(DeviceToken.podar(), 2)
+        self.assertEqual(list(DeviceToken.objects.values_list('token', flat=True)), ['token-nuevo'])
+    
+    def test_arranque_sin_firebase(self):
+        """Test: manage.py, ASGI y el worker de Celery arrancan dentro del presupuesto y sin firebase_admin"""
+        import subprocess
+        import sys
+        from pathlib import Path
+        
+        script = Path(__file__).resolve().parents[2] / 'scripts' / 'benchmark_arranque.py'
+        # Factor 2: margen para máquinas de CI más lentas que la de referencia
+        proceso = subprocess.run(
+            [sys.executable, str(script), '--verificar', '--factor', '2'],
+            capture_output=True, text=True,
+        )
+        self.assertEqual(proceso.returncode, 0, proceso.stdout + proceso.stderr)
+    
+    @override_settings(ALERT_COOLDOWN_EN_CACHE=True, ALERTAS_ENVIO_ASINCRONO=False)
+    def test_cooldown_alertas_sin_consultas(self):
+        """Test: Las posiciones fuera del área durante el cooldown no consultan la BD"""
+        from django.core.cache import cache
+        from django.db import transaction
+        
+        cache.clear()
+        posiciones = [
+            PosicionGPS(nino=self.nino, ubicacion=Point(-63.1900, -17.7900, srid=4326))
+            for _ in range(4)
+        ]
+        PosicionGPS.objects.bulk_create(posiciones)
+        
+        # Una alerta revertida no deja el cooldown en caché
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.assertIsNotNone(Alerta.crear_alerta_salida(posiciones[0]))
+                    raise RuntimeError('rollback')
+            except RuntimeError:
+                pass
+        self.assertEqual(cache.get_many([f'alerta_cooldown_{self.nino.id}_SALIDA_AREA']), {})
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            alerta = Alerta.crear_alerta_salida(posiciones[0])
+        self.assertIsNotNone(alerta)
+        with self.assertNumQueries(0):
+            self.assertIsNone(Alerta.crear_alerta_salida(posiciones[1]))
+        
+        # Caché vaciada (reinicio): una consulta a la BD y vuelve a quedar en caché
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertIsNone(Alerta.crear_alerta_salida(posiciones[1]))
+        with self.assertNumQueries(0):
+            self.assertIsNone(Alerta.crear_alerta_salida(posiciones[2]))
+        
+        # Una alerta atendida libera el cooldown (al confirmar)
+        with self.captureOnCommitCallbacks(execute=True):
+            alerta.resolver()
+        self.assertIsNotNone(Alerta.crear_alerta_salida(posiciones[3]))
+    
+    @override_settings(ALERT_COOLDOWN_EN_CACHE=False, ALERTAS_ENVIO_ASINCRONO=False)
+    def test_cooldown_alertas_sin_cache_compartida(self):
+        """Test: Sin caché compartida el cooldown se resuelve siempre en la BD"""
+        from django.core.cache import cache
+        
+        cache.clear()
+        posiciones = [
+            PosicionGPS(nino=self.nino, ubicacion=Point(-63.1900, -17.7900, srid=4326))
+            for _ in range(3)
+        ]
+        PosicionGPS.objects.bulk_create(posiciones)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            alerta = Alerta.crear_alerta_salida(posiciones[0])
+        self.assertIsNotNone(alerta)
+        with self.assertNumQueries(1):
+            self.assertIsNone(Alerta.crear_alerta_salida(posiciones[1]))
+        
+        # Resuelta por otro proceso (solo en la BD): la siguiente salida alerta
+        Alerta.objects.filter(id=alerta.id).update(estado='RESUELTA')
+        self.assertIsNotNone(Alerta.crear_alerta_salida(posiciones[2]))
+    
+    def test_area_con_margen(self):
+        """Test: El margen en metros se precalcula al guardar el centro"""
+        from io import StringIO
+        from django.core.management import call_command
+        
+        borde = Point(-63.1806, -17.7835, srid=4326)  # ~40 m al este del área
+        self.assertFalse(self.kinder.area_segura.contains(borde))
+        self.assertIsNone(self.kinder.area_con_margen)  # Sin margen
+        
+        self.kinder.margen_metros = 50
+        self.kinder.save()
+        centro = CentroEducativo.objects.get(pk=self.kinder.pk)
+        self.assertTrue(centro.area_con_margen.contains(borde))
+        
+        # Un margen menor que la distancia deja el punto afuera
+        centro.margen_metros = 30
+        centro.save()
+        self.assertFalse(CentroEducativo.objects.get(pk=centro.pk).area_con_margen.contains(borde))
+        
+        # recalcular_margenes completa los centros que no lo tienen guardado
+        CentroEducativo.objects.filter(pk=centro.pk).update(margen_metros=50, area_con_margen=None)
+        call_command('recalcular_margenes', stdout=StringIO())
+        self.assertTrue(CentroEducativo.objects.get(pk=centro.pk).area_con_margen.contains(borde))
+    
+    def test_cache_geocercas(self):
+        """Test: Geometría preparada reutilizada e invalidada al guardar o borrar el centro"""
+        from django.core.cache import cache
+        from apps.gis_tracking.geofence import GeofenceCache, geofence_cache
+        
+        cache.clear()
+        geofence_cache.limpiar()
+        clave = geofence_cache._clave_version(self.kinder.id)
+        
+        geocerca = geofence_cache.obtener(self.kinder.id)
+        with self.assertNumQueries(0):
+            self.assertIs(geofence_cache.obtener(self.kinder.id), geocerca)
+            self.assertTrue(geocerca.contiene(Point(-63.1815, -17.7835, srid=4326)))
+        
+        # Otro proceso: misma caché de Django, geocercas propias
+        otro_proceso = GeofenceCache()
+        self.assertIsNone(otro_proceso.obtener(self.kinder.id).area_con_margen)
+        
+        # post_save sube la versión al confirmar
+        self.kinder.margen_metros = 50
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.kinder.save()
+        self.assertEqual(cache.get(clave, 0), 0)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(cache.get(clave), 1)
+        
+        self.assertIsNot(geofence_cache.obtener(self.kinder.id), geocerca)
+        with self.settings(GEOFENCE_CACHE_VERSION_SEGUNDOS=0):
+            self.assertIsNotNone(otro_proceso.obtener(self.kinder.id).area_con_margen)
+        
+        # post_delete también
+        centro = CentroEducativo.objects.create(
+            nombre='Kinder Temporal', codigo='KT001', direccion='Calle 1',
+            area_segura=self.kinder.area_segura
+        )
+        geofence_cache.obtener(centro.id)
+        clave_centro = geofence_cache._clave_version(centro.id)
+        version = cache.get(clave_centro, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            centro.delete()
+        self.assertEqual(cache.get(clave_centro), version + 1)
+        self.assertIsNone(geofence_cache.obtener_vigente(centro.id))
+    
+    def test_transiciones_geocerca(self):
+        """Test: Alertas solo en transiciones, con histéresis en el margen y permanencia"""
+        from datetime import timedelta
+        from django.core.cache import cache
+        from django.utils import timezone
+        
+        cache.clear()
+        self.kinder.margen_metros = 50
+        with self.captureOnCommitCallbacks(execute=True):
+            self.kinder.save()  # Invalida la geocerca en caché
+        
+        inicio = timezone.now() - timedelta(minutes=10)
+        
+        def lote(*puntos):
+            url = f'/api/ninos/{self.nino.id}/posiciones/batch/'
+            posiciones = [
+                {'latitud': lat, 'longitud': lng,
+                 'timestamp': (inicio + timedelta(seconds=segundos)).isoformat()}
+                for segundos, lat, lng in puntos
+            ]
+            # El estado de la máquina se guarda al commit
+            with self.captureOnCommitCallbacks(execute=True):
+                return self.client.post(url, {'posiciones': posiciones}, format='json')
+        
+        dentro = (-17.7835, -63.1815)
+        borde = (-17.7835, -63.1806)  # ~40 m al este: solo dentro del margen
+        fuera = (-17.7900, -63.1900)
+        
+        # Dentro, borde (sin cambio), fuera (salida), fuera, borde (sigue fuera), dentro (regreso)
+        response = lote(
+            (0, *dentro), (30, *borde), (60, *fuera), (90, *fuera), (120, *borde), (150, *dentro)
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        tipos = list(Alerta.objects.order_by('id').values_list('tipo_alerta', flat=True))
+        self.assertEqual(tipos, ['SALIDA_AREA', 'REGRESO_AREA'])
+        
+        # El regreso no cuenta como alerta activa
+        response = self.client.get(f'/api/ninos/{self.nino.id}/estado/')
+        self.assertEqual(response.data['alertas_activas'], 1)
+        
+        # Con permanencia de 60 s una salida breve no genera alerta
+        Alerta.objects.all().delete()
+        with self.settings(GEOFENCE_PERMANENCIA_SEGUNDOS=60):
+            lote((180, *fuera), (210, *dentro))
+            self.assertFalse(Alerta.objects.exists())
+            lote((240, *fuera), (270, *fuera), (300, *fuera))
+            self.assertEqual(Alerta.objects.get().tipo_alerta, 'SALIDA_AREA')
+    
+    def test_particiones_limite_de_mes(self):
+        """Test: El mes de una partición es el de TIME_ZONE, no el de UTC"""
+        from datetime import date, datetime, timezone as dt_timezone
+        from django.db import connection
+        from apps.gis_tracking import particiones
+        
+        def contar(tabla):
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT COUNT(*) FROM {tabla}')
+                return cursor.fetchone()[0]
+        
+        tabla = PosicionGPS._meta.db_table
+        # America/La_Paz es UTC-4: en UTC ambas ya son del mes siguiente
+        fin_de_enero, fin_de_diciembre = PosicionGPS.objects.bulk_create([
+            PosicionGPS(nino=self.nino, ubicacion=Point(-63.1815, -17.7835, srid=4326),
+                        timestamp=datetime(2090, 2, 1, 3, tzinfo=dt_timezone.utc)),
+            PosicionGPS(nino=self.nino, ubicacion=Point(-63.1815, -17.7835, srid=4326),
+                        timestamp=datetime(2090, 1, 1, 3, tzinfo=dt_timezone.utc)),
+        ])
+        
+        with self.settings(TIME_ZONE='America/La_Paz'):
+            enero = particiones.crear_particion(date(2090, 1, 1))
+            self.assertEqual(contar(enero), 1)
+            self.assertEqual(contar(f'{tabla}_default'), 1)
+            
+            diciembre = particiones.crear_particion(date(2089, 12, 1))
+            self.assertEqual(contar(diciembre), 1)
+            self.assertEqual(contar(f'{tabla}_default'), 0)
+        
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id FROM {enero}')
+            self.assertEqual(cursor.fetchone()[0], fin_de_enero.id)
+            cursor.execute(f'SELECT id FROM {diciembre}')
+            self.assertEqual(cursor.fetchone()[0], fin_de_diciembre.id)
+    
+    def test_particiones_mensuales(self):
+        """Test: Crear particiones (moviendo filas de la default), desvincular y eliminar"""
+        from datetime import date, datetime
+        from unittest import mock
+        from django.db import connection
+        from django.utils import timezone
+        from apps.gis_tracking import particiones
+        
+        def contar(tabla):
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT COUNT(*) FROM {tabla}')
+                return cursor.fetchone()[0]
+        
+        def existe(tabla):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT to_regclass(%s)', [tabla])
+                return cursor.fetchone()[0] is not None
+        
+        tabla = PosicionGPS._meta.db_table
+        mes = date(2090, 1, 1)
+        posicion, = PosicionGPS.objects.bulk_create([PosicionGPS(
+            nino=self.nino, ubicacion=Point(-63.1815, -17.7835, srid=4326),
+            timestamp=timezone.make_aware(datetime(2090, 1, 15, 12)),
+        )])
+        self.assertNotIn(mes, particiones.listar_particiones())
+        self.assertEqual(contar(f'{tabla}_default'), 1)
+        
+        # La partición nueva se lleva las filas de su mes que estaban en la default
+        nombre = particiones.crear_particion(mes)
+        self.assertEqual(particiones.listar_particiones()[mes], nombre)
+        self.assertEqual(contar(f'{tabla}_default'), 0)
+        self.assertEqual(contar(nombre), 1)
+        self.assertTrue(PosicionGPS.objects.filter(pk=posicion.pk).exists())
+        
+        # Particiones futuras según la fecha local; la segunda vez no hay nada que crear
+        with mock.patch.object(particiones.timezone, 'localdate', return_value=date(2091, 6, 10)):
+            creadas = particiones.crear_particiones_futuras(meses=2)
+            self.assertEqual(creadas, [f'{tabla}_p209106', f'{tabla}_p209107', f'{tabla}_p209108'])
+            self.assertEqual(particiones.crear_particiones_futuras(meses=2), [])
+            
+            # Retención de 12 meses: 2090-01 se desvincula (la tabla queda para archivarla)
+            expiradas = particiones.expirar_particiones(retencion_meses=12, eliminar=False)
+            self.assertIn(nombre, expiradas)
+            self.assertNotIn(mes, particiones.listar_particiones())
+            self.assertTrue(existe(nombre))
+            self.assertFalse(PosicionGPS.objects.filter(pk=posicion.pk).exists())
+            
+            # Con eliminar=True se borra
+            otra = particiones.crear_particion(date(2090, 2, 1))
+            self.assertIn(otra, particiones.expirar_particiones(retencion_meses=12, eliminar=True))
+            self.assertFalse(existe(otra))
+            self.assertIn(date(2091, 6, 1), particiones.listar_particiones())
+    
+    def test_salida_regreso_salida(self):
+        """Test: Volver al área termina el cooldown; la segunda salida también alerta"""
+        from datetime import timedelta
+        from django.core.cache import cache
+        from django.utils import timezone
+        
+        cache.clear()
+        url = f'/api/ninos/{self.nino.id}/posiciones/batch/'
+        inicio = timezone.now() - timedelta(minutes=2)
+        
+        def fix(segundos, dentro):
+            lat, lng = (-17.7835, -63.1815) if dentro else (-17.7900, -63.1900)
+            return {'latitud': lat, 'longitud': lng,
+                    'timestamp': (inicio + timedelta(seconds=segundos)).isoformat()}
+        
+        # Salida y regreso en un lote, la segunda salida (dentro del cooldown) en otro
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'posiciones': [fix(0, True), fix(30, False), fix(60, True)]}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'posiciones': [fix(90, False)]}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        tipos = list(Alerta.objects.order_by('id').values_list('tipo_alerta', flat=True))
+        self.assertEqual(tipos, ['SALIDA_AREA', 'REGRESO_AREA', 'SALIDA_AREA'])
+    
+    def test_estado_geocerca_al_commit_y_bloqueo(self):
+        """Test: El estado de la geocerca se escribe al commit y el bloqueo serializa por niño"""
+        import threading
+        from django.core.cache import cache
+        from django.db import transaction
+        from django.utils import timezone
+        from apps.gis_tracking.transiciones import FUERA, BloqueoGeocercaOcupado, maquina_geocerca
+        
+        cache.clear()
+        clave = maquina_geocerca._clave(self.nino.id)
+        fuera = PosicionGPS(nino=self.nino, ubicacion=Point(-63.1900, -17.7900, srid=4326),
+                            dentro_area_segura=False)
+        fuera.timestamp = timezone.now()
+        
+        with self.captureOnCommitCallbacks() as callbacks:
+            eventos = maquina_geocerca.transiciones([fuera], maquina_geocerca.cargar([self.nino.id]))
+        self.assertEqual([evento for _, evento in eventos], ['SALIDA_AREA'])
+        self.assertIsNone(cache.get(clave))  # Nada antes del commit
+        for callback in callbacks:
+            callback()
+        self.assertEqual(cache.get(clave)[0], FUERA)
+        
+        # Una transacción revertida no hace avanzar el estado
+        dentro = PosicionGPS(nino=self.nino, ubicacion=Point(-63.1815, -17.7835, srid=4326),
+                             dentro_area_segura=True)
+        dentro.timestamp = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    eventos = maquina_geocerca.transiciones([dentro], maquina_geocerca.cargar([self.nino.id]))
+                    self.assertEqual([evento for _, evento in eventos], ['REGRESO_AREA'])
+                    raise RuntimeError('rollback')
+            except RuntimeError:
+                pass
+        self.assertEqual(cache.get(clave)[0], FUERA)
+        
+        # Un segundo procesamiento del mismo niño espera a que se libere el primero
+        orden = []
+        
+        def segundo():
+            with maquina_geocerca.bloqueo([self.nino.id]):
+                orden.append('segundo')
+        
+        # ... y, dentro de una transacción, a que esta confirme (el estado se escribe al commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            with maquina_geocerca.bloqueo([self.nino.id]):
+                hilo = threading.Thread(target=segundo)
+                hilo.start()
+                hilo.join(0.2)
+                self.assertTrue(hilo.is_alive())
+                orden.append('primero')
+            hilo.join(0.2)
+            self.assertTrue(hilo.is_alive())
+            # El mismo hilo puede volver a tomarlo con el commit pendiente
+            with maquina_geocerca.bloqueo([self.nino.id]):
+                orden.append('reentrante')
+        hilo.join(5)
+        self.assertEqual(orden, ['primero', 'reentrante', 'segundo'])
+        
+        # La espera tiene un límite
+        cache.set(maquina_geocerca._clave_bloqueo(self.nino.id), 'otro-proceso', 30)
+        with self.settings(GEOFENCE_BLOQUEO_ESPERA_SEGUNDOS=0.05):
+            with self.assertRaises(BloqueoGeocercaOcupado), self.assertLogs('apps.gis_tracking.transiciones', 'ERROR'):
+                with maquina_geocerca.bloqueo([self.nino.id]):
+                    pass
+    
+    def test_autenticacion_y_frames_dispositivo(self):
+        """Test: Token del dispositivo (ws/device/) y decodificación de sus frames"""
+        from apps.gis_tracking import protocolo
+        from apps.gis_tracking.consumers import DispositivoGPSConsumer
+        
+        # Sin token generado el dispositivo no puede conectarse
+        self.assertIsNone(Nino.autenticar_dispositivo('device123', 'cualquiera'))
+        
+        token = self.nino.generar_token_dispositivo()
+        self.assertNotIn(token, self.nino.token_dispositivo)  # Solo se guarda el hash
+        self.assertEqual(
+            Nino.autenticar_dispositivo('device123', token),
+            (self.nino.id, self.kinder.id)
+        )
+        self.assertIsNone(Nino.autenticar_dispositivo('device123', 'otro'))
+        self.assertIsNone(Nino.autenticar_dispositivo('otro-device', token))
+        
+        # Un token nuevo invalida el anterior
+        self.nino.generar_token_dispositivo()
+        self.assertIsNone(Nino.autenticar_dispositivo('device123', token))
+        
+        # dispositivo_id único entre los niños que lo tienen asignado
+        from datetime import date
+        from django.db import IntegrityError, transaction
+        datos = dict(
+            nombre='Ana', apellido_paterno='Gómez', fecha_nacimiento=date(2019, 3, 10),
+            sexo='F', centro_educativo=self.kinder, tutor_principal=self.tutor,
+        )
+        Nino.objects.create(**datos)
+        Nino.objects.create(**datos)  # Varios sin dispositivo
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Nino.objects.create(dispositivo_id='device123', **datos)
+        
+        scope = {'headers': [(b'authorization', b'Token abc')], 'query_string': b''}
+        self.assertEqual(DispositivoGPSConsumer.token_de_scope(scope), 'abc')
+        self.assertEqual(DispositivoGPSConsumer.token_de_scope({'query_string': b'token=xyz'}), 'xyz')
+        
+        # JSON (uno o varios fixes, timestamp opcional), binario y ping
+        self.assertEqual(
+            protocolo.decodificar_json('{"seq": 7, "lat": -17.78, "lng": -63.18, "nivel_bateria": 80}'),
+            (7, [(-17.78, -63.18, 80, None)])
+        )
+        frame = protocolo.decodificar_json(
+            '{"seq": 8, "fixes": [{"lat": 1, "lng": 2, "timestamp": "2024-05-10T08:15:00-04:00"},'
+            ' {"lat": 3, "lng": 4}]}'
+        )
+        self.assertEqual(frame.seq, 8)
+        self.assertEqual(len(frame.fixes), 2)
+        self.assertEqual(frame.fixes[0][3].isoformat(), '2024-05-10T08:15:00-04:00')
+        
+        timestamp_ms = 1715343300000  # 2024-05-10T12:15:00Z
+        binario = protocolo.SEQ_DISPOSITIVO.pack(9) + (
+            protocolo.FIX_DISPOSITIVO.pack(timestamp_ms, -17.78, -63.18, 80) * 3
+        )
+        frame = protocolo.decodificar_binario(binario)
+        self.assertEqual(frame.seq, 9)
+        self.assertEqual(len(frame.fixes), 3)
+        self.assertEqual(frame.fixes[0][:3], (-17.78, -63.18, 80))
+        self.assertEqual(int(frame.fixes[0][3].timestamp() * 1000), timestamp_ms)
+        sin_hora = protocolo.SEQ_DISPOSITIVO.pack(1) + protocolo.FIX_DISPOSITIVO.pack(0, 1, 2, 50)
+        self.assertIsNone(protocolo.decodificar_binario(sin_hora).fixes[0][3])
+        self.assertIsNone(protocolo.decodificar_json('{"type": "ping"}'))
+        
+        # Inválidos: el seq viaja en la excepción cuando se pudo leer
+        for invalido, seq in (
+            ('{"seq": 1, "lat": 1}', 1),
+            ('{"seq": 2, "lat": 91, "lng": 0}', 2),
+            ('{"seq": 3, "lat": 1, "lng": 2, "timestamp": "ayer"}', 3),
+            ('{"seq": 4, "fixes": []}', 4),
+            ('{"lat": 1, "lng": 2}', None),
+            ('no es json', None),
+        ):
+            with self.assertRaises(protocolo.FrameInvalido) as contexto:
+                protocolo.decodificar_json(invalido)
+            self.assertEqual(contexto.exception.seq, seq)
+        with self.assertRaises(protocolo.FrameInvalido) as contexto:
+            protocolo.decodificar_binario(binario[:-1])
+        self.assertEqual(contexto.exception.seq, 9)
+    
+    def test_frame_binario_gps_update(self):
+        """Test: Frame binario de gps_update para tutores con el subprotocolo binario"""
+        import json
+        from django.utils import timezone
+        from apps.gis_tracking import protocolo
+        
+        ahora = timezone.now()
+        frame = protocolo.codificar_gps_update(self.nino.id, -17.7833, -63.1812, 85, False, ahora)
+        self.assertEqual(len(frame), protocolo.FRAME_GPS_UPDATE.size)
+        self.assertEqual(protocolo.decodificar_gps_update(frame), {
+            'type': 'gps_update',
+            'nino_id': self.nino.id,
+            'lat': -17.7833,
+            'lng': -63.1812,
+            'nivel_bateria': 85,
+            'dentro_area': False,
+            'timestamp_ms': int(ahora.timestamp() * 1000),
+        })
+        
+        # Mucho más chico que el mismo gps_update en JSON
+        texto = json.dumps({
+            'type': 'gps_update', 'nino_id': self.nino.id, 'lat': -17.7833, 'lng': -63.1812,
+            'nivel_bateria': 85, 'dentro_area': False, 'timestamp': ahora.isoformat(),
+        })
+        self.assertLess(len(frame) * 4, len(texto))
+        
+        sin_bateria = protocolo.codificar_gps_update(self.nino.id, 0, 0, None, True, ahora)
+        self.assertIsNone(protocolo.decodificar_gps_update(sin_bateria)['nivel_bateria'])
+    
+    def test_broadcast_serializado_una_vez(self):
+        """Test: Los consumers reenvían el gps_update ya serializado por el emisor"""
+        import json
+        from asgiref.sync import async_to_sync
+        from django.utils import timezone
+        from apps.gis_tracking import protocolo
+        from apps.gis_tracking.consumers import GPSTrackingConsumer
+        
+        class ConsumerPrueba(GPSTrackingConsumer):
+            async def send(self, text_data=None, bytes_data=None, close=False):
+                self.enviado = text_data if bytes_data is None else bytes_data
+        
+        ahora = timezone.now()
+        evento = protocolo.evento_gps_update(self.nino.id, -17.7833, -63.1812, 85, True, ahora)
+        consumers = [ConsumerPrueba() for _ in range(3)]
+        for consumer, binario in zip(consumers, (False, False, True)):
+            consumer.binario = binario
+            async_to_sync(consumer.enviar_gps_update)(evento)
+        
+        # Mismo objeto, sin volver a serializar
+        self.assertIs(consumers[0].enviado, evento['texto'])
+        self.assertIs(consumers[1].enviado, evento['texto'])
+        self.assertIs(consumers[2].enviado, evento['frame'])
+        self.assertEqual(json.loads(evento['texto'])['timestamp'], ahora.isoformat())
+        
+        alerta = protocolo.evento_alerta(self.nino.id, 'Pedrito', 'Salió del área', ahora)
+        async_to_sync(consumers[0].alert_created)(alerta)
+        self.assertEqual(json.loads(consumers[0].enviado)['type'], 'alert')
+    
+    def test_coalescing_gps_update_por_conexion(self):
+        """Test: Solo se envía el último fix de cada niño, a la frecuencia pedida"""
+        import asyncio
+        import json
+        from asgiref.sync import async_to_sync
+        from django.utils import timezone
+        from apps.gis_tracking import protocolo
+        from apps.gis_tracking.consumers import GPSTrackingConsumer
+        
+        class ConsumerPrueba(GPSTrackingConsumer):
+            async def send(self, text_data=None, bytes_data=None, close=False):
+                self.enviados.append(json.loads(text_data))
+        
+        consumer = ConsumerPrueba()
+        consumer.enviados = []
+        
+        async def rafaga():
+            # El cliente pide 5 Hz (y un valor fuera de rango se acota)
+            await consumer.receive(json.dumps({'type': 'subscribe', 'max_hz': 1000}))
+            self.assertEqual(consumer.enviados.pop()['max_hz'], 10)
+            await consumer.receive(json.dumps({'type': 'subscribe', 'max_hz': 5}))
+            consumer.enviados.clear()
+            
+            def fix(nino_id, bateria):
+                return protocolo.evento_gps_update(nino_id, -17.78, -63.18, bateria, True, timezone.now())
+            
+            # El primer fix sale de inmediato
+            await consumer.gps_position_update(fix(1, 0))
+            await asyncio.sleep(0)
+            
+            # Ráfaga de 2 niños mientras se espera el próximo turno (200 ms)
+            for bateria in range(1, 50):
+                for nino_id in (1, 2):
+                    await consumer.gps_position_update(fix(nino_id, bateria))
+            self.assertEqual(len(consumer.pendientes), 2)
+            await consumer._envio
+        
+        async_to_sync(rafaga)()
+        
+        # De la ráfaga solo se envió el último fix de cada niño
+        self.assertEqual(
+            [(m['nino_id'], m['nivel_bateria']) for m in consumer.enviados],
+            [(1, 0), (1, 49), (2, 49)]
+        )
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class TrackingTiempoRealTestCase(DatosTrackingMixin, TransactionTestCase):
+    """
+    Tests de la ingesta write-behind y de los WebSockets
+    
+    TransactionTestCase: database_sync_to_async cierra las conexiones
+    "viejas", lo que rompe la transacción envolvente de TestCase.
+    """
+    
+    def posicion(self, lat=-17.7835, lng=-63.1815):
+        return PosicionGPS(nino_id=self.nino.id, ubicacion=Point(lng, lat, srid=4326))
+    
+    async def contar_posiciones(self):
+        from channels.db import database_sync_to_async
+        return await database_sync_to_async(PosicionGPS.objects.filter(nino=self.nino).count)()
+    
+    async def conectar_dispositivo(self, token, dispositivo_id='device123', **kwargs):
+        """WebsocketCommunicator del dispositivo contra el routing real"""
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from apps.gis_tracking.routing import websocket_urlpatterns
+        
+        headers = [(b'authorization', f'Token {token}'.encode())] if token else []
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f'/ws/device/{dispositivo_id}/',
+            headers=headers, **kwargs
+        )
+        conectado, _ = await communicator.connect()
+        return communicator, conectado
+    
+    async def conectar_tutor(self, usuario, tutor_id):
+        """WebsocketCommunicator del visor del tutor, con el usuario ya autenticado"""
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from apps.gis_tracking.routing import websocket_urlpatterns
+        
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f'/ws/tracking/tutor/{tutor_id}/'
+        )
+        communicator.scope['user'] = usuario
+        conectado, _ = await communicator.connect()
+        if conectado:
+            mensaje = await communicator.receive_json_from()
+            self.assertEqual(mensaje['type'], 'connection_established')
+        return communicator, conectado
+    
+    async def generar_token(self):
+        from channels.db import database_sync_to_async
+        return await database_sync_to_async(self.nino.generar_token_dispositivo)()
+    
+    async def test_write_behind_flush_por_cantidad_y_por_tiempo(self):
+        """Test: El buffer escribe al llegar a flush_filas o al vencer flush_ms"""
+        import asyncio
+        from apps.gis_tracking.ingestion import WriteBehindBuffer
+        
+        # Por cantidad: la tercera posición dispara el flush (el temporizador es largo)
+        buffer = WriteBehindBuffer(flush_ms=60000, flush_filas=3)
+        confirmaciones = [await buffer.agregar(self.posicion()) for _ in range(3)]
+        await asyncio.wait_for(asyncio.gather(*confirmaciones), timeout=5)
+        self.assertEqual(await self.contar_posiciones(), 3)
+        self.assertEqual(buffer.metricas['flushes'], 1)
+        
+        # Por tiempo: dos posiciones, muy por debajo de flush_filas
+        buffer = WriteBehindBuffer(flush_ms=50, flush_filas=1000)
+        confirmaciones = [await buffer.agregar(self.posicion()) for _ in range(2)]
+        await asyncio.wait_for(asyncio.gather(*confirmaciones), timeout=5)
+        self.assertEqual(await self.contar_posiciones(), 5)
+        self.assertEqual(buffer.estadisticas()['pendientes'], 0)
+    
+    async def test_write_behind_backpressure(self):
+        """Test: Con max_pendientes alcanzado, quien encola espera al flush"""
+        from apps.gis_tracking.ingestion import WriteBehindBuffer
+        
+        buffer = WriteBehindBuffer(flush_ms=60000, flush_filas=1000, max_pendientes=2)
+        primeras = [await buffer.agregar(self.posicion()) for _ in range(2)]
+        self.assertEqual(await self.contar_posiciones(), 0)
+        
+        tercera = await buffer.agregar(self.posicion())
+        self.assertEqual(buffer.metricas['esperas_backpressure'], 1)
+        self.assertTrue(all(confirmacion.done() for confirmacion in primeras))
+        self.assertEqual(await self.contar_posiciones(), 2)
+        self.assertFalse(tercera.done())
+        
+        await buffer.flush()
+        self.assertEqual(await self.contar_posiciones(), 3)
+    
+    async def test_write_behind_reintenta_y_descarta(self):
+        """Test: Un lote que falla vuelve a la cola; tras los reintentos se descarta"""
+        import asyncio
+        from unittest import mock
+        from apps.gis_tracking import ingestion
+        
+        guardar = ingestion._guardar_lote
+        fallos = {'restantes': 1}
+        
+        def guardar_con_fallos(lote):
+            if fallos['restantes']:
+                fallos['restantes'] -= 1
+                raise RuntimeError('BD no disponible')
+            guardar(lote)
+        
+        with mock.patch.object(ingestion, '_guardar_lote', guardar_con_fallos):
+            # Un fallo: el lote se reintenta y termina en la BD
+            buffer = ingestion.WriteBehindBuffer(flush_ms=10, flush_filas=1000, max_reintentos=2)
+            confirmaciones = [await buffer.agregar(self.posicion()) for _ in range(2)]
+            await asyncio.wait_for(asyncio.gather(*confirmaciones), timeout=5)
+            self.assertEqual(await self.contar_posiciones(), 2)
+            self.assertEqual(buffer.metricas['reintentos'], 1)
+            self.assertEqual(buffer.metricas['fallidas'], 0)
+            
+            # Falla siempre: tras 2 reintentos se descarta y la confirmación falla
+            fallos['restantes'] = 100
+            confirmacion = await buffer.agregar(self.posicion())
+            with self.assertRaises(ingestion.ErrorEscrituraGPS):
+                await asyncio.wait_for(confirmacion, timeout=5)
+            self.assertEqual(buffer.metricas['fallidas'], 1)
+            self.assertEqual(buffer.metricas['reintentos'], 3)
+            self.assertEqual(buffer.pendientes, 0)
+        self.assertEqual(await self.contar_posiciones(), 2)
+    
+    @override_settings(GPS_WS_WRITE_BEHIND=True, GPS_WS_FLUSH_MS=60000)
+    async def test_write_behind_flush_al_desconectar(self):
+        """Test: Al cerrarse el socket del dispositivo se escribe lo encolado"""
+        import json
+        
+        communicator, conectado = await self.conectar_dispositivo(await self.generar_token())
+        self.assertTrue(conectado)
+        await communicator.send_to(text_data=json.dumps({'seq': 1, 'lat': -17.7835, 'lng': -63.1815}))
+        await communicator.disconnect()
+        
+        self.assertEqual(await self.contar_posiciones(), 1)
+    
+    def crear_otros_tutores(self):
+        """Tutor adicional de self.nino y tutor de otro niño"""
+        from datetime import date
+        
+        usuario_padre = Usuario.objects.create_user(
+            username='tutor2', password='test123', tipo_usuario='TUTOR'
+        )
+        padre = Tutor.objects.create(
+            usuario=usuario_padre, relacion='PADRE', ci='87654321',
+            telefono_emergencia='70654321'
+        )
+        self.nino.tutores_adicionales.add(padre)
+        
+        usuario_ajeno = Usuario.objects.create_user(
+            username='tutor3', password='test123', tipo_usuario='TUTOR'
+        )
+        ajeno = Tutor.objects.create(
+            usuario=usuario_ajeno, relacion='MADRE', ci='11223344',
+            telefono_emergencia='70111222'
+        )
+        Nino.objects.create(
+            nombre='Lucía', apellido_paterno='Pérez', fecha_nacimiento=date(2020, 3, 1),
+            sexo='F', centro_educativo=self.kinder, tutor_principal=ajeno,
+        )
+        return (usuario_padre, padre), (usuario_ajeno, ajeno)
+    
+    @override_settings(GPS_WS_WRITE_BEHIND=False)
+    async def test_fan_out_por_grupo_de_nino(self):
+        """Test: Un fix del dispositivo llega con un solo group_send a todos los tutores del niño"""
+        import json
+        from unittest import mock
+        from channels.db import database_sync_to_async
+        from channels.layers import InMemoryChannelLayer
+        from apps.gis_tracking.consumers import grupo_nino
+        
+        (usuario_padre, padre), (usuario_ajeno, ajeno) = await database_sync_to_async(
+            self.crear_otros_tutores
+        )()
+        visores = []
+        for usuario, tutor in ((self.usuario, self.tutor), (usuario_padre, padre), (usuario_ajeno, ajeno)):
+            communicator, conectado = await self.conectar_tutor(usuario, tutor.id)
+            self.assertTrue(conectado)
+            visores.append(communicator)
+        principal, adicional, _ = visores
+        
+        dispositivo, conectado = await self.conectar_dispositivo(await self.generar_token())
+        self.assertTrue(conectado)
+        
+        group_send = InMemoryChannelLayer.group_send
+        with mock.patch.object(
+            InMemoryChannelLayer, 'group_send', autospec=True, side_effect=group_send
+        ) as envios:
+            await dispositivo.send_to(text_data=json.dumps({'seq': 1, 'lat': -17.7835, 'lng': -63.1815}))
+            for visor in (principal, adicional):
+                mensaje = await visor.receive_json_from(timeout=5)
+                self.assertEqual(mensaje['type'], 'gps_update')
+                self.assertEqual(mensaje['nino_id'], self.nino.id)
+        self.assertEqual(
+            [llamada.args[1] for llamada in envios.call_args_list], [grupo_nino(self.nino.id)]
+        )
+        
+        for visor in visores:
+            self.assertTrue(await visor.receive_nothing(timeout=0.2))
+            await visor.disconnect()
+        await dispositivo.disconnect()
+    
+    @override_settings(ALERTAS_ENVIO_ASINCRONO=False)
+    async def test_alerta_transmitida_al_grupo_del_nino(self):
+        """Test: Las alertas de salida y regreso llegan por WebSocket a los tutores del niño"""
+        from channels.db import database_sync_to_async
+        
+        communicator, conectado = await self.conectar_tutor(self.usuario, self.tutor.id)
+        self.assertTrue(conectado)
+        
+        def crear_alertas():
+            fuera, dentro = PosicionGPS.objects.bulk_create([
+                PosicionGPS(nino=self.nino, ubicacion=Point(-63.1900, -17.7900, srid=4326)),
+                PosicionGPS(nino=self.nino, ubicacion=Point(-63.1815, -17.7835, srid=4326)),
+            ])
+            return Alerta.crear_alerta_salida(fuera), Alerta.crear_alerta_regreso(dentro)
+        
+        salida, regreso = await database_sync_to_async(crear_alertas)()
+        for alerta in (salida, regreso):
+            mensaje = await communicator.receive_json_from(timeout=5)
+            self.assertEqual(mensaje['type'], 'alert')
+            self.assertEqual(mensaje['nino_id'], self.nino.id)
+            self.assertEqual(mensaje['mensaje'], alerta.mensaje)
+        await communicator.disconnect()
+    
+    @override_settings(GPS_WS_INGESTA_TUTOR=True, GPS_WS_WRITE_BEHIND=False)
+    async def test_visor_gps_update_legado(self):
+        """Test: gps_update de la app Flutter por ws/tracking/ (obsoleto), solo para sus niños"""
+        import json
+        from channels.db import database_sync_to_async
+        
+        (usuario_padre, padre), (usuario_ajeno, ajeno) = await database_sync_to_async(
+            self.crear_otros_tutores
+        )()
+        communicator, conectado = await self.conectar_tutor(self.usuario, self.tutor.id)
+        self.assertTrue(conectado)
+        
+        with self.assertLogs('apps.gis_tracking.consumers', 'WARNING'):
+            await communicator.send_to(text_data=json.dumps({
+                'type': 'gps_update', 'nino_id': self.nino.id,
+                'lat': -17.7835, 'lng': -63.1815, 'nivel_bateria': 100,
+            }))
+            # El propio tutor lo recibe por el grupo del niño
+            mensaje = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(mensaje['type'], 'gps_update')
+        self.assertEqual(await self.contar_posiciones(), 1)
+        
+        # Un niño que no es suyo se rechaza
+        otro_id = await database_sync_to_async(
+            lambda: Nino.objects.get(tutor_principal=ajeno).id
+        )()
+        await communicator.send_to(text_data=json.dumps({
+            'type': 'gps_update', 'nino_id': otro_id, 'lat': -17.7835, 'lng': -63.1815,
+        }))
+        self.assertEqual((await communicator.receive_json_from())['type'], 'error')
+        await communicator.disconnect()
+    
+    async def test_conexion_dispositivo_rechazada(self):
+        """Test: ws/device/ rechaza la conexión sin token o con uno que no corresponde"""
+        token = await self.generar_token()
+        
+        for credencial, dispositivo_id in ((None, 'device123'), ('otro', 'device123'), (token, 'otro-device')):
+            communicator, conectado = await self.conectar_dispositivo(credencial, dispositivo_id)
+            self.assertFalse(conectado)
+        
+        communicator, conectado = await self.conectar_dispositivo(token)
+        self.assertTrue(conectado)
+        await communicator.disconnect()
+    
+    @override_settings(GPS_WS_INGESTA_TUTOR=False)
+    async def test_visor_rechaza_gps_update(self):
+        """Test: Sin la ingesta obsoleta, el WebSocket del tutor es de solo lectura"""
+        import json
+        
+        communicator, conectado = await self.conectar_tutor(self.usuario, self.tutor.id)
+        self.assertTrue(conectado)
+        
+        await communicator.send_to(text_data=json.dumps({
+            'type': 'gps_update', 'nino_id': self.nino.id, 'lat': -17.7835, 'lng': -63.1815
+        }))
+        respuesta = await communicator.receive_json_from()
+        self.assertEqual(respuesta['type'], 'error')
+        self.assertEqual(await self.contar_posiciones(), 0)
+        await communicator.disconnect()
+        
+        # Otro usuario no puede abrir el tracking de este tutor
+        from channels.db import database_sync_to_async
+        intruso = await database_sync_to_async(Usuario.objects.create_user)(
+            username='intruso', password='test123', tipo_usuario='TUTOR'
+        )
+        communicator, conectado = await self.conectar_tutor(intruso, self.tutor.id)
+        self.assertFalse(conectado)
+    
+    @override_settings(GPS_WS_WRITE_BEHIND=False, GPS_DEVICE_ACK_FRAMES=3, GPS_DEVICE_ACK_MS=60000)
+    async def test_ack_dispositivo_por_cantidad(self):
+        """Test: Sin respuesta por frame; un ack cada GPS_DEVICE_ACK_FRAMES frames"""
+        import json
+        from apps.gis_tracking import protocolo
+        
+        communicator, conectado = await self.conectar_dispositivo(await self.generar_token())
+        self.assertTrue(conectado)
+        
+        await communicator.send_to(text_data=json.dumps({
+            'seq': 1, 'lat': -17.7835, 'lng': -63.1815, 'timestamp': '2024-05-10T08:15:00-04:00'
+        }))
+        await communicator.send_to(text_data=json.dumps({'seq': 2, 'lat': 95, 'lng': 0}))
+        self.assertTrue(await communicator.receive_nothing(timeout=0.2))
+        
+        await communicator.send_to(bytes_data=(
+            protocolo.SEQ_DISPOSITIVO.pack(3) + protocolo.FIX_DISPOSITIVO.pack(0, -17.7835, -63.1815, 90)
+        ))
+        self.assertEqual(await communicator.receive_json_from(), {
+            'type': 'ack', 'confirmados': [1, 3], 'rechazados': [2], 'fallidos': [],
+        })
+        self.assertEqual(await self.contar_posiciones(), 2)
+        
+        # El timestamp del dispositivo se respeta; sin timestamp, hora de llegada
+        from channels.db import database_sync_to_async
+        timestamps = await database_sync_to_async(lambda: sorted(
+            PosicionGPS.objects.filter(nino=self.nino).values_list('timestamp', flat=True)
+        ))()
+        self.assertEqual(timestamps[0].isoformat(), '2024-05-10T12:15:00+00:00')
+        self.assertGreater(timestamps[1].year, 2024)
+        
+        await communicator.disconnect()
+    
+    @override_settings(
+        GPS_WS_WRITE_BEHIND=True, GPS_WS_FLUSH_MS=50, GPS_WS_FLUSH_FILAS=1000,
+        GPS_DEVICE_ACK_FRAMES=100, GPS_DEVICE_ACK_MS=200
+    )
+    async def test_ack_dispositivo_por_tiempo_tras_escritura(self):
+        """Test: Con write-behind el seq se confirma recién cuando el fix está en la BD"""
+        import json
+        from unittest import mock
+        from apps.gis_tracking import ingestion
+        
+        communicator, conectado = await self.conectar_dispositivo(await self.generar_token())
+        self.assertTrue(conectado)
+        
+        await communicator.send_to(text_data=json.dumps({'seq': 10, 'lat': -17.7835, 'lng': -63.1815}))
+        ack = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(ack['confirmados'], [10])
+        self.assertEqual(await self.contar_posiciones(), 1)
+        
+        # Si el lote no se puede escribir el seq vuelve como fallido (a reenviar)
+        buffer = ingestion.obtener_buffer()
+        buffer.max_reintentos = 0
+        with mock.patch.object(ingestion, '_guardar_lote', side_effect=RuntimeError('BD no disponible')):
+            await communicator.send_to(text_data=json.dumps({'seq': 11, 'lat': -17.7835, 'lng': -63.1815}))
+            ack = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(ack, {'type': 'ack', 'confirmados': [], 'rechazados': [], 'fallidos': [11]})
+        self.assertEqual(await self.contar_posiciones(), 1)
+        
+        await communicator.disconnect()
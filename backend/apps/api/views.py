@@ -1,26 +1,53 @@
 """
 ViewSets y vistas de la API REST
 """
+import base64
+import binascii
+
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
+from django.db.models import Prefetch, Q
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta
+from rest_framework.utils.encoders import JSONEncoder
 
 from apps.gis_tracking.models import CentroEducativo, Nino, PosicionGPS
-from apps.gis_tracking.services import TrackingService
+from apps.gis_tracking.services import BusquedaCercanosService, TrackingService
 from apps.alerts.models import Alerta, NotificacionTutor
 from apps.core.models import Tutor
 
+from .fast_serializers import (
+    AlertaRapido, NinoRapido, PosicionGPSRapido, SerializacionRapidaMixin
+)
 from .serializers import (
     CentroEducativoSerializer, NinoSerializer, PosicionGPSSerializer,
     PosicionGPSSimpleSerializer, AlertaSerializer, NotificacionTutorSerializer, 
-    TutorSerializer, RegistrarPosicionSerializer, EstadoNinoSerializer,
-    ActualizarFirebaseTokenSerializer
+    TutorSerializer, RegistrarPosicionSerializer, RegistrarPosicionesLoteSerializer,
+    EstadoNinoSerializer, ActualizarFirebaseTokenSerializer, ResumenPosicionSerializer
 )
 
 
+def _alertas_con_relaciones():
+    """
+    Alertas con todo lo que recorre AlertaSerializer en consultas fijas:
+    una con JOINs (niño, centro, tutor, usuario) y un prefetch de la
+    posición GPS con su niño y la distancia al centro ya calculada en SQL
+    """
+    return Alerta.objects.select_related(
+        'nino__centro_educativo',
+        'nino__tutor_principal__usuario',
+    ).prefetch_related(
+        Prefetch(
+            'posicion_gps',
+            queryset=PosicionGPS.objects.select_related('nino').con_distancia_centro()
+        )
+    )
+
+
 class CentroEducativoViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API para consultar centros educativos
@@ -32,7 +59,7 @@ class CentroEducativoViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
 
-class NinoViewSet(viewsets.ReadOnlyModelViewSet):
+class NinoViewSet(SerializacionRapidaMixin, viewsets.ReadOnlyModelViewSet):
     """
     API para consultar niños
     GET /api/ninos/ - Listar
@@ -40,11 +67,13 @@ class NinoViewSet(viewsets.ReadOnlyModelViewSet):
     GET /api/ninos/{id}/estado/ - Estado actual del niño
     GET /api/ninos/{id}/historial/ - Historial de posiciones
     POST /api/ninos/{id}/registrar_posicion/ - Registrar nueva posición GPS
+    POST /api/ninos/{id}/posiciones/batch/ - Registrar lote de posiciones GPS
     """
     queryset = Nino.objects.filter(activo=True).select_related(
         'centro_educativo', 'tutor_principal'
     )
     serializer_class = NinoSerializer
+    serializador_rapido = NinoRapido
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['centro_educativo', 'tutor_principal', 'tracking_activo']
@@ -62,7 +91,7 @@ class NinoViewSet(viewsets.ReadOnlyModelViewSet):
         alertas_activas = Alerta.objects.filter(
             nino=nino,
             estado__in=['PENDIENTE', 'ENVIADA']
-        ).count()
+        ).exclude(tipo_alerta__in=Alerta.TIPOS_INFORMATIVOS).count()
         
         data = {
             'nino': NinoSerializer(nino).data,
@@ -80,20 +109,92 @@ class NinoViewSet(viewsets.ReadOnlyModelViewSet):
         """
         Obtiene historial de posiciones del niño
         GET /api/ninos/{id}/historial/?dias=1
+        GET /api/ninos/{id}/historial/?dias=90&resumido=true - Resúmenes por minuto
+            (las posiciones crudas solo se conservan GPS_RETENCION_DIAS_CRUDOS días)
+        
+        Para ventanas grandes (memoria constante):
+        - ?limite=500[&cursor=...] - Paginado por cursor (timestamp, id);
+          la respuesta incluye "siguiente_cursor"
+        - ?formato=ndjson | geojson - Respuesta en streaming (una posición
+          por línea o un FeatureCollection), leída de la BD por bloques
         """
         nino = self.get_object()
         
-        # Parámetro de días (por defecto 1 día)
-        dias = int(request.query_params.get('dias', 1))
+        try:
+            # Parámetro de días (por defecto 1 día)
+            dias = int(request.query_params.get('dias', 1))
+            limite = request.query_params.get('limite')
+            limite = int(limite) if limite else None
+            cursor = request.query_params.get('cursor')
+            despues_de = self._decodificar_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return Response(
+                {'error': f'Parámetros inválidos: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        formato = request.query_params.get('formato')
+        if formato not in (None, 'ndjson', 'geojson'):
+            return Response(
+                {'error': 'formato debe ser "ndjson" o "geojson"'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if limite is not None and not (1 <= limite <= 1000):
+            return Response(
+                {'error': 'limite debe estar entre 1 y 1000'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         fecha_inicio = timezone.now() - timedelta(days=dias)
         
+        if request.query_params.get('resumido', '').lower() in ('1', 'true'):
+            resumenes = TrackingService.obtener_historial_resumido(
+                nino.id,
+                fecha_inicio=fecha_inicio
+            )
+            return Response(ResumenPosicionSerializer(resumenes, many=True).data)
+        
         posiciones = TrackingService.obtener_historial_posiciones(
             nino.id,
-            fecha_inicio=fecha_inicio
-        )
+            fecha_inicio=fecha_inicio,
+            despues_de=despues_de
+        ).select_related('nino').con_distancia_centro()
         
-        serializer = PosicionGPSSerializer(posiciones, many=True)
-        return Response(serializer.data)
+        if formato:
+            if limite is not None:
+                posiciones = posiciones[:limite]
+            return StreamingHttpResponse(
+                _stream_posiciones(posiciones, formato),
+                content_type=CONTENT_TYPE_STREAM[formato]
+            )
+        
+        if limite is None:
+            serializer = PosicionGPSSerializer(posiciones, many=True)
+            return Response(serializer.data)
+        
+        # Se pide una fila extra para saber si hay página siguiente
+        pagina = list(posiciones[:limite + 1])
+        siguiente_cursor = None
+        if len(pagina) > limite:
+            pagina = pagina[:limite]
+            siguiente_cursor = self._codificar_cursor(pagina[-1].timestamp, pagina[-1].id)
+        
+        serializer = PosicionGPSSerializer(pagina, many=True)
+        return Response({**serializer.data, 'siguiente_cursor': siguiente_cursor})
+    
+    @staticmethod
+    def _codificar_cursor(timestamp, posicion_id):
+        """Cursor opaco con el (timestamp, id) de la última posición entregada"""
+        return base64.urlsafe_b64encode(f'{timestamp.isoformat()}|{posicion_id}'.encode()).decode()
+    
+    @staticmethod
+    def _decodificar_cursor(cursor):
+        try:
+            timestamp, posicion_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            return datetime.fromisoformat(timestamp), int(posicion_id)
+        except (binascii.Error, UnicodeDecodeError) as e:
+            raise ValueError(f'cursor inválido ({e})')
     
     @action(detail=True, methods=['post'])
     def registrar_posicion(self, request, pk=None):
@@ -134,22 +235,61 @@ class NinoViewSet(viewsets.ReadOnlyModelViewSet):
                 {'error': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
+    
+    @action(detail=True, methods=['post'], url_path='posiciones/batch')
+    def registrar_posiciones_lote(self, request, pk=None):
+        """
+        Registra un lote de posiciones GPS acumuladas por el dispositivo
+        POST /api/ninos/{id}/posiciones/batch/
+        Body: {
+            "posiciones": [
+                {"latitud": -17.7833, "longitud": -63.1812,
+                 "timestamp": "2024-05-10T08:15:00-04:00", "nivel_bateria": 85},
+                ...
+            ]
+        }
+        """
+        nino = self.get_object()
+        
+        serializer = RegistrarPosicionesLoteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            posiciones, alertas = TrackingService.registrar_posiciones_lote(
+                nino_id=nino.id,
+                posiciones=serializer.validated_data['posiciones'],
+            )
+            
+            return Response({
+                'registradas': len(posiciones),
+                'fuera_area': sum(1 for p in posiciones if not p.dentro_area_segura),
+                'alertas_generadas': [alerta.id for alerta in alertas],
+                'ultima_posicion': PosicionGPSSimpleSerializer(posiciones[-1]).data,
+            }, status=status.HTTP_201_CREATED)
+        
+        except Exception as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
 
-class PosicionGPSViewSet(viewsets.ReadOnlyModelViewSet):
+class PosicionGPSViewSet(SerializacionRapidaMixin, viewsets.ReadOnlyModelViewSet):
     """
     API para consultar posiciones GPS
     GET /api/posiciones/ - Listar posiciones recientes
     GET /api/posiciones/{id}/ - Detalle
     """
-    queryset = PosicionGPS.objects.select_related('nino').order_by('-timestamp')[:100]
+    queryset = PosicionGPS.objects.select_related('nino').con_distancia_centro().order_by('-timestamp')[:100]
     serializer_class = PosicionGPSSerializer
+    serializador_rapido = PosicionGPSRapido
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['nino', 'dentro_area_segura']
 
 
-class AlertaViewSet(viewsets.ModelViewSet):
+class AlertaViewSet(SerializacionRapidaMixin, viewsets.ModelViewSet):
     """
     API para gestionar alertas
     GET /api/alertas/ - Listar alertas
@@ -158,8 +298,9 @@ class AlertaViewSet(viewsets.ModelViewSet):
     POST /api/alertas/{id}/marcar_leida/ - Marcar como leída
     POST /api/alertas/{id}/resolver/ - Resolver alerta
     """
-    queryset = Alerta.objects.select_related('nino', 'posicion_gps').order_by('-fecha_creacion')
+    queryset = _alertas_con_relaciones().order_by('-fecha_creacion')
     serializer_class = AlertaSerializer
+    serializador_rapido = AlertaRapido
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['nino', 'tipo_alerta', 'estado']
@@ -193,30 +334,28 @@ class AlertaViewSet(viewsets.ModelViewSet):
         )
 
 
-class MisAlertasViewSet(viewsets.ReadOnlyModelViewSet):
+class MisAlertasViewSet(SerializacionRapidaMixin, viewsets.ReadOnlyModelViewSet):
     """
     API para que los tutores vean sus alertas
     GET /api/mis-alertas/ - Alertas del tutor autenticado
     """
     serializer_class = AlertaSerializer
+    serializador_rapido = AlertaRapido
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
         """Filtra alertas según el tutor autenticado"""
         user = self.request.user
         
-        try:
-            tutor = Tutor.objects.get(usuario=user)
-            # Alertas de niños donde es tutor principal o adicional
-            ninos_ids = list(tutor.ninos_principal.values_list('id', flat=True))
-            ninos_ids.extend(tutor.ninos_adicional.values_list('id', flat=True))
-            
-            return Alerta.objects.filter(
-                nino_id__in=ninos_ids
-            ).order_by('-fecha_creacion')
+        # Alertas de niños donde es tutor principal o adicional, resuelto
+        # en la misma consulta (un usuario sin perfil de tutor no tiene niños)
+        ninos = Nino.objects.filter(
+            Q(tutor_principal__usuario=user) | Q(tutores_adicionales__usuario=user)
+        ).values('id')
         
-        except Tutor.DoesNotExist:
-            return Alerta.objects.none()
+        return _alertas_con_relaciones().filter(
+            nino_id__in=ninos
+        ).order_by('-fecha_creacion')
 
 
 class ConfiguracionViewSet(viewsets.ViewSet):
@@ -230,17 +369,24 @@ class ConfiguracionViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['post'])
     def actualizar_firebase_token(self, request):
         """
-        Actualiza el token de Firebase del usuario
+        Registra el token de Firebase de un dispositivo del usuario
         POST /api/configuracion/actualizar_firebase_token/
-        Body: {"firebase_token": "token..."}
+        Body: {"firebase_token": "token...", "plataforma": "ANDROID", "dispositivo": "id"}
         """
+        from apps.alerts.models import DeviceToken
+        
         serializer = ActualizarFirebaseTokenSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         user = request.user
-        user.firebase_token = serializer.validated_data['firebase_token']
-        user.save()
+        datos = serializer.validated_data
+        DeviceToken.registrar(
+            user, datos['firebase_token'], datos['plataforma'], datos['dispositivo']
+        )
+        # Compatibilidad: último token registrado (los envíos usan DeviceToken)
+        user.firebase_token = datos['firebase_token']
+        user.save(update_fields=['firebase_token'])
         
         return Response(
             {'mensaje': 'Token actualizado exitosamente'},
@@ -280,24 +426,29 @@ class BusquedaCercanosViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'], url_path='ninos-cercanos/(?P<lat>[-\d.]+)/(?P<lng>[-\d.]+)')
     def ninos_cercanos(self, request, lat=None, lng=None):
         """
-        Busca niños cercanos a una ubicación específica usando ST_Distance_Sphere
+        Busca niños cercanos a una ubicación específica (última posición)
         
         Parámetros:
         - lat: Latitud del centro de búsqueda
         - lng: Longitud del centro de búsqueda  
         - radius: Radio de búsqueda en metros (query param, default 500m)
+        - limit: Máximo de niños por página (query param, opcional)
+        - cursor: Cursor de la página siguiente (query param, opcional)
+        - formato: "completo" (default) o "compacto" (arreglo de arreglos,
+          para mapas con miles de marcadores; ver "columnas" en la respuesta)
         
         Ejemplo:
-        GET /api/busqueda-cercanos/ninos-cercanos/-17.7833/-63.1821/?radius=1000
+        GET /api/busqueda-cercanos/ninos-cercanos/-17.7833/-63.1821/?radius=1000&limit=50
         """
-        from django.db import connection
-        import re
-        
         try:
             # Validar y convertir parámetros
             lat = float(lat)
             lng = float(lng)
             radius = int(request.query_params.get('radius', 500))
+            limit = request.query_params.get('limit')
+            limit = int(limit) if limit else None
+            cursor = request.query_params.get('cursor')
+            formato = request.query_params.get('formato', 'completo')
             
             # Validar rangos
             if not (-90 <= lat <= 90) or not (-180 <= lng <= 180):
@@ -312,88 +463,38 @@ class BusquedaCercanosViewSet(viewsets.ViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Query espacial con ST_Distance usando geography para metros
-            query = """
-                SELECT
-                    n.id,
-                    n.nombre,
-                    n.apellido_paterno,
-                    n.apellido_materno,
-                    ST_AsText(p.ubicacion) AS ubicacion,
-                    ST_Distance(
-                        p.ubicacion::geography, 
-                        ST_GeomFromText('POINT(%s %s)', 4326)::geography
-                    ) AS distancia_metros,
-                    p.timestamp,
-                    p.dentro_area_segura,
-                    p.velocidad_kmh,
-                    p.precision_metros,
-                    p.nivel_bateria,
-                    ce.nombre AS kinder_nombre,
-                    ce.direccion AS kinder_direccion
-                FROM
-                    gis_tracking_nino n
-                INNER JOIN
-                    gis_tracking_posiciongps p ON n.id = p.nino_id
-                INNER JOIN
-                    gis_tracking_centroeducativo ce ON n.centro_educativo_id = ce.id
-                WHERE
-                    n.activo = TRUE
-                    AND p.timestamp = (
-                        SELECT MAX(timestamp) 
-                        FROM gis_tracking_posiciongps 
-                        WHERE nino_id = n.id
-                    )
-                    AND ST_Distance(
-                        p.ubicacion::geography, 
-                        ST_GeomFromText('POINT(%s %s)', 4326)::geography
-                    ) <= %s
-                ORDER BY
-                    distancia_metros ASC
-            """
+            if limit is not None and not (1 <= limit <= 1000):
+                return Response(
+                    {'error': 'limit debe estar entre 1 y 1000'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            if formato not in ('completo', 'compacto'):
+                return Response(
+                    {'error': 'formato debe ser "completo" o "compacto"'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            despues_de = self._decodificar_cursor(cursor) if cursor else None
+            
+            # Búsqueda KNN sobre la última posición de cada niño
+            # (se pide una fila extra para saber si hay página siguiente)
+            rows = BusquedaCercanosService.buscar(
+                lat, lng, radius,
+                limite=limit + 1 if limit is not None else None,
+                despues_de=despues_de,
+            )
             
-            with connection.cursor() as cursor:
-                cursor.execute(query, [lng, lat, lng, lat, radius])
-                rows = cursor.fetchall()
+            siguiente_cursor = None
+            if limit is not None and len(rows) > limit:
+                rows = rows[:limit]
+                siguiente_cursor = self._codificar_cursor(rows[-1][6], rows[-1][0])
             
-            # Procesar resultados
-            ninos_cercanos = []
-            for row in rows:
-                # Parsear geometría POINT(lng lat)
-                position_text = row[4]
-                match = re.match(r'POINT\(([-\d.]+) ([-\d.]+)\)', position_text)
-                
-                if match:
-                    lng_nino = float(match.group(1))
-                    lat_nino = float(match.group(2))
-                    
-                    # Construir nombre completo
-                    apellido_completo = f"{row[2]} {row[3]}".strip() if row[3] else row[2]
-                    
-                    ninos_cercanos.append({
-                        'id': row[0],
-                        'nombre': row[1],
-                        'apellido_paterno': row[2],
-                        'apellido_materno': row[3] or '',
-                        'nombre_completo': f"{row[1]} {apellido_completo}",
-                        'posicion': {
-                            'lat': lat_nino,
-                            'lng': lng_nino
-                        },
-                        'distancia_metros': round(row[5], 2),
-                        'distancia_km': round(row[5] / 1000, 3),
-                        'ultima_actualizacion': row[6].isoformat() if row[6] else None,
-                        'dentro_area_segura': row[7],
-                        'velocidad_kmh': round(row[8], 1) if row[8] else 0,
-                        'precision_metros': round(row[9], 1) if row[9] else None,
-                        'nivel_bateria': row[10] if row[10] else 0,
-                        'kinder': {
-                            'nombre': row[11],
-                            'direccion': row[12]
-                        },
-                        'estado': '🟢 Seguro' if row[7] else '🔴 Fuera del área',
-                        'estado_color': 'green' if row[7] else 'red'
-                    })
+            # Construir respuesta (sin parsear WKT: la consulta trae lat/lng)
+            if formato == 'compacto':
+                ninos_cercanos = [_nino_cercano_compacto(*row) for row in rows]
+            else:
+                ninos_cercanos = [_nino_cercano(*row) for row in rows]
             
             return Response({
                 'centro_busqueda': {
@@ -402,6 +503,8 @@ class BusquedaCercanosViewSet(viewsets.ViewSet):
                 },
                 'radio_metros': radius,
                 'total_encontrados': len(ninos_cercanos),
+                'siguiente_cursor': siguiente_cursor,
+                **({'columnas': COLUMNAS_COMPACTO} if formato == 'compacto' else {}),
                 'ninos': ninos_cercanos
             }, status=status.HTTP_200_OK)
             
@@ -415,3 +518,102 @@ class BusquedaCercanosViewSet(viewsets.ViewSet):
                 {'error': f'Error en la búsqueda: {str(e)}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+    
+    @staticmethod
+    def _codificar_cursor(distancia, nino_id):
+        """Cursor opaco con la (distancia, id) de la última fila entregada"""
+        return base64.urlsafe_b64encode(f'{distancia!r}:{nino_id}'.encode()).decode()
+    
+    @staticmethod
+    def _decodificar_cursor(cursor):
+        try:
+            distancia, nino_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+            return float(distancia), int(nino_id)
+        except (binascii.Error, UnicodeDecodeError) as e:
+            raise ValueError(f'cursor inválido ({e})')
+
+
+CONTENT_TYPE_STREAM = {
+    'ndjson': 'application/x-ndjson',
+    'geojson': 'application/geo+json',
+}
+
+
+def _stream_posiciones(posiciones, formato):
+    """
+    Genera el historial serializado por bloques de GPS_HISTORIAL_CHUNK_SIZE
+    posiciones, leyendo la BD con un cursor del lado del servidor
+    """
+    encoder = JSONEncoder()
+    tamano = settings.GPS_HISTORIAL_CHUNK_SIZE
+    bloque = []
+    
+    if formato == 'geojson':
+        yield '{"type": "FeatureCollection", "features": ['
+    
+    primera = True
+    for posicion in posiciones.iterator(chunk_size=tamano):
+        feature = encoder.encode(PosicionGPSSerializer(posicion).data)
+        if formato == 'ndjson':
+            bloque.append(feature + '\n')
+        else:
+            bloque.append(feature if primera else ',' + feature)
+        primera = False
+        
+        if len(bloque) >= tamano:
+            yield ''.join(bloque)
+            bloque = []
+    
+    if bloque:
+        yield ''.join(bloque)
+    if formato == 'geojson':
+        yield ']}'
+
+
+# Columnas de la respuesta compacta de ninos_cercanos (una fila por niño)
+COLUMNAS_COMPACTO = [
+    'id', 'nombre_completo', 'lat', 'lng', 'distancia_metros',
+    'dentro_area_segura', 'nivel_bateria',
+]
+
+
+def _nino_cercano(nino_id, nombre, apellido_paterno, apellido_materno, lat, lng,
+                  distancia, timestamp, dentro, velocidad, precision, bateria,
+                  kinder_nombre, kinder_direccion):
+    """Fila de BusquedaCercanosService.buscar -> dict de la respuesta completa"""
+    apellido_completo = f"{apellido_paterno} {apellido_materno}".strip() if apellido_materno else apellido_paterno
+    return {
+        'id': nino_id,
+        'nombre': nombre,
+        'apellido_paterno': apellido_paterno,
+        'apellido_materno': apellido_materno or '',
+        'nombre_completo': f"{nombre} {apellido_completo}",
+        'posicion': {
+            'lat': lat,
+            'lng': lng
+        },
+        'distancia_metros': round(distancia, 2),
+        'distancia_km': round(distancia / 1000, 3),
+        'ultima_actualizacion': timestamp.isoformat() if timestamp else None,
+        'dentro_area_segura': dentro,
+        'velocidad_kmh': round(velocidad, 1) if velocidad else 0,
+        'precision_metros': round(precision, 1) if precision else None,
+        'nivel_bateria': bateria if bateria else 0,
+        'kinder': {
+            'nombre': kinder_nombre,
+            'direccion': kinder_direccion
+        },
+        'estado': '🟢 Seguro' if dentro else '🔴 Fuera del área',
+        'estado_color': 'green' if dentro else 'red'
+    }
+
+
+def _nino_cercano_compacto(nino_id, nombre, apellido_paterno, apellido_materno, lat, lng,
+                           distancia, timestamp, dentro, velocidad, precision, bateria,
+                           kinder_nombre, kinder_direccion):
+    """Fila de BusquedaCercanosService.buscar -> arreglo en el orden de COLUMNAS_COMPACTO"""
+    apellido_completo = f"{apellido_paterno} {apellido_materno}".strip() if apellido_materno else apellido_paterno
+    return [
+        nino_id, f"{nombre} {apellido_completo}", lat, lng,
+        round(distancia, 2), dentro, bateria if bateria else 0,
+    ]
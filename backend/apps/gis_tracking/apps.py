@@ -5,3 +5,6 @@ class GisTrackingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.gis_tracking'
     verbose_name = 'GIS Tracking - Monitoreo Geoespacial'
+    
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -2,16 +2,95 @@
 WebSocket Consumers para tracking GPS en tiempo real.
 
 Maneja las conexiones WebSocket entre el backend y las apps móviles/web
-para actualizaciones GPS en tiempo real.
+para actualizaciones GPS en tiempo real:
+
+- GPSTrackingConsumer (ws/tracking/tutor/<tutor_id>/): tutores que ven
+  el mapa; solo lectura
+- DispositivoGPSConsumer (ws/device/<dispositivo_id>/): el celular o
+  smartwatch del niño envía sus fixes
 """
+import asyncio
 import json
+import logging
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.utils import timezone
-from apps.core.models import Nino, Tutor
-from apps.gis_tracking.models import PosicionGPS
+from apps.core.models import Tutor
+from apps.gis_tracking import protocolo
+from apps.gis_tracking.geofence import geofence_cache
+from apps.gis_tracking.ingestion import ErrorEscrituraGPS, obtener_buffer
+from apps.gis_tracking.models import Nino, PosicionGPS
+from apps.gis_tracking.transiciones import FUERA
 from django.contrib.gis.geos import Point
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+
+def grupo_nino(nino_id):
+    """Grupo de Channels de un niño: lo reciben todos sus tutores conectados"""
+    return f'tracking_nino_{nino_id}'
+
+
+async def registrar_fixes(channel_layer, nino_id, centro_id, fixes):
+    """
+    Evalúa los fixes de un niño contra la geocerca (en memoria) y los
+    guarda: en un único bulk_create o encolados en el buffer write-behind.
+    
+    Se transmite solo el fix más reciente: un lote de fixes acumulados
+    sin conexión no mueve el mapa punto por punto.
+    
+    Args:
+        fixes: Tuplas (lat, lng, nivel_bateria, timestamp o None) de
+            protocolo.py
+    
+    Returns:
+        None si los fixes ya están en la BD, o (write-behind) un future
+        que se resuelve cuando el buffer los escriba
+    """
+    geocerca = await geofence_cache.aobtener(centro_id)
+    llegada = timezone.now()
+    posiciones = []
+    for lat, lng, nivel_bateria, timestamp in fixes:
+        ubicacion = Point(lng, lat, srid=4326)
+        posicion = PosicionGPS(
+            nino_id=nino_id,
+            ubicacion=ubicacion,
+            nivel_bateria=nivel_bateria,
+            timestamp=timestamp or llegada,
+        )
+        # Zona para la histéresis de la máquina de estados (transiciones.py)
+        posicion.zona = geocerca.zona(ubicacion)
+        posicion.dentro_area_segura = posicion.zona != FUERA
+        posiciones.append(posicion)
+    
+    if not settings.GPS_WS_WRITE_BEHIND:
+        await guardar_posiciones(posiciones)
+    
+    ultima = max(posiciones, key=lambda posicion: posicion.timestamp)
+    # JSON y frame binario codificados una sola vez para todo el grupo
+    await channel_layer.group_send(
+        grupo_nino(nino_id),
+        protocolo.evento_gps_update(
+            nino_id, ultima.ubicacion.y, ultima.ubicacion.x,
+            ultima.nivel_bateria, ultima.dentro_area_segura, ultima.timestamp
+        )
+    )
+    
+    if not settings.GPS_WS_WRITE_BEHIND:
+        return None
+    buffer = obtener_buffer()
+    return asyncio.gather(*[await buffer.agregar(posicion) for posicion in posiciones])
+
+
+@database_sync_to_async
+def guardar_posiciones(posiciones):
+    from apps.gis_tracking.services import TrackingService
+    
+    TrackingService.guardar_posiciones(posiciones)
 
 
 class GPSTrackingConsumer(AsyncWebsocketConsumer):
@@ -20,8 +99,36 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
     
     Cada tutor se conecta a un canal de tracking donde recibe
     actualizaciones en tiempo real de las posiciones de sus niños.
+    
+    Al conectarse, el tutor se suscribe al grupo de cada uno de sus niños
+    (tracking_nino_{id}, como principal o adicional): cada fix cuesta un
+    solo group_send sin importar cuántos tutores tenga el niño.
+    
+    Es de solo lectura: los fixes llegan por DispositivoGPSConsumer.
+    Mientras GPS_WS_INGESTA_TUTOR siga activo se aceptan además los
+    gps_update de la app Flutter anterior a ws/device/ (obsoleto, ver
+    gps_update_legado).
+    
+    Si el cliente ofrece el subprotocolo protocolo.SUBPROTOCOLO_BINARIO,
+    los gps_update llegan como frames binarios (ver protocolo.py).
+    
+    Coalescing: los gps_update no se envían uno por uno. Se guarda solo el
+    último de cada niño y se envían como máximo max_hz veces por segundo
+    (GPS_WS_HZ_DEFECTO, o lo que pida el cliente con un mensaje
+    {"type": "subscribe", "max_hz": 2}). Lo pendiente de una conexión
+    nunca supera un mensaje por niño: un cliente lento recibe menos
+    posiciones intermedias en vez de acumular una cola sin límite.
     """
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.binario = False
+        self.max_hz = settings.GPS_WS_HZ_DEFECTO
+        self.pendientes = {}  # nino_id -> último evento gps_position_update
+        self._envio = None
+        self.centros = {}  # nino_id -> centro_educativo_id (gps_update legado)
+        self._aviso_legado = False
+    
     async def connect(self):
         """Acepta la conexión WebSocket y une al tutor a su grupo."""
         self.user = self.scope['user']
@@ -46,14 +153,20 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
         # Nombre del grupo de tracking para este tutor
         self.room_group_name = f'tracking_tutor_{self.tutor_id}'
         
-        # Unirse al grupo de Channels
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
+        # Grupos de Channels: el del tutor y uno por cada niño a su cargo
+        # (si cambian sus niños, los ve al reconectarse)
+        self.ninos_ids = set(await self.get_ninos_ids())
+        self.grupos = [self.room_group_name] + [
+            grupo_nino(nino_id) for nino_id in self.ninos_ids
+        ]
+        await asyncio.gather(*(
+            self.channel_layer.group_add(grupo, self.channel_name)
+            for grupo in self.grupos
+        ))
         
-        # Aceptar la conexión
-        await self.accept()
+        # Aceptar la conexión (con el formato binario si el cliente lo ofrece)
+        self.binario = protocolo.SUBPROTOCOLO_BINARIO in self.scope.get('subprotocols', [])
+        await self.accept(subprotocol=protocolo.SUBPROTOCOLO_BINARIO if self.binario else None)
         
         print(f'✅ Tutor {self.tutor_id} conectado al tracking en tiempo real')
         
@@ -66,11 +179,14 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
     
     async def disconnect(self, close_code):
         """Desconecta del grupo cuando se cierra el WebSocket."""
-        if hasattr(self, 'room_group_name'):
-            await self.channel_layer.group_discard(
-                self.room_group_name,
-                self.channel_name
-            )
+        if self._envio is not None:
+            self._envio.cancel()
+        
+        if hasattr(self, 'grupos'):
+            await asyncio.gather(*(
+                self.channel_layer.group_discard(grupo, self.channel_name)
+                for grupo in self.grupos
+            ))
             print(f'❌ Tutor {self.tutor_id} desconectado del tracking')
     
     async def receive(self, text_data):
@@ -78,8 +194,10 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
         Recibe mensajes del cliente WebSocket.
         
         Tipos de mensajes soportados:
-        - gps_update: Actualización de posición GPS desde dispositivo del niño
+        - gps_update: Posición de un niño del tutor (obsoleto, ver
+          gps_update_legado)
         - ping: Mantener conexión viva
+        - subscribe: Frecuencia máxima de actualizaciones ({"max_hz": 1})
         - test_markers: Enviar marcadores de prueba
         """
         try:
@@ -87,12 +205,19 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
             message_type = data.get('type')
             
             if message_type == 'gps_update':
-                await self.handle_gps_update(data)
+                await self.gps_update_legado(data)
             elif message_type == 'ping':
                 await self.send(text_data=json.dumps({
                     'type': 'pong',
                     'timestamp': timezone.now().isoformat()
                 }))
+            elif message_type == 'subscribe':
+                max_hz = float(data.get('max_hz', settings.GPS_WS_HZ_DEFECTO))
+                self.max_hz = min(settings.GPS_WS_HZ_MAXIMO, max(settings.GPS_WS_HZ_MINIMO, max_hz))
+                await self.send(text_data=json.dumps({
+                    'type': 'subscribed',
+                    'max_hz': self.max_hz
+                }))
             elif message_type == 'test_markers':
                 # Enviar marcadores de prueba directamente
                 await self.send(text_data=json.dumps({
@@ -130,57 +255,90 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
                 'message': f'Error al procesar mensaje: {str(e)}'
             }))
     
-    async def handle_gps_update(self, data):
+    async def gps_update_legado(self, data):
         """
-        Procesa una actualización GPS del dispositivo del niño.
+        Fix enviado por el visor, como lo hace la app Flutter anterior a
+        ws/device/ ({"type": "gps_update", "nino_id", "lat", "lng",
+        "nivel_bateria"})
         
-        Guarda la posición en la BD y la transmite a todos los tutores conectados.
+        Obsoleto: solo con GPS_WS_INGESTA_TUTOR=True y solo para los niños
+        del tutor. Se guarda y se transmite igual que un fix del
+        dispositivo, pero sin ack.
         """
-        try:
-            nino_id = data.get('nino_id')
-            lat = data.get('lat')
-            lng = data.get('lng')
-            nivel_bateria = data.get('nivel_bateria', 100)
-            
-            if not all([nino_id, lat is not None, lng is not None]):
-                await self.send(text_data=json.dumps({
-                    'type': 'error',
-                    'message': 'Faltan datos requeridos (nino_id, lat, lng)'
-                }))
-                return
-            
-            # Guardar posición en la base de datos
-            posicion = await self.save_gps_position(
-                nino_id, lat, lng, nivel_bateria
+        if not settings.GPS_WS_INGESTA_TUTOR:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Las posiciones se envían desde el dispositivo por ws/device/<dispositivo_id>/'
+            }))
+            return
+        if not self._aviso_legado:
+            self._aviso_legado = True
+            logger.warning(
+                f'⚠️ Tutor {self.tutor_id} envía gps_update por ws/tracking/ (obsoleto): '
+                f'migrar el dispositivo a ws/device/<dispositivo_id>/'
             )
-            
-            if posicion:
-                # Emitir actualización a todos los tutores conectados a este niño
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'gps_position_update',
-                        'nino_id': nino_id,
-                        'lat': lat,
-                        'lng': lng,
-                        'nivel_bateria': nivel_bateria,
-                        'dentro_area': posicion['dentro_area'],
-                        'timestamp': posicion['timestamp']
-                    }
-                )
         
-        except Exception as e:
+        nino_id = data.get('nino_id')
+        if nino_id not in self.ninos_ids:
             await self.send(text_data=json.dumps({
                 'type': 'error',
-                'message': f'Error al procesar GPS: {str(e)}'
+                'message': f'El niño {nino_id} no está a cargo de este tutor'
             }))
+            return
+        try:
+            fix = protocolo.decodificar_fix(data)
+        except protocolo.FrameInvalido as e:
+            await self.send(text_data=json.dumps({'type': 'error', 'message': str(e)}))
+            return
+        
+        if nino_id not in self.centros:
+            self.centros[nino_id] = await self.get_centro_id(nino_id)
+        escritura = await registrar_fixes(self.channel_layer, nino_id, self.centros[nino_id], [fix])
+        if escritura is not None:
+            escritura.add_done_callback(self._escritura_legada)
+    
+    def _escritura_legada(self, escritura):
+        # Sin ack: un lote descartado por el buffer solo queda en el log
+        if not escritura.cancelled() and escritura.exception() is not None:
+            logger.warning(f'⚠️ Fix legado del tutor {self.tutor_id} sin escribir: {escritura.exception()}')
     
     async def gps_position_update(self, event):
+        """
+        Recibe una actualización GPS del grupo de un niño.
+        
+        Reemplaza la pendiente del mismo niño; si no hay un envío en curso
+        se envía de inmediato y las siguientes esperan al próximo turno.
+        """
+        self.pendientes[event['nino_id']] = event
+        if self._envio is None:
+            self._envio = asyncio.ensure_future(self._enviar_pendientes())
+    
+    async def _enviar_pendientes(self):
+        """Envía lo pendiente y espera 1/max_hz antes de la siguiente tanda."""
+        try:
+            while self.pendientes:
+                tanda, self.pendientes = self.pendientes, {}
+                for event in tanda.values():
+                    await self.enviar_gps_update(event)
+                await asyncio.sleep(1 / self.max_hz)
+        finally:
+            self._envio = None
+    
+    async def enviar_gps_update(self, event):
         """
         Envía actualización GPS al cliente WebSocket.
         
-        Este método es llamado cuando se envía un mensaje al grupo.
+        Los eventos de protocolo.evento_gps_update traen el mensaje ya
+        serializado y se reenvía tal cual; los que solo traen los campos
+        (scripts de prueba) se serializan aquí.
         """
+        if self.binario and 'frame' in event:
+            # Mismos bytes para todos los tutores del grupo
+            await self.send(bytes_data=event['frame'])
+            return
+        if 'texto' in event:
+            await self.send(text_data=event['texto'])
+            return
         await self.send(text_data=json.dumps({
             'type': 'gps_update',
             'nino_id': event['nino_id'],
@@ -195,6 +353,9 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
         """
         Envía alerta en tiempo real cuando un niño sale del área.
         """
+        if 'texto' in event:
+            await self.send(text_data=event['texto'])
+            return
         await self.send(text_data=json.dumps({
             'type': 'alert',
             'nino_id': event['nino_id'],
@@ -203,6 +364,19 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
             'timestamp': event['timestamp']
         }))
     
+    @database_sync_to_async
+    def get_ninos_ids(self):
+        """IDs de los niños del tutor (principal o adicional), en una consulta."""
+        return list(
+            Nino.objects.filter(
+                Q(tutor_principal_id=self.tutor_id) | Q(tutores_adicionales=self.tutor_id)
+            ).values_list('id', flat=True).distinct()
+        )
+    
+    @database_sync_to_async
+    def get_centro_id(self, nino_id):
+        return Nino.objects.values_list('centro_educativo_id', flat=True).get(id=nino_id)
+    
     @database_sync_to_async
     def verify_tutor_access(self):
         """Verifica que el usuario tenga acceso a este tutor."""
@@ -211,42 +385,160 @@ class GPSTrackingConsumer(AsyncWebsocketConsumer):
             return True
         except Tutor.DoesNotExist:
             return False
+
+
+class DispositivoGPSConsumer(AsyncWebsocketConsumer):
+    """
+    Ingesta de fixes GPS desde el dispositivo de un niño.
     
-    @database_sync_to_async
-    def save_gps_position(self, nino_id, lat, lng, nivel_bateria):
-        """
-        Guarda la posición GPS en la base de datos.
+    El dispositivo se autentica con Nino.dispositivo_id (en la URL) y su
+    token (header "Authorization: Token <token>" o ?token=), generado con
+    `manage.py generar_token_dispositivo`. No hay usuario ni tutor: el
+    niño queda fijado al conectar.
+    
+    Cada frame trae un seq y uno o varios fixes, en JSON o binario (ver
+    protocolo.py). No se responde mensaje por mensaje: cada
+    GPS_DEVICE_ACK_FRAMES frames o GPS_DEVICE_ACK_MS milisegundos se envía
+    {"type": "ack", "confirmados": [seq...], "rechazados": [...],
+    "fallidos": [...]}:
+    
+    - confirmados: sus fixes ya están en la BD (con write-behind, recién
+      cuando el buffer los escribió); el dispositivo puede descartarlos
+    - rechazados: frame inválido; reenviarlo no sirve
+    - fallidos: no se pudo guardar; el dispositivo debe reenviarlo
+    """
+    
+    async def connect(self):
+        self.dispositivo_id = self.scope['url_route']['kwargs']['dispositivo_id']
         
-        Returns:
-            dict: Información de la posición guardada, o None si hay error
-        """
+        autenticado = await self.autenticar(self.token_de_scope(self.scope))
+        if autenticado is None:
+            logger.info(f'🚫 Dispositivo {self.dispositivo_id} rechazado: token inválido')
+            await self.close()
+            return
+        
+        self.nino_id, self.centro_id = autenticado
+        self.confirmados = []
+        self.rechazados = []
+        self.fallidos = []
+        self.sin_ack = 0
+        self.conectado = True
+        self._ack_diferido = None
+        self._confirmaciones = set()
+        
+        ofrecidos = self.scope.get('subprotocols', [])
+        await self.accept(
+            subprotocol=protocolo.SUBPROTOCOLO_BINARIO
+            if protocolo.SUBPROTOCOLO_BINARIO in ofrecidos else None
+        )
+        logger.info(f'📱 Dispositivo {self.dispositivo_id} (niño {self.nino_id}) conectado')
+    
+    async def disconnect(self, close_code):
+        if not getattr(self, 'conectado', False):
+            return
+        self.conectado = False
+        if self._ack_diferido is not None:
+            self._ack_diferido.cancel()
+        if settings.GPS_WS_WRITE_BEHIND:
+            # No perder posiciones encoladas por esta conexión
+            await obtener_buffer().flush()
+        logger.info(f'📴 Dispositivo {self.dispositivo_id} desconectado')
+    
+    async def receive(self, text_data=None, bytes_data=None):
+        """Registra los fixes del frame y transmite el más reciente."""
         try:
-            nino = Nino.objects.get(id=nino_id)
-            
-            # Crear punto geográfico
-            ubicacion = Point(lng, lat, srid=4326)
-            
-            # Verificar si está dentro del área del centro educativo
-            dentro_area = False
-            if nino.centro_educativo and nino.centro_educativo.area_permitida:
-                dentro_area = nino.centro_educativo.area_permitida.contains(ubicacion)
-            
-            # Guardar posición
-            posicion = PosicionGPS.objects.create(
-                nino=nino,
-                ubicacion=ubicacion,
-                nivel_bateria=nivel_bateria,
-                dentro_area_segura=dentro_area
-            )
-            
-            return {
-                'dentro_area': dentro_area,
-                'timestamp': posicion.timestamp.isoformat()
-            }
-        
-        except Nino.DoesNotExist:
-            print(f'❌ Niño {nino_id} no encontrado')
-            return None
-        except Exception as e:
-            print(f'❌ Error al guardar posición GPS: {str(e)}')
-            return None
+            if bytes_data is not None:
+                frame = protocolo.decodificar_binario(bytes_data)
+            else:
+                frame = protocolo.decodificar_json(text_data)
+            if frame is not None and len(frame.fixes) > settings.GPS_BATCH_MAX_POSICIONES:
+                raise protocolo.FrameInvalido(
+                    f'Más de {settings.GPS_BATCH_MAX_POSICIONES} fixes en un frame', frame.seq
+                )
+        except protocolo.FrameInvalido as e:
+            logger.info(f'⚠️ Frame inválido del dispositivo {self.dispositivo_id}: {e}')
+            if e.seq is not None:
+                self.rechazados.append(e.seq)
+                await self.contar()
+            return
+        
+        if frame is None:
+            # Ping: confirmar lo recibido hasta ahora
+            await self.enviar_ack()
+            return
+        
+        try:
+            escritura = await self.registrar_fixes(frame.fixes)
+        except Exception:
+            logger.exception(f'❌ Error al registrar GPS del dispositivo {self.dispositivo_id}')
+            self.fallidos.append(frame.seq)
+            await self.contar()
+            return
+        
+        if escritura is None:
+            self.confirmados.append(frame.seq)
+            await self.contar()
+        else:
+            # Write-behind: confirmar cuando el buffer haya escrito los fixes
+            tarea = asyncio.ensure_future(self._confirmar(frame.seq, escritura))
+            self._confirmaciones.add(tarea)
+            tarea.add_done_callback(self._confirmaciones.discard)
+    
+    async def registrar_fixes(self, fixes):
+        """Registra los fixes del niño del dispositivo (ver registrar_fixes())"""
+        return await registrar_fixes(self.channel_layer, self.nino_id, self.centro_id, fixes)
+    
+    async def _confirmar(self, seq, escritura):
+        try:
+            await escritura
+            self.confirmados.append(seq)
+        except ErrorEscrituraGPS:
+            logger.warning(f'⚠️ Frame {seq} del dispositivo {self.dispositivo_id} sin escribir')
+            self.fallidos.append(seq)
+        await self.contar()
+    
+    async def contar(self):
+        """Acumula frames sin ack y envía el ack por cantidad o por tiempo."""
+        if not self.conectado:
+            return
+        self.sin_ack += 1
+        if self.sin_ack >= settings.GPS_DEVICE_ACK_FRAMES:
+            await self.enviar_ack()
+        elif self._ack_diferido is None:
+            self._ack_diferido = asyncio.ensure_future(self._ack_por_tiempo())
+    
+    async def _ack_por_tiempo(self):
+        await asyncio.sleep(settings.GPS_DEVICE_ACK_MS / 1000)
+        self._ack_diferido = None
+        await self.enviar_ack()
+    
+    async def enviar_ack(self):
+        if self._ack_diferido is not None and self._ack_diferido is not asyncio.current_task():
+            self._ack_diferido.cancel()
+        self._ack_diferido = None
+        if not self.conectado:
+            return
+        self.sin_ack = 0
+        ack = {
+            'type': 'ack',
+            'confirmados': self.confirmados,
+            'rechazados': self.rechazados,
+            'fallidos': self.fallidos,
+        }
+        self.confirmados, self.rechazados, self.fallidos = [], [], []
+        await self.send(text_data=json.dumps(ack))
+    
+    @staticmethod
+    def token_de_scope(scope):
+        """Token del header Authorization ("Token ..." o "Bearer ...") o de ?token="""
+        for nombre, valor in scope.get('headers', []):
+            if nombre == b'authorization':
+                partes = valor.decode('latin1').split()
+                if len(partes) == 2 and partes[0].lower() in ('token', 'bearer'):
+                    return partes[1]
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+        return token[0] if token else None
+    
+    @database_sync_to_async
+    def autenticar(self, token):
+        return Nino.autenticar_dispositivo(self.dispositivo_id, token)
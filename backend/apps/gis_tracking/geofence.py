@@ -0,0 +1,166 @@
+"""
+Caché en memoria de geocercas (áreas seguras) de los centros educativos
+
+Cada posición GPS se evalúa contra el polígono del kinder. En lugar de
+leer el centro de la BD y reconstruir el polígono desde WKB en cada fix,
+se mantienen geometrías GEOS preparadas (`.prepared`) por centro.
+
+La caché se invalida con las señales post_save/post_delete de
+CentroEducativo (al confirmar la transacción). Para que los demás
+procesos (workers, daphne) también se enteren, cada centro tiene un sello
+de versión en la caché de Django que se revisa como máximo cada
+GEOFENCE_CACHE_VERSION_SEGUNDOS. Ese sello solo llega a otros procesos si
+la caché es compartida (CACHE_URL): con la caché local, un proceso sigue
+usando el área vieja hasta reiniciarse.
+"""
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .transiciones import BORDE, DENTRO, FUERA
+
+
+class Geocerca:
+    """Geometrías preparadas del área segura de un centro"""
+
+    __slots__ = (
+        'centro_id', 'version', 'generacion', 'area', 'area_con_margen', 'verificada_en'
+    )
+
+    def __init__(self, centro_id, version, generacion, area, area_con_margen=None):
+        self.centro_id = centro_id
+        self.version = version
+        self.generacion = generacion
+        self.area = area
+        self.area_con_margen = area_con_margen
+        self.verificada_en = time.monotonic()
+
+    def contiene(self, punto):
+        """True si el punto está dentro del área segura o de su margen"""
+        if self.area.contains(punto):
+            return True
+        return self.area_con_margen is not None and self.area_con_margen.contains(punto)
+
+    def zona(self, punto):
+        """
+        DENTRO (área estricta), BORDE (solo en el margen) o FUERA; la usa
+        la máquina de estados para la histéresis (ver transiciones.py)
+        """
+        if self.area.contains(punto):
+            return DENTRO
+        if self.area_con_margen is not None and self.area_con_margen.contains(punto):
+            return BORDE
+        return FUERA
+
+
+class GeofenceCache:
+    """
+    Caché de geocercas por centro educativo
+
+    Las geometrías preparadas de GEOS no son seguras entre hilos, así que
+    cada hilo (p. ej. el threadpool de database_sync_to_async) mantiene
+    su propia copia. Las invalidaciones dentro del proceso se propagan a
+    todos los hilos de inmediato mediante un contador de generación.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._generaciones = {}
+
+    @staticmethod
+    def _clave_version(centro_id):
+        return f'geocerca_version_{centro_id}'
+
+    @property
+    def _entradas(self):
+        entradas = getattr(self._local, 'entradas', None)
+        if entradas is None:
+            entradas = self._local.entradas = {}
+        return entradas
+
+    def obtener(self, centro_id):
+        """Obtiene la geocerca del centro, cargándola si no está o cambió"""
+        entrada = self.obtener_vigente(centro_id)
+        if entrada is None:
+            entrada = self._construir(*self._leer(centro_id))
+            self._entradas[centro_id] = entrada
+        return entrada
+
+    async def aobtener(self, centro_id):
+        """
+        Versión asíncrona de obtener() para consumers de Channels
+
+        Solo la lectura de la BD corre en el threadpool; la geometría se
+        prepara en el hilo que la va a usar.
+        """
+        entrada = self.obtener_vigente(centro_id)
+        if entrada is None:
+            datos = await sync_to_async(self._leer)(centro_id)
+            entrada = self._construir(*datos)
+            self._entradas[centro_id] = entrada
+        return entrada
+
+    def obtener_vigente(self, centro_id):
+        """Geocerca en caché si sigue vigente, sin tocar la BD (o None)"""
+        entrada = self._entradas.get(centro_id)
+        if entrada is None or entrada.generacion != self._generaciones.get(centro_id, 0):
+            return None
+        if time.monotonic() - entrada.verificada_en < settings.GEOFENCE_CACHE_VERSION_SEGUNDOS:
+            return entrada
+        if cache.get(self._clave_version(centro_id), 0) == entrada.version:
+            entrada.verificada_en = time.monotonic()
+            return entrada
+        return None
+
+    def contiene(self, centro_id, punto):
+        """True si el punto está dentro de la geocerca del centro"""
+        return self.obtener(centro_id).contiene(punto)
+
+    def invalidar(self, centro_id):
+        """Descarta la geocerca del centro en este proceso y en los demás"""
+        self._entradas.pop(centro_id, None)
+        self._generaciones[centro_id] = self._generaciones.get(centro_id, 0) + 1
+        clave = self._clave_version(centro_id)
+        try:
+            cache.incr(clave)
+        except ValueError:
+            cache.set(clave, 1, None)
+
+    def limpiar(self):
+        """Descarta todas las geocercas de este hilo"""
+        self._entradas.clear()
+
+    def _leer(self, centro_id):
+        from .models import CentroEducativo
+
+        # Leer la versión antes que el polígono: si cambia entre medio,
+        # la próxima verificación recargará la geocerca
+        generacion = self._generaciones.get(centro_id, 0)
+        version = cache.get(self._clave_version(centro_id), 0)
+        centro = CentroEducativo.objects.only(
+            'area_segura', 'area_con_margen', 'margen_metros'
+        ).get(pk=centro_id)
+
+        # El área con margen se precalcula al guardar el centro; solo se
+        # calcula aquí si aún no se corrió el comando recalcular_margenes
+        area_con_margen = centro.area_con_margen
+        if area_con_margen is None:
+            area_con_margen = centro.calcular_area_con_margen()
+
+        return centro_id, version, generacion, centro.area_segura, area_con_margen
+
+    @staticmethod
+    def _construir(centro_id, version, generacion, area, area_con_margen):
+        return Geocerca(
+            centro_id,
+            version,
+            generacion,
+            area.prepared,
+            area_con_margen.prepared if area_con_margen is not None else None,
+        )
+
+
+geofence_cache = GeofenceCache()
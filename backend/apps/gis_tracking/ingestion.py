@@ -0,0 +1,204 @@
+"""
+Ingesta write-behind de posiciones GPS recibidas por WebSocket
+
+En lugar de esperar un INSERT por cada fix antes de retransmitirlo, el
+consumer transmite la posición de inmediato y la encola aquí. El buffer
+se vacía con un único bulk_create cada GPS_WS_FLUSH_MS milisegundos o
+cuando acumula GPS_WS_FLUSH_FILAS posiciones.
+
+Si la BD no da abasto y hay más de GPS_WS_MAX_PENDIENTES posiciones sin
+escribir, quien encola espera al flush en curso (backpressure) en vez de
+hacer crecer la cola sin límite.
+
+Si la escritura falla, el lote vuelve al frente de la cola y se reintenta
+con backoff (GPS_WS_FLUSH_MS * 2^intento); tras GPS_WS_FLUSH_MAX_REINTENTOS
+fallos seguidos se descarta. Cada posición encolada tiene un future que se
+resuelve cuando está en la BD (o falla con ErrorEscrituraGPS si se
+descartó): quien confirma la recepción al dispositivo debe esperarlo.
+"""
+import asyncio
+import logging
+import time
+import weakref
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ErrorEscrituraGPS(Exception):
+    """Posiciones descartadas tras agotar los reintentos de escritura"""
+
+
+class WriteBehindBuffer:
+    """
+    Buffer asyncio de posiciones GPS pendientes de escribir
+
+    Debe usarse siempre desde el mismo event loop (ver obtener_buffer()).
+    """
+
+    def __init__(self, flush_ms=None, flush_filas=None, max_pendientes=None,
+                 max_reintentos=None):
+        self.flush_ms = flush_ms or settings.GPS_WS_FLUSH_MS
+        self.flush_filas = flush_filas or settings.GPS_WS_FLUSH_FILAS
+        self.max_pendientes = max_pendientes or settings.GPS_WS_MAX_PENDIENTES
+        self.max_reintentos = (
+            settings.GPS_WS_FLUSH_MAX_REINTENTOS if max_reintentos is None else max_reintentos
+        )
+
+        self._pendientes = []  # [(posicion, future de confirmación), ...]
+        self._en_escritura = 0
+        self._intentos = 0  # Flushes fallidos seguidos del lote al frente
+        self._lock = asyncio.Lock()
+        self._temporizador = None
+        self._tareas = set()
+
+        self.metricas = {
+            'encoladas': 0,
+            'escritas': 0,
+            'fallidas': 0,
+            'reintentos': 0,
+            'flushes': 0,
+            'esperas_backpressure': 0,
+            'max_pendientes_observado': 0,
+            'ultimo_flush_ms': 0.0,
+        }
+
+    @property
+    def pendientes(self):
+        """Posiciones encoladas o en escritura que aún no están en la BD"""
+        return len(self._pendientes) + self._en_escritura
+
+    def estadisticas(self):
+        """Métricas del buffer (contadores acumulados + estado actual)"""
+        return {**self.metricas, 'pendientes': self.pendientes}
+
+    async def agregar(self, posicion):
+        """
+        Encola una PosicionGPS sin guardar (con dentro_area_segura calculado)
+
+        Solo bloquea si se superó max_pendientes, hasta que termine el
+        flush en curso.
+
+        Returns:
+            asyncio.Future: se resuelve cuando la posición está en la BD, o
+            falla con ErrorEscrituraGPS si se descartó
+        """
+        while self.pendientes >= self.max_pendientes:
+            self.metricas['esperas_backpressure'] += 1
+            logger.warning(
+                f'⚠️ Backpressure en ingesta GPS: {self.pendientes} posiciones pendientes'
+            )
+            if self._intentos:
+                # La BD viene fallando: esperar el reintento con backoff
+                await asyncio.sleep(self.flush_ms * 2 ** self._intentos / 1000)
+            else:
+                await self.flush()
+
+        confirmacion = asyncio.get_running_loop().create_future()
+        self._pendientes.append((posicion, confirmacion))
+        self.metricas['encoladas'] += 1
+        if self.pendientes > self.metricas['max_pendientes_observado']:
+            self.metricas['max_pendientes_observado'] = self.pendientes
+
+        if len(self._pendientes) >= self.flush_filas:
+            self._lanzar(self.flush())
+        elif self._temporizador is None:
+            self._temporizador = self._lanzar(self._flush_diferido())
+        return confirmacion
+
+    async def flush(self):
+        """
+        Escribe todas las posiciones pendientes con un único bulk_create
+
+        Returns:
+            int: Cantidad de posiciones escritas
+        """
+        async with self._lock:
+            if self._temporizador is not None and self._temporizador is not asyncio.current_task():
+                self._temporizador.cancel()
+            self._temporizador = None
+
+            lote, self._pendientes = self._pendientes, []
+            if not lote:
+                return 0
+
+            self._en_escritura = len(lote)
+            inicio = time.monotonic()
+            try:
+                await database_sync_to_async(_guardar_lote)([posicion for posicion, _ in lote])
+            except Exception:
+                self._fallo(lote)
+                return 0
+            finally:
+                self._en_escritura = 0
+
+            self._intentos = 0
+            for _, confirmacion in lote:
+                if not confirmacion.done():
+                    confirmacion.set_result(True)
+
+            duracion_ms = (time.monotonic() - inicio) * 1000
+            self.metricas['escritas'] += len(lote)
+            self.metricas['flushes'] += 1
+            self.metricas['ultimo_flush_ms'] = round(duracion_ms, 2)
+            logger.debug(
+                f'💾 {len(lote)} posiciones GPS escritas en {duracion_ms:.1f} ms '
+                f'| {self.estadisticas()}'
+            )
+            return len(lote)
+
+    def _fallo(self, lote):
+        """Devuelve el lote al frente de la cola, o lo descarta si agotó los reintentos"""
+        self._intentos += 1
+        if self._intentos > self.max_reintentos:
+            self._intentos = 0
+            self.metricas['fallidas'] += len(lote)
+            logger.exception(
+                f'❌ {len(lote)} posiciones GPS descartadas tras {self.max_reintentos} reintentos'
+            )
+            error = ErrorEscrituraGPS(f'{len(lote)} posiciones GPS sin escribir')
+            for _, confirmacion in lote:
+                if not confirmacion.done():
+                    confirmacion.set_exception(error)
+            return
+
+        # Lo encolado mientras se escribía queda detrás, en orden
+        self._pendientes[:0] = lote
+        self.metricas['reintentos'] += 1
+        espera_ms = self.flush_ms * 2 ** self._intentos
+        logger.exception(
+            f'⚠️ Error escribiendo lote de {len(lote)} posiciones GPS; '
+            f'reintento {self._intentos}/{self.max_reintentos} en {espera_ms:.0f} ms'
+        )
+        self._temporizador = self._lanzar(self._flush_diferido(espera_ms))
+
+    async def _flush_diferido(self, espera_ms=None):
+        await asyncio.sleep((espera_ms or self.flush_ms) / 1000)
+        await self.flush()
+
+    def _lanzar(self, corutina):
+        # Mantener referencia a la tarea para que no la recolecte el GC
+        tarea = asyncio.ensure_future(corutina)
+        self._tareas.add(tarea)
+        tarea.add_done_callback(self._tareas.discard)
+        return tarea
+
+
+def _guardar_lote(lote):
+    from .services import TrackingService
+
+    TrackingService.guardar_posiciones(lote)
+
+
+_buffers = weakref.WeakKeyDictionary()
+
+
+def obtener_buffer():
+    """Buffer write-behind compartido por los consumers del event loop actual"""
+    loop = asyncio.get_running_loop()
+    buffer = _buffers.get(loop)
+    if buffer is None:
+        buffer = _buffers[loop] = WriteBehindBuffer()
+    return buffer
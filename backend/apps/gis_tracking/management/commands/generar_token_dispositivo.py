@@ -0,0 +1,47 @@
+"""
+Genera el token con el que el dispositivo de un niño envía posiciones
+por ws/device/<dispositivo_id>/ (invalida el token anterior)
+
+Uso:
+    python manage.py generar_token_dispositivo 12
+    python manage.py generar_token_dispositivo 12 --dispositivo reloj-ab12
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.gis_tracking.models import Nino
+
+
+class Command(BaseCommand):
+    help = 'Genera el token de ingesta GPS del dispositivo de un niño'
+
+    def add_arguments(self, parser):
+        parser.add_argument('nino_id', type=int)
+        parser.add_argument(
+            '--dispositivo',
+            help='Asignar también el dispositivo_id del niño'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            nino = Nino.objects.get(id=options['nino_id'])
+        except Nino.DoesNotExist:
+            raise CommandError(f"Niño {options['nino_id']} no encontrado")
+
+        if options['dispositivo']:
+            otro = Nino.objects.filter(dispositivo_id=options['dispositivo']).exclude(id=nino.id).first()
+            if otro is not None:
+                raise CommandError(f"El dispositivo {options['dispositivo']} ya es de {otro}")
+            nino.dispositivo_id = options['dispositivo']
+            nino.save(update_fields=['dispositivo_id'])
+        if not nino.dispositivo_id:
+            raise CommandError(f'{nino} no tiene dispositivo_id (usar --dispositivo)')
+
+        token = nino.generar_token_dispositivo()
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Token del dispositivo {nino.dispositivo_id} ({nino}):'
+        ))
+        self.stdout.write(token)
+        self.stdout.write(
+            f'   ws://servidor/ws/device/{nino.dispositivo_id}/ '
+            f'con el header "Authorization: Token <token>"'
+        )
@@ -0,0 +1,46 @@
+"""
+Crea las particiones mensuales futuras de PosicionGPS y expira las antiguas
+
+Uso:
+    python manage.py gestionar_particiones
+    python manage.py gestionar_particiones --meses 6
+    python manage.py gestionar_particiones --retencion 12 --eliminar
+"""
+from django.core.management.base import BaseCommand
+
+from apps.gis_tracking.particiones import crear_particiones_futuras, expirar_particiones
+
+
+class Command(BaseCommand):
+    help = 'Crea particiones futuras de posiciones GPS y desvincula/elimina las expiradas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--meses',
+            type=int,
+            help='Meses a crear por adelantado (por defecto GPS_PARTICIONES_MESES_FUTUROS)'
+        )
+        parser.add_argument(
+            '--retencion',
+            type=int,
+            help='Meses de historial a conservar, 0 = todo (por defecto GPS_PARTICIONES_RETENCION_MESES)'
+        )
+        parser.add_argument(
+            '--eliminar',
+            action='store_true',
+            default=None,
+            help='Eliminar (DROP) las particiones expiradas en lugar de solo desvincularlas'
+        )
+
+    def handle(self, *args, **options):
+        creadas = crear_particiones_futuras(options['meses'])
+        for nombre in creadas:
+            self.stdout.write(f'  📦 {nombre}')
+
+        expiradas = expirar_particiones(options['retencion'], options['eliminar'])
+        for nombre in expiradas:
+            self.stdout.write(f'  🗑️ {nombre}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {len(creadas)} partición(es) creada(s), {len(expiradas)} expirada(s)'
+        ))
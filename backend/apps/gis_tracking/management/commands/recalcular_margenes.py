@@ -0,0 +1,36 @@
+"""
+Recalcula el área con margen (area_con_margen) de los centros educativos
+
+Uso:
+    python manage.py recalcular_margenes
+    python manage.py recalcular_margenes --centro KP001
+"""
+from django.core.management.base import BaseCommand
+
+from apps.gis_tracking.models import CentroEducativo
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el polígono área segura + margen en proyección métrica'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--centro',
+            help='Código de un centro específico (por defecto todos)'
+        )
+
+    def handle(self, *args, **options):
+        centros = CentroEducativo.objects.all()
+        if options['centro']:
+            centros = centros.filter(codigo=options['centro'])
+
+        total = 0
+        for centro in centros.iterator():
+            # save() recalcula el margen y dispara post_save, que invalida
+            # la geocerca en caché
+            centro.save(update_fields=['area_con_margen'])
+            total += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Área con margen recalculada para {total} centro(s)'
+        ))
@@ -0,0 +1,23 @@
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gis_tracking', '0002_add_spatial_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='centroeducativo',
+            name='area_con_margen',
+            field=django.contrib.gis.db.models.fields.PolygonField(
+                blank=True,
+                editable=False,
+                help_text='Área segura expandida con el margen de tolerancia',
+                null=True,
+                srid=4326,
+            ),
+        ),
+    ]
@@ -0,0 +1,60 @@
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gis_tracking', '0003_centroeducativo_area_con_margen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UltimaPosicion',
+            fields=[
+                ('nino', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    primary_key=True,
+                    related_name='ultima_posicion',
+                    serialize=False,
+                    to='gis_tracking.nino',
+                )),
+                ('ubicacion', django.contrib.gis.db.models.fields.PointField(srid=4326)),
+                ('timestamp', models.DateTimeField()),
+                ('dentro_area_segura', models.BooleanField(default=True)),
+                ('precision_metros', models.FloatField(blank=True, null=True)),
+                ('altitud', models.FloatField(blank=True, null=True)),
+                ('velocidad_kmh', models.FloatField(blank=True, null=True)),
+                ('nivel_bateria', models.IntegerField(blank=True, null=True)),
+                ('posicion', models.ForeignKey(
+                    blank=True,
+                    db_constraint=False,
+                    null=True,
+                    on_delete=django.db.models.deletion.DO_NOTHING,
+                    related_name='+',
+                    to='gis_tracking.posiciongps',
+                )),
+            ],
+            options={
+                'verbose_name': 'Última Posición',
+                'verbose_name_plural': 'Últimas Posiciones',
+            },
+        ),
+        
+        # Poblar con la última posición de cada niño a partir del historial
+        migrations.RunSQL(
+            sql="""
+            INSERT INTO gis_tracking_ultimaposicion (
+                nino_id, posicion_id, ubicacion, timestamp, dentro_area_segura,
+                precision_metros, altitud, velocidad_kmh, nivel_bateria
+            )
+            SELECT DISTINCT ON (nino_id)
+                nino_id, id, ubicacion, timestamp, dentro_area_segura,
+                precision_metros, altitud, velocidad_kmh, nivel_bateria
+            FROM gis_tracking_posiciongps
+            ORDER BY nino_id, timestamp DESC, id DESC;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Índice para la búsqueda de niños cercanos (ST_DWithin + KNN <-> en metros)
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gis_tracking', '0004_ultimaposicion'),
+    ]
+
+    operations = [
+        # Índice GiST sobre la expresión geography: permite que ST_DWithin y
+        # el operador <-> trabajen en metros usando el índice
+        migrations.RunSQL(
+            sql="""
+            CREATE INDEX IF NOT EXISTS idx_ultimaposicion_ubicacion_geog
+            ON gis_tracking_ultimaposicion
+            USING GIST ((ubicacion::geography));
+            """,
+            reverse_sql="""
+            DROP INDEX IF EXISTS idx_ultimaposicion_ubicacion_geog;
+            """
+        ),
+    ]
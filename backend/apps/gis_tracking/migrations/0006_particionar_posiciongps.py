@@ -0,0 +1,140 @@
+# Generated manually: particionamiento por mes de gis_tracking_posiciongps
+#
+# Convierte la tabla de posiciones en una tabla particionada por rango
+# (RANGE sobre "timestamp", una partición por mes) conservando datos,
+# índices y la secuencia del id. Las particiones futuras y la retención
+# se manejan con `python manage.py gestionar_particiones` o la tarea de
+# Celery beat `gestionar_particiones_gps` (ver apps/gis_tracking/particiones.py).
+#
+# PostgreSQL exige que la clave primaria incluya la columna de partición,
+# por eso la PK pasa a ser (id, timestamp) y las FK que apuntaban a
+# posiciongps(id) (alerts_alerta.posicion_gps_id) quedan sin constraint
+# en la BD (db_constraint=False en el modelo). El ORM sigue usando id
+# como pk sin cambios.
+#
+# En tablas grandes la copia de datos puede tardar: ejecutar en una
+# ventana de mantenimiento.
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gis_tracking', '0005_ultimaposicion_geography_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+            DO $$
+            DECLARE
+                r record;
+                indices text[] := ARRAY[]::text[];
+                definicion text;
+                mes date;
+                hasta date;
+                -- Meses en TIME_ZONE, como apps/gis_tracking/particiones.py
+                zona text := '{zona}';
+            BEGIN
+                -- Nada que hacer si la tabla ya está particionada
+                IF EXISTS (
+                    SELECT 1 FROM pg_partitioned_table pt
+                    JOIN pg_class c ON c.oid = pt.partrelid
+                    WHERE c.relname = 'gis_tracking_posiciongps'
+                ) THEN
+                    RETURN;
+                END IF;
+
+                CREATE SEQUENCE gis_tracking_posiciongps_part_id_seq AS bigint;
+                PERFORM setval(
+                    'gis_tracking_posiciongps_part_id_seq',
+                    COALESCE((SELECT MAX(id) FROM gis_tracking_posiciongps), 0) + 1,
+                    false
+                );
+
+                CREATE TABLE gis_tracking_posiciongps_part (
+                    id bigint NOT NULL DEFAULT nextval('gis_tracking_posiciongps_part_id_seq'),
+                    ubicacion geometry(Point, 4326) NOT NULL,
+                    "timestamp" timestamp with time zone NOT NULL,
+                    dentro_area_segura boolean NOT NULL,
+                    precision_metros double precision NULL,
+                    altitud double precision NULL,
+                    velocidad_kmh double precision NULL,
+                    nivel_bateria integer NULL,
+                    nino_id bigint NOT NULL
+                        REFERENCES gis_tracking_nino (id) DEFERRABLE INITIALLY DEFERRED,
+                    CONSTRAINT gis_tracking_posiciongps_part_pkey PRIMARY KEY (id, "timestamp")
+                ) PARTITION BY RANGE ("timestamp");
+
+                -- Una partición por mes desde el dato más antiguo hasta 3 meses adelante
+                mes := date_trunc('month', COALESCE(
+                    (SELECT MIN("timestamp") FROM gis_tracking_posiciongps), now()
+                ) AT TIME ZONE zona)::date;
+                hasta := (date_trunc('month', now() AT TIME ZONE zona) + interval '4 months')::date;
+                WHILE mes < hasta LOOP
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF gis_tracking_posiciongps_part '
+                        'FOR VALUES FROM (%L) TO (%L)',
+                        'gis_tracking_posiciongps_p' || to_char(mes, 'YYYYMM'),
+                        mes::timestamp AT TIME ZONE zona,
+                        (mes + interval '1 month') AT TIME ZONE zona
+                    );
+                    mes := (mes + interval '1 month')::date;
+                END LOOP;
+
+                -- Red de seguridad para fechas fuera de las particiones creadas
+                CREATE TABLE gis_tracking_posiciongps_default
+                    PARTITION OF gis_tracking_posiciongps_part DEFAULT;
+
+                -- Mover los índices (GiST, nino+timestamp, etc.) a la tabla nueva:
+                -- se eliminan de la vieja y se recrean después de copiar los datos
+                FOR r IN
+                    SELECT schemaname, indexname, indexdef FROM pg_indexes
+                    WHERE tablename = 'gis_tracking_posiciongps'
+                      AND NOT EXISTS (
+                          SELECT 1 FROM pg_constraint
+                          WHERE conindid = format('%I.%I', schemaname, indexname)::regclass
+                      )
+                LOOP
+                    indices := indices || replace(
+                        r.indexdef,
+                        ' ON ' || r.schemaname || '.gis_tracking_posiciongps USING ',
+                        ' ON ' || r.schemaname || '.gis_tracking_posiciongps_part USING '
+                    );
+                    EXECUTE format('DROP INDEX %I.%I', r.schemaname, r.indexname);
+                END LOOP;
+
+                INSERT INTO gis_tracking_posiciongps_part (
+                    id, ubicacion, "timestamp", dentro_area_segura, precision_metros,
+                    altitud, velocidad_kmh, nivel_bateria, nino_id
+                )
+                SELECT
+                    id, ubicacion, "timestamp", dentro_area_segura, precision_metros,
+                    altitud, velocidad_kmh, nivel_bateria, nino_id
+                FROM gis_tracking_posiciongps;
+
+                FOREACH definicion IN ARRAY indices LOOP
+                    EXECUTE definicion;
+                END LOOP;
+
+                -- CASCADE elimina la FK de alerts_alerta.posicion_gps_id
+                DROP TABLE gis_tracking_posiciongps CASCADE;
+
+                ALTER TABLE gis_tracking_posiciongps_part
+                    RENAME TO gis_tracking_posiciongps;
+                ALTER TABLE gis_tracking_posiciongps
+                    RENAME CONSTRAINT gis_tracking_posiciongps_part_pkey
+                    TO gis_tracking_posiciongps_pkey;
+                ALTER SEQUENCE gis_tracking_posiciongps_part_id_seq
+                    RENAME TO gis_tracking_posiciongps_id_seq;
+                ALTER SEQUENCE gis_tracking_posiciongps_id_seq
+                    OWNED BY gis_tracking_posiciongps.id;
+            END
+            $$;
+            """.format(zona=settings.TIME_ZONE),
+            # Volver a una tabla sin particionar requiere copiar los datos a mano
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,44 @@
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gis_tracking', '0006_particionar_posiciongps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenPosicion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolucion_segundos', models.PositiveIntegerField(help_text='Duración del intervalo resumido (60 o 300 segundos)')),
+                ('inicio', models.DateTimeField(help_text='Inicio del intervalo')),
+                ('centroide', django.contrib.gis.db.models.fields.PointField(spatial_index=False, srid=4326)),
+                ('primera_posicion', models.DateTimeField()),
+                ('ultima_posicion', models.DateTimeField()),
+                ('total_posiciones', models.PositiveIntegerField()),
+                ('proporcion_dentro', models.FloatField(help_text='Fracción de posiciones dentro del área segura (0-1)')),
+                ('velocidad_max_kmh', models.FloatField(blank=True, null=True)),
+                ('bateria_min', models.IntegerField(blank=True, null=True)),
+                ('nino', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='resumenes_posicion',
+                    to='gis_tracking.nino',
+                )),
+            ],
+            options={
+                'verbose_name': 'Resumen de Posiciones',
+                'verbose_name_plural': 'Resúmenes de Posiciones',
+                'ordering': ['-inicio'],
+                'constraints': [
+                    models.UniqueConstraint(
+                        fields=('nino', 'resolucion_segundos', 'inicio'),
+                        name='resumen_posicion_unico',
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+def liberar_dispositivos_repetidos(apps, schema_editor):
+    """Deja el dispositivo_id repetido solo en el niño registrado primero"""
+    Nino = apps.get_model('gis_tracking', 'Nino')
+    vistos = set()
+    repetidos = []
+    for nino_id, dispositivo_id in Nino.objects.exclude(dispositivo_id='').order_by('id').values_list(
+        'id', 'dispositivo_id'
+    ):
+        if dispositivo_id in vistos:
+            repetidos.append(nino_id)
+        vistos.add(dispositivo_id)
+    Nino.objects.filter(id__in=repetidos).update(dispositivo_id='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gis_tracking', '0007_resumenposicion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='nino',
+            name='dispositivo_id',
+            field=models.CharField(blank=True, help_text='ID del celular/smartwatch para tracking (único si no está vacío)', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='nino',
+            name='token_dispositivo',
+            field=models.CharField(blank=True, editable=False, help_text='SHA-256 del token con el que el dispositivo se conecta a ws/device/', max_length=64),
+        ),
+        migrations.RunPython(liberar_dispositivos_repetidos, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='nino',
+            constraint=models.UniqueConstraint(condition=models.Q(('dispositivo_id', ''), _negated=True), fields=('dispositivo_id',), name='nino_dispositivo_unico'),
+        ),
+    ]
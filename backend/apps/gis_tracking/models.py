@@ -1,11 +1,20 @@
 """
 Modelos geoespaciales para tracking y monitoreo
 """
+import hashlib
+import hmac
+import math
+import secrets
+
+from django.conf import settings
 from django.contrib.gis.db import models as gis_models
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from apps.core.models import Tutor
 
+# Radio de la esfera usada por PostGIS en ST_DistanceSphere
+RADIO_TIERRA_METROS = 6370986
+
 
 class CentroEducativo(models.Model):
     """
@@ -42,6 +51,15 @@ class CentroEducativo(models.Model):
         help_text='Margen adicional en metros fuera del polígono (geofencing)'
     )
     
+    # Área segura + margen (calculada al guardar en proyección métrica)
+    area_con_margen = gis_models.PolygonField(
+        srid=4326,
+        blank=True,
+        null=True,
+        editable=False,
+        help_text='Área segura expandida con el margen de tolerancia'
+    )
+    
     activo = models.BooleanField(default=True)
     fecha_registro = models.DateTimeField(auto_now_add=True)
     
@@ -54,8 +72,24 @@ class CentroEducativo(models.Model):
         # Calcular el centroide del polígono automáticamente
         if self.area_segura and not self.ubicacion_centro:
             self.ubicacion_centro = self.area_segura.centroid
+        self.area_con_margen = self.calcular_area_con_margen()
         super().save(*args, **kwargs)
     
+    def calcular_area_con_margen(self):
+        """
+        Expande el área segura con el margen de tolerancia
+        
+        El buffer se calcula en una proyección métrica (UTM 20S para
+        Santa Cruz) para que el margen mida lo mismo en latitud y longitud.
+        """
+        if not self.area_segura or self.margen_metros <= 0:
+            return None
+        
+        area = self.area_segura.transform(settings.GEOFENCE_SRID_METRICO, clone=True)
+        area = area.buffer(self.margen_metros)
+        area.transform(self.area_segura.srid)
+        return area
+    
     def __str__(self):
         return f"{self.nombre} ({self.codigo})"
 
@@ -106,7 +140,13 @@ class Nino(models.Model):
     dispositivo_id = models.CharField(
         max_length=255,
         blank=True,
-        help_text='ID del celular/smartwatch para tracking'
+        help_text='ID del celular/smartwatch para tracking (único si no está vacío)'
+    )
+    token_dispositivo = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        help_text='SHA-256 del token con el que el dispositivo se conecta a ws/device/'
     )
     
     # Estado
@@ -122,23 +162,103 @@ class Nino(models.Model):
         verbose_name = 'Niño/a'
         verbose_name_plural = 'Niños/as'
         ordering = ['apellido_paterno', 'nombre']
+        constraints = [
+            # Un dispositivo identifica a un solo niño (ws/device/<dispositivo_id>/)
+            models.UniqueConstraint(
+                fields=['dispositivo_id'],
+                name='nino_dispositivo_unico',
+                condition=~models.Q(dispositivo_id=''),
+            ),
+        ]
     
     def __str__(self):
         return f"{self.nombre} {self.apellido_paterno}"
     
     def nombre_completo(self):
-        if self.apellido_materno:
-            return f"{self.nombre} {self.apellido_paterno} {self.apellido_materno}"
-        return f"{self.nombre} {self.apellido_paterno}"
+        return self.formatear_nombre_completo(
+            self.nombre, self.apellido_paterno, self.apellido_materno
+        )
     
     @property
     def edad(self):
         """Calcula la edad actual del niño"""
+        return self.calcular_edad(self.fecha_nacimiento)
+    
+    @staticmethod
+    def formatear_nombre_completo(nombre, apellido_paterno, apellido_materno):
+        """Nombre completo a partir de los campos (también para filas de .values())"""
+        if apellido_materno:
+            return f"{nombre} {apellido_paterno} {apellido_materno}"
+        return f"{nombre} {apellido_paterno}"
+    
+    def generar_token_dispositivo(self):
+        """
+        Genera un token nuevo para el dispositivo (invalida el anterior)
+        
+        Solo se guarda su hash: el token se muestra una única vez.
+        """
+        token = secrets.token_urlsafe(32)
+        self.token_dispositivo = self.hash_token(token)
+        self.save(update_fields=['token_dispositivo'])
+        return token
+    
+    @staticmethod
+    def hash_token(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+    
+    @classmethod
+    def autenticar_dispositivo(cls, dispositivo_id, token):
+        """
+        Niño con tracking activo al que pertenece el dispositivo
+        
+        Returns:
+            tuple: (nino_id, centro_educativo_id), o None si el token no
+            corresponde
+        """
+        if not dispositivo_id or not token:
+            return None
+        fila = cls.objects.filter(
+            dispositivo_id=dispositivo_id, activo=True, tracking_activo=True
+        ).exclude(token_dispositivo='').values_list(
+            'id', 'centro_educativo_id', 'token_dispositivo'
+        ).first()
+        if fila is None or not hmac.compare_digest(fila[2], cls.hash_token(token)):
+            return None
+        return fila[0], fila[1]
+    
+    @staticmethod
+    def calcular_edad(fecha_nacimiento):
         from datetime import date
         today = date.today()
-        return today.year - self.fecha_nacimiento.year - (
+        return today.year - fecha_nacimiento.year - (
             (today.month, today.day) < 
-            (self.fecha_nacimiento.month, self.fecha_nacimiento.day)
+            (fecha_nacimiento.month, fecha_nacimiento.day)
+        )
+
+
+class PosicionGPSQuerySet(models.QuerySet):
+    
+    def con_distancia_centro(self):
+        """
+        Anota distancia_centro_metros: distancia en metros (esfera) al
+        punto central del kinder, calculada en SQL en la misma consulta
+        """
+        return self.annotate(distancia_centro_metros=self.expresion_distancia_centro())
+    
+    @staticmethod
+    def expresion_distancia_centro(prefijo=''):
+        """
+        ST_DistanceSphere entre la posición y el centro de su kinder
+        
+        Args:
+            prefijo: Ruta hasta la posición desde otro modelo (p. ej.
+                'posicion_gps__' para anotar un queryset de Alerta)
+        """
+        return models.Func(
+            models.F(f'{prefijo}ubicacion'),
+            models.F(f'{prefijo}nino__centro_educativo__ubicacion_centro'),
+            function='ST_DistanceSphere',
+            output_field=models.FloatField()
         )
 
 
@@ -196,6 +316,8 @@ class PosicionGPS(models.Model):
         help_text='Nivel de batería del dispositivo (0-100)'
     )
     
+    objects = PosicionGPSQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Posición GPS'
         verbose_name_plural = 'Posiciones GPS'
@@ -213,32 +335,238 @@ class PosicionGPS(models.Model):
         Análisis espacial automático: 
         Verificar si el punto está dentro del polígono del kinder
         """
-        if self.ubicacion and self.nino.centro_educativo:
-            area_kinder = self.nino.centro_educativo.area_segura
+        from .transiciones import FUERA, maquina_geocerca
+        
+        if self.ubicacion and self.nino.centro_educativo_id:
+            from .geofence import geofence_cache
             
-            # Análisis point-in-polygon con GeoDjango
-            self.dentro_area_segura = area_kinder.contains(self.ubicacion)
+            # Análisis point-in-polygon con la geocerca preparada en caché
+            # (área segura + margen de tolerancia)
+            geocerca = geofence_cache.obtener(self.nino.centro_educativo_id)
+            self.zona = geocerca.zona(self.ubicacion)
+            self.dentro_area_segura = self.zona != FUERA
+        
+        with maquina_geocerca.bloqueo([self.nino_id]):
+            # Estado de geocerca antes de actualizar la última posición
+            estados = maquina_geocerca.cargar([self.nino_id], UltimaPosicion.estados_dentro)
             
-            # Si hay margen de tolerancia, expandir el polígono
-            if not self.dentro_area_segura and self.nino.centro_educativo.margen_metros > 0:
-                # Buffer en metros (transformar a proyección métrica)
-                area_con_margen = area_kinder.buffer(
-                    self.nino.centro_educativo.margen_metros / 111320  # Aproximación a grados
-                )
-                self.dentro_area_segura = area_con_margen.contains(self.ubicacion)
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                
+                # Mantener actualizada la última posición conocida del niño
+                if UltimaPosicion.registrar([self]):
+                    from .services import DashboardService
+                    DashboardService.invalidar_estadisticas()
+                
+                # Alertas solo en las transiciones dentro <-> fuera
+                maquina_geocerca.procesar([self], estados)
+    
+    def distancia_al_centro(self):
+        """
+        Distancia en metros al centro del kinder
         
-        super().save(*args, **kwargs)
+        Usa la anotación de PosicionGPS.objects.con_distancia_centro() si
+        está presente; si no (p. ej. posiciones recién creadas), la calcula
+        en Python con la misma fórmula que ST_DistanceSphere.
+        """
+        if hasattr(self, 'distancia_centro_metros'):
+            return self.distancia_centro_metros
         
-        # Trigger para crear alerta si salió del área
-        if not self.dentro_area_segura:
-            from apps.alerts.models import Alerta
-            Alerta.crear_alerta_salida(self)
+        centro = self.nino.centro_educativo.ubicacion_centro
+        if not centro:
+            return None
+        
+        lat1, lat2 = math.radians(self.ubicacion.y), math.radians(centro.y)
+        dlat = lat2 - lat1
+        dlng = math.radians(centro.x - self.ubicacion.x)
+        a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2
+        return 2 * RADIO_TIERRA_METROS * math.asin(math.sqrt(a))
+
+
+class UltimaPosicion(models.Model):
+    """
+    Última posición conocida de cada niño (una fila por niño)
     
-    def distancia_al_centro(self):
-        """Calcula distancia en metros al centro del kinder"""
-        if self.nino.centro_educativo.ubicacion_centro:
-            from django.contrib.gis.measure import Distance
-            return self.ubicacion.distance(
-                self.nino.centro_educativo.ubicacion_centro
-            ) * 111320  # Convertir grados a metros aproximadamente
-        return None
+    Se actualiza con un upsert en cada ingesta para que las lecturas del
+    estado actual no tengan que recorrer el historial de PosicionGPS.
+    """
+    nino = models.OneToOneField(
+        Nino,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ultima_posicion'
+    )
+    
+    # Sin FK real: la tabla de posiciones puede particionarse
+    posicion = models.ForeignKey(
+        PosicionGPS,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    
+    # Campo geoespacial con índice GiST (spatial_index por defecto)
+    ubicacion = gis_models.PointField(srid=4326)
+    
+    timestamp = models.DateTimeField()
+    dentro_area_segura = models.BooleanField(default=True)
+    precision_metros = models.FloatField(null=True, blank=True)
+    altitud = models.FloatField(null=True, blank=True)
+    velocidad_kmh = models.FloatField(null=True, blank=True)
+    nivel_bateria = models.IntegerField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Última Posición'
+        verbose_name_plural = 'Últimas Posiciones'
+    
+    def __str__(self):
+        return f"{self.nino_id} - {self.timestamp.strftime('%d/%m/%Y %H:%M:%S')}"
+    
+    @classmethod
+    def estados_dentro(cls, ninos_ids):
+        """{nino_id: dentro_area_segura} de la última posición de cada niño"""
+        return dict(
+            cls.objects.filter(nino_id__in=ninos_ids).values_list('nino_id', 'dentro_area_segura')
+        )
+    
+    @classmethod
+    def registrar(cls, posiciones):
+        """
+        Upsert (INSERT ... ON CONFLICT) de la última posición de cada niño
+        
+        Solo reemplaza la fila si la posición es igual o más reciente que
+        la guardada, así un lote atrasado no pisa el estado actual.
+        
+        Args:
+            posiciones: Instancias de PosicionGPS ya guardadas (con id)
+        
+        Returns:
+            set: IDs de los niños cuyo estado dentro/fuera cambió (o que no
+            tenían posición previa)
+        """
+        from django.db import connection
+        
+        ultimas = {}
+        for posicion in posiciones:
+            actual = ultimas.get(posicion.nino_id)
+            if actual is None or posicion.timestamp >= actual.timestamp:
+                ultimas[posicion.nino_id] = posicion
+        
+        if not ultimas:
+            return set()
+        
+        valores = []
+        parametros = []
+        for posicion in ultimas.values():
+            valores.append('(%s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326), %s, %s, %s, %s, %s, %s)')
+            parametros.extend([
+                posicion.nino_id, posicion.pk,
+                posicion.ubicacion.x, posicion.ubicacion.y,
+                posicion.timestamp, posicion.dentro_area_segura,
+                posicion.precision_metros, posicion.altitud,
+                posicion.velocidad_kmh, posicion.nivel_bateria,
+            ])
+        
+        tabla = cls._meta.db_table
+        ids = ', '.join(['%s'] * len(ultimas))
+        parametros = list(ultimas) + parametros
+        
+        # La CTE ve la tabla antes del upsert: permite comparar el estado previo
+        query = f"""
+            WITH previo AS (
+                SELECT nino_id, dentro_area_segura FROM {tabla} WHERE nino_id IN ({ids})
+            )
+            INSERT INTO {tabla} (
+                nino_id, posicion_id, ubicacion, timestamp, dentro_area_segura,
+                precision_metros, altitud, velocidad_kmh, nivel_bateria
+            )
+            VALUES {', '.join(valores)}
+            ON CONFLICT (nino_id) DO UPDATE SET
+                posicion_id = EXCLUDED.posicion_id,
+                ubicacion = EXCLUDED.ubicacion,
+                timestamp = EXCLUDED.timestamp,
+                dentro_area_segura = EXCLUDED.dentro_area_segura,
+                precision_metros = EXCLUDED.precision_metros,
+                altitud = EXCLUDED.altitud,
+                velocidad_kmh = EXCLUDED.velocidad_kmh,
+                nivel_bateria = EXCLUDED.nivel_bateria
+            WHERE {tabla}.timestamp <= EXCLUDED.timestamp
+            RETURNING nino_id, dentro_area_segura IS DISTINCT FROM (
+                SELECT previo.dentro_area_segura FROM previo
+                WHERE previo.nino_id = {tabla}.nino_id
+            )
+        """
+        
+        with connection.cursor() as cursor:
+            cursor.execute(query, parametros)
+            return {nino_id for nino_id, cambio in cursor.fetchall() if cambio}
+    
+    def como_posicion(self):
+        """PosicionGPS (sin consultar el historial) con los datos de esta fila"""
+        posicion = PosicionGPS(
+            id=self.posicion_id,
+            nino_id=self.nino_id,
+            ubicacion=self.ubicacion,
+            timestamp=self.timestamp,
+            dentro_area_segura=self.dentro_area_segura,
+            precision_metros=self.precision_metros,
+            altitud=self.altitud,
+            velocidad_kmh=self.velocidad_kmh,
+            nivel_bateria=self.nivel_bateria,
+        )
+        if self._meta.get_field('nino').is_cached(self):
+            posicion.nino = self.nino
+        return posicion
+
+
+class ResumenPosicion(models.Model):
+    """
+    Resumen de las posiciones GPS de un niño en un intervalo fijo
+    (por minuto o cada 5 minutos)
+    
+    Las posiciones crudas más antiguas que GPS_RETENCION_DIAS_CRUDOS se
+    agregan aquí y se eliminan (ver apps/gis_tracking/retencion.py).
+    """
+    nino = models.ForeignKey(
+        Nino,
+        on_delete=models.CASCADE,
+        related_name='resumenes_posicion'
+    )
+    
+    resolucion_segundos = models.PositiveIntegerField(
+        help_text='Duración del intervalo resumido (60 o 300 segundos)'
+    )
+    inicio = models.DateTimeField(help_text='Inicio del intervalo')
+    
+    # Centroide de las posiciones del intervalo
+    centroide = gis_models.PointField(srid=4326, spatial_index=False)
+    
+    primera_posicion = models.DateTimeField()
+    ultima_posicion = models.DateTimeField()
+    total_posiciones = models.PositiveIntegerField()
+    proporcion_dentro = models.FloatField(
+        help_text='Fracción de posiciones dentro del área segura (0-1)'
+    )
+    velocidad_max_kmh = models.FloatField(null=True, blank=True)
+    bateria_min = models.IntegerField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Resumen de Posiciones'
+        verbose_name_plural = 'Resúmenes de Posiciones'
+        ordering = ['-inicio']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['nino', 'resolucion_segundos', 'inicio'],
+                name='resumen_posicion_unico'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.nino_id} - {self.inicio.strftime('%d/%m/%Y %H:%M')} ({self.total_posiciones})"
+    
+    @property
+    def dentro_area_segura(self):
+        """True si la mayoría de las posiciones del intervalo estaban dentro"""
+        return self.proporcion_dentro >= 0.5
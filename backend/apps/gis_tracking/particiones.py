@@ -0,0 +1,165 @@
+"""
+Administración de particiones mensuales de PosicionGPS
+
+La tabla gis_tracking_posiciongps está particionada por rango sobre
+"timestamp" (migración 0006). Cada mes vive en una partición
+<tabla>_pYYYYMM; <tabla>_default recibe lo que caiga fuera de ellas.
+
+- crear_particiones_futuras(): crea por adelantado las particiones de
+  los próximos meses, para que la partición default quede vacía.
+- expirar_particiones(): desvincula (DETACH) o elimina las particiones
+  más antiguas que la retención configurada.
+
+Los meses se cuentan en TIME_ZONE, igual que _mes_actual(): los límites
+de cada partición son timestamptz a medianoche local, no fechas (que
+PostgreSQL interpretaría en la zona de la sesión, UTC).
+"""
+import logging
+from datetime import date, datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import PosicionGPS
+
+logger = logging.getLogger(__name__)
+
+
+def _tabla():
+    return PosicionGPS._meta.db_table
+
+
+def _nombre_particion(mes):
+    return f'{_tabla()}_p{mes:%Y%m}'
+
+
+def _sumar_meses(mes, cantidad):
+    total = mes.year * 12 + (mes.month - 1) + cantidad
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def _mes_actual():
+    # Fecha en TIME_ZONE, no la del servidor: el mes cambia a medianoche local
+    hoy = timezone.localdate()
+    return date(hoy.year, hoy.month, 1)
+
+
+def _inicio(mes):
+    """Medianoche del día 1 del mes en TIME_ZONE (datetime aware)"""
+    return timezone.make_aware(datetime(mes.year, mes.month, 1))
+
+
+def listar_particiones():
+    """
+    Returns:
+        dict: {mes (date del día 1): nombre de la partición} de las
+        particiones mensuales vinculadas a la tabla
+    """
+    prefijo = f'{_tabla()}_p'
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT hija.relname
+            FROM pg_inherits
+            JOIN pg_class padre ON padre.oid = pg_inherits.inhparent
+            JOIN pg_class hija ON hija.oid = pg_inherits.inhrelid
+            WHERE padre.relname = %s
+        """, [_tabla()])
+        nombres = [nombre for (nombre,) in cursor.fetchall()]
+
+    particiones = {}
+    for nombre in nombres:
+        sufijo = nombre[len(prefijo):]
+        if nombre.startswith(prefijo) and len(sufijo) == 6 and sufijo.isdigit():
+            particiones[date(int(sufijo[:4]), int(sufijo[4:]), 1)] = nombre
+    return particiones
+
+
+def crear_particion(mes):
+    """
+    Crea la partición del mes indicado
+
+    Si la partición default ya tiene filas de ese mes, se mueven a la
+    partición nueva (PostgreSQL no permite crearla de otro modo).
+    """
+    tabla = _tabla()
+    nombre = _nombre_particion(mes)
+    desde, hasta = _inicio(mes), _inicio(_sumar_meses(mes, 1))
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE TEMP TABLE _posiciones_a_mover ON COMMIT DROP AS
+            WITH movidas AS (
+                DELETE FROM {tabla}_default
+                WHERE "timestamp" >= %s AND "timestamp" < %s
+                RETURNING *
+            )
+            SELECT * FROM movidas
+        """, [desde, hasta])
+        cursor.execute(f"""
+            CREATE TABLE {nombre} PARTITION OF {tabla}
+            FOR VALUES FROM (%s) TO (%s)
+        """, [desde, hasta])
+        cursor.execute(f'INSERT INTO {tabla} SELECT * FROM _posiciones_a_mover')
+        # ON COMMIT DROP no alcanza dentro de una transacción envolvente
+        # (varias particiones en el mismo commit)
+        cursor.execute('DROP TABLE _posiciones_a_mover')
+
+    logger.info(f'📦 Partición creada: {nombre}')
+    return nombre
+
+
+def crear_particiones_futuras(meses=None):
+    """
+    Asegura que existan las particiones desde el mes actual hasta
+    `meses` meses adelante
+
+    Returns:
+        list: Nombres de las particiones creadas
+    """
+    if meses is None:
+        meses = settings.GPS_PARTICIONES_MESES_FUTUROS
+
+    existentes = listar_particiones()
+    creadas = []
+    for i in range(meses + 1):
+        mes = _sumar_meses(_mes_actual(), i)
+        if mes not in existentes:
+            creadas.append(crear_particion(mes))
+    return creadas
+
+
+def expirar_particiones(retencion_meses=None, eliminar=None):
+    """
+    Desvincula las particiones cuyos datos son todos más antiguos que
+    `retencion_meses` meses (0 = conservar todo)
+
+    Args:
+        retencion_meses: Meses completos a conservar además del actual
+        eliminar: True para hacer DROP; False deja la tabla desvinculada
+            (fuera de las consultas) para archivarla con pg_dump
+
+    Returns:
+        list: Nombres de las particiones expiradas
+    """
+    if retencion_meses is None:
+        retencion_meses = settings.GPS_PARTICIONES_RETENCION_MESES
+    if eliminar is None:
+        eliminar = settings.GPS_PARTICIONES_ELIMINAR
+    if not retencion_meses:
+        return []
+
+    limite = _sumar_meses(_mes_actual(), -retencion_meses)
+    expiradas = []
+    for mes, nombre in sorted(listar_particiones().items()):
+        if mes >= limite:
+            continue
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {_tabla()} DETACH PARTITION {nombre}')
+            if eliminar:
+                cursor.execute(f'DROP TABLE {nombre}')
+
+        logger.info(f"🗑️ Partición {'eliminada' if eliminar else 'desvinculada'}: {nombre}")
+        expiradas.append(nombre)
+    return expiradas
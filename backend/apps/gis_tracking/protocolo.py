@@ -0,0 +1,220 @@
+"""
+Formatos de los frames GPS por WebSocket
+
+Un frame del dispositivo (ws/device/<dispositivo_id>/) trae un número de
+secuencia (seq, elegido por el dispositivo) y uno o varios fixes del niño
+autenticado, en cualquiera de estos formatos:
+
+- Texto JSON: {"seq": 7, "lat": ..., "lng": ..., "nivel_bateria": ...,
+  "timestamp": "2024-05-10T08:15:00-04:00"} o {"seq": 7, "fixes": [...]}
+  con varios de esos fixes (p. ej. los acumulados sin conexión).
+  nivel_bateria y timestamp (ISO 8601, como en el endpoint de lotes) son
+  opcionales
+- Binario: seq uint32 seguido de fixes de 25 bytes concatenados,
+  little-endian (timestamp int64 en ms desde epoch, 0 = hora de
+  llegada | lat float64 | lng float64 | nivel_bateria uint8)
+
+{"type": "ping"} no trae fixes: pide el ack de inmediato.
+
+Los frames inválidos lanzan FrameInvalido (con el seq, si se pudo leer);
+el consumer los informa como rechazados en el siguiente ack.
+
+Los tutores que negocian el subprotocolo SUBPROTOCOLO_BINARIO reciben
+cada gps_update como un frame binario de 31 bytes (en vez de ~170 de
+JSON), little-endian:
+
+    tipo uint8 (1) | nino_id uint32 | lat float64 | lng float64 |
+    nivel_bateria uint8 (255 = desconocido) | flags uint8 (bit 0: dentro
+    del área) | timestamp int64 (ms desde epoch)
+
+El resto de los mensajes (conexión, pong, alertas) siguen siendo JSON
+de texto.
+
+Los eventos que se envían a los grupos de tracking (evento_gps_update,
+evento_alerta) llevan el mensaje ya serializado, una sola vez, en quien
+lo emite: 'texto' (JSON) y, para gps_update, 'frame' (binario). Cada
+consumer reenvía esos mismos datos a su socket sin volver a codificar.
+"""
+import datetime
+import json
+import struct
+from typing import List, NamedTuple, Optional, Tuple
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+SEQ_DISPOSITIVO = struct.Struct('<I')
+FIX_DISPOSITIVO = struct.Struct('<qddB')
+
+SUBPROTOCOLO_BINARIO = 'gps.bin.v1'
+GPS_UPDATE = 1
+FRAME_GPS_UPDATE = struct.Struct('<BIddBBq')
+BATERIA_DESCONOCIDA = 255
+DENTRO_AREA = 0x01
+
+
+class FrameInvalido(ValueError):
+    """Frame del dispositivo que no se puede registrar"""
+
+    def __init__(self, mensaje, seq=None):
+        super().__init__(mensaje)
+        self.seq = seq
+
+
+class FrameDispositivo(NamedTuple):
+    """Frame decodificado: fixes como (lat, lng, nivel_bateria, timestamp o None)"""
+    seq: int
+    fixes: List[Tuple[float, float, int, Optional[datetime.datetime]]]
+
+
+def _validar(lat, lng, nivel_bateria, timestamp):
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError(f'Coordenadas fuera de rango: ({lat}, {lng})')
+    if not 0 <= nivel_bateria <= 100:
+        raise ValueError(f'Nivel de batería inválido: {nivel_bateria}')
+    return lat, lng, nivel_bateria, timestamp
+
+
+def _desde_epoch_ms(timestamp_ms):
+    if timestamp_ms == 0:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp_ms / 1000, tz=datetime.timezone.utc)
+
+
+def _desde_iso(valor):
+    if valor is None:
+        return None
+    timestamp = parse_datetime(valor) if isinstance(valor, str) else None
+    if timestamp is None:
+        raise ValueError(f'Timestamp inválido: {valor}')
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp
+
+
+def decodificar_binario(datos):
+    """
+    Returns:
+        FrameDispositivo
+    """
+    if len(datos) < SEQ_DISPOSITIVO.size:
+        raise FrameInvalido(f'Frame binario de {len(datos)} bytes')
+    seq, = SEQ_DISPOSITIVO.unpack_from(datos)
+    cuerpo = datos[SEQ_DISPOSITIVO.size:]
+    if not cuerpo or len(cuerpo) % FIX_DISPOSITIVO.size:
+        raise FrameInvalido(
+            f'Fixes de {len(cuerpo)} bytes (múltiplo de {FIX_DISPOSITIVO.size})', seq
+        )
+    try:
+        fixes = [
+            _validar(lat, lng, bateria, _desde_epoch_ms(timestamp_ms))
+            for timestamp_ms, lat, lng, bateria in FIX_DISPOSITIVO.iter_unpack(cuerpo)
+        ]
+    except (ValueError, OverflowError, OSError) as e:
+        raise FrameInvalido(str(e), seq)
+    return FrameDispositivo(seq, fixes)
+
+
+def decodificar_json(texto):
+    """
+    Returns:
+        FrameDispositivo, o None para un ping
+    """
+    try:
+        datos = json.loads(texto)
+    except json.JSONDecodeError as e:
+        raise FrameInvalido(f'JSON inválido: {e}')
+    if not isinstance(datos, dict):
+        raise FrameInvalido('Se esperaba un objeto con seq')
+    if datos.get('type') == 'ping':
+        return None
+
+    seq = datos.get('seq')
+    if not isinstance(seq, int) or isinstance(seq, bool) or not 0 <= seq < 2 ** 32:
+        raise FrameInvalido('Falta el número de secuencia (seq)')
+
+    fixes = datos['fixes'] if 'fixes' in datos else [datos]
+    if not isinstance(fixes, list) or not fixes:
+        raise FrameInvalido('Se esperaba un fix o una lista de fixes', seq)
+
+    return FrameDispositivo(seq, [decodificar_fix(fix, seq) for fix in fixes])
+
+
+def decodificar_fix(fix, seq=None):
+    """
+    Un fix JSON {"lat", "lng", "nivel_bateria"?, "timestamp"?}
+
+    Returns:
+        tuple: (lat, lng, nivel_bateria, timestamp o None)
+    """
+    try:
+        return _validar(
+            float(fix['lat']), float(fix['lng']), int(fix.get('nivel_bateria', 100)),
+            _desde_iso(fix.get('timestamp')),
+        )
+    except (KeyError, TypeError, AttributeError):
+        raise FrameInvalido('Faltan datos requeridos (lat, lng)', seq)
+    except ValueError as e:
+        raise FrameInvalido(str(e), seq)
+
+
+def codificar_gps_update(nino_id, lat, lng, nivel_bateria, dentro_area, timestamp):
+    """Frame binario de un gps_update (timestamp: datetime con zona)"""
+    return FRAME_GPS_UPDATE.pack(
+        GPS_UPDATE,
+        nino_id,
+        lat,
+        lng,
+        BATERIA_DESCONOCIDA if nivel_bateria is None else nivel_bateria,
+        DENTRO_AREA if dentro_area else 0,
+        int(timestamp.timestamp() * 1000),
+    )
+
+
+def decodificar_gps_update(frame):
+    """Inversa de codificar_gps_update (clientes de prueba y benchmarks)"""
+    tipo, nino_id, lat, lng, bateria, flags, timestamp_ms = FRAME_GPS_UPDATE.unpack(frame)
+    if tipo != GPS_UPDATE:
+        raise ValueError(f'Tipo de frame desconocido: {tipo}')
+    return {
+        'type': 'gps_update',
+        'nino_id': nino_id,
+        'lat': lat,
+        'lng': lng,
+        'nivel_bateria': None if bateria == BATERIA_DESCONOCIDA else bateria,
+        'dentro_area': bool(flags & DENTRO_AREA),
+        'timestamp_ms': timestamp_ms,
+    }
+
+
+def evento_gps_update(nino_id, lat, lng, nivel_bateria, dentro_area, timestamp):
+    """Evento gps_position_update para group_send, con el mensaje ya serializado"""
+    return {
+        'type': 'gps_position_update',
+        'nino_id': nino_id,
+        'texto': json.dumps({
+            'type': 'gps_update',
+            'nino_id': nino_id,
+            'lat': lat,
+            'lng': lng,
+            'nivel_bateria': nivel_bateria,
+            'dentro_area': dentro_area,
+            'timestamp': timestamp.isoformat(),
+        }),
+        'frame': codificar_gps_update(nino_id, lat, lng, nivel_bateria, dentro_area, timestamp),
+    }
+
+
+def evento_alerta(nino_id, nino_nombre, mensaje, timestamp):
+    """Evento alert_created para group_send, con el mensaje ya serializado"""
+    return {
+        'type': 'alert_created',
+        'nino_id': nino_id,
+        'texto': json.dumps({
+            'type': 'alert',
+            'nino_id': nino_id,
+            'nino_nombre': nino_nombre,
+            'mensaje': mensaje,
+            'timestamp': timestamp.isoformat(),
+        }),
+    }
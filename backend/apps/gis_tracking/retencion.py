@@ -0,0 +1,162 @@
+"""
+Retención y resumen (downsampling) de posiciones GPS históricas
+
+Las posiciones crudas se conservan GPS_RETENCION_DIAS_CRUDOS días. Las
+más antiguas se agregan en ResumenPosicion por intervalos fijos de
+GPS_RESUMEN_RESOLUCION_SEGUNDOS (centroide, velocidad máxima, batería
+mínima, proporción dentro del área) y se eliminan.
+
+El proceso es incremental: cada ejecución avanza en ventanas de
+GPS_RESUMEN_VENTANA_HORAS desde la posición pendiente más antigua y
+procesa como máximo GPS_RESUMEN_MAX_VENTANAS, cada una en su propia
+transacción.
+Si llegan posiciones atrasadas a un intervalo ya resumido, se combinan
+con el resumen existente.
+
+Las posiciones referenciadas por una alerta no se resumen ni se eliminan.
+"""
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import PosicionGPS, ResumenPosicion
+
+logger = logging.getLogger(__name__)
+
+
+def _truncar(momento, resolucion):
+    """Redondea hacia abajo al inicio del intervalo de `resolucion` segundos"""
+    segundos = int(momento.timestamp()) // resolucion * resolucion
+    return datetime.fromtimestamp(segundos, tz=dt_timezone.utc)
+
+
+def _sql_sin_alerta():
+    """Condición SQL (alias p) que excluye posiciones referenciadas por alertas"""
+    from apps.alerts.models import Alerta
+
+    return (
+        f'NOT EXISTS (SELECT 1 FROM {Alerta._meta.db_table} a '
+        f'WHERE a.posicion_gps_id = p.id)'
+    )
+
+
+def _primera_pendiente(corte):
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT MIN(p."timestamp") FROM {PosicionGPS._meta.db_table} p
+            WHERE p."timestamp" < %s AND {_sql_sin_alerta()}
+        """, [corte])
+        return cursor.fetchone()[0]
+
+
+def _resumir_ventana(desde, hasta, resolucion):
+    """
+    Mueve las posiciones crudas de [desde, hasta) a ResumenPosicion en
+    una sola sentencia (DELETE ... RETURNING + INSERT ... ON CONFLICT)
+
+    Returns:
+        int: Cantidad de posiciones crudas resumidas
+    """
+    tabla = ResumenPosicion._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"""
+            WITH movidas AS (
+                DELETE FROM {PosicionGPS._meta.db_table} p
+                WHERE p."timestamp" >= %s AND p."timestamp" < %s
+                  AND {_sql_sin_alerta()}
+                RETURNING p.nino_id, p."timestamp", p.ubicacion, p.dentro_area_segura,
+                          p.velocidad_kmh, p.nivel_bateria
+            ),
+            resumen AS (
+                INSERT INTO {tabla} AS r (
+                    nino_id, resolucion_segundos, inicio, centroide,
+                    primera_posicion, ultima_posicion, total_posiciones,
+                    proporcion_dentro, velocidad_max_kmh, bateria_min
+                )
+                SELECT
+                    nino_id,
+                    %s,
+                    to_timestamp(floor(extract(epoch FROM "timestamp") / %s) * %s),
+                    ST_Centroid(ST_Collect(ubicacion)),
+                    MIN("timestamp"),
+                    MAX("timestamp"),
+                    COUNT(*),
+                    AVG(dentro_area_segura::int),
+                    MAX(velocidad_kmh),
+                    MIN(nivel_bateria)
+                FROM movidas
+                GROUP BY 1, 3
+                ON CONFLICT (nino_id, resolucion_segundos, inicio) DO UPDATE SET
+                    centroide = ST_SetSRID(ST_MakePoint(
+                        (ST_X(r.centroide) * r.total_posiciones
+                            + ST_X(EXCLUDED.centroide) * EXCLUDED.total_posiciones)
+                            / (r.total_posiciones + EXCLUDED.total_posiciones),
+                        (ST_Y(r.centroide) * r.total_posiciones
+                            + ST_Y(EXCLUDED.centroide) * EXCLUDED.total_posiciones)
+                            / (r.total_posiciones + EXCLUDED.total_posiciones)
+                    ), 4326),
+                    proporcion_dentro = (
+                        r.proporcion_dentro * r.total_posiciones
+                        + EXCLUDED.proporcion_dentro * EXCLUDED.total_posiciones
+                    ) / (r.total_posiciones + EXCLUDED.total_posiciones),
+                    primera_posicion = LEAST(r.primera_posicion, EXCLUDED.primera_posicion),
+                    ultima_posicion = GREATEST(r.ultima_posicion, EXCLUDED.ultima_posicion),
+                    total_posiciones = r.total_posiciones + EXCLUDED.total_posiciones,
+                    velocidad_max_kmh = GREATEST(r.velocidad_max_kmh, EXCLUDED.velocidad_max_kmh),
+                    bateria_min = LEAST(r.bateria_min, EXCLUDED.bateria_min)
+            )
+            SELECT COUNT(*) FROM movidas
+        """, [desde, hasta, resolucion, resolucion, resolucion])
+        return cursor.fetchone()[0]
+
+
+def resumir_posiciones_antiguas(dias_crudos=None, max_ventanas=None):
+    """
+    Resume y elimina las posiciones crudas más antiguas que `dias_crudos`
+
+    Args:
+        dias_crudos: Días de posiciones crudas a conservar (0 = no resumir)
+        max_ventanas: Límite de ventanas a procesar en esta ejecución
+
+    Returns:
+        dict: Posiciones resumidas, ventanas procesadas y si quedó trabajo
+        pendiente para la próxima ejecución
+    """
+    if dias_crudos is None:
+        dias_crudos = settings.GPS_RETENCION_DIAS_CRUDOS
+    if max_ventanas is None:
+        max_ventanas = settings.GPS_RESUMEN_MAX_VENTANAS
+
+    resultado = {'resumidas': 0, 'ventanas': 0, 'pendiente': False}
+    if not dias_crudos:
+        return resultado
+
+    resolucion = settings.GPS_RESUMEN_RESOLUCION_SEGUNDOS
+    # Las ventanas se alinean a la resolución para no partir un intervalo
+    ventana = timedelta(
+        seconds=max(settings.GPS_RESUMEN_VENTANA_HORAS * 3600 // resolucion, 1) * resolucion
+    )
+    corte = _truncar(timezone.now() - timedelta(days=dias_crudos), resolucion)
+
+    while True:
+        # Saltar directo a la próxima posición pendiente (evita recorrer
+        # ventanas vacías cuando hay huecos en el historial)
+        primera = _primera_pendiente(corte)
+        if primera is None:
+            break
+        if resultado['ventanas'] >= max_ventanas:
+            resultado['pendiente'] = True
+            break
+        desde = _truncar(primera, resolucion)
+        hasta = min(desde + ventana, corte)
+        resultado['resumidas'] += _resumir_ventana(desde, hasta, resolucion)
+        resultado['ventanas'] += 1
+
+    logger.info(
+        f"🗜️ {resultado['resumidas']} posiciones GPS resumidas en "
+        f"{resultado['ventanas']} ventana(s) (corte {corte:%Y-%m-%d %H:%M})"
+    )
+    return resultado
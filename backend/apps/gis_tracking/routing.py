@@ -13,4 +13,10 @@ websocket_urlpatterns = [
         r'ws/tracking/tutor/(?P<tutor_id>\d+)/$',
         consumers.GPSTrackingConsumer.as_asgi()
     ),
+    # WebSocket de ingesta para el dispositivo del niño (token del dispositivo)
+    # URL: ws://servidor/ws/device/<dispositivo_id>/
+    re_path(
+        r'ws/device/(?P<dispositivo_id>[^/]+)/$',
+        consumers.DispositivoGPSConsumer.as_asgi()
+    ),
 ]
@@ -1,9 +1,15 @@
 """
 Servicios de análisis geoespacial y tracking
 """
+from django.conf import settings
 from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
 from django.utils import timezone
-from .models import PosicionGPS, Nino
+from .geofence import geofence_cache
+from .transiciones import FUERA, maquina_geocerca
+from .models import CentroEducativo, PosicionGPS, Nino, ResumenPosicion, UltimaPosicion
 
 
 class TrackingService:
@@ -42,17 +48,98 @@ class TrackingService:
         
         return posicion
     
+    @staticmethod
+    def registrar_posiciones_lote(nino_id, posiciones):
+        """
+        Registra un lote de posiciones GPS (dispositivo que estuvo offline)
+        
+        La geocerca del kinder se obtiene una sola vez para todo el lote, las
+        posiciones se insertan con un único bulk_create y solo se generan
+        alertas en las transiciones dentro -> fuera que ocurren en el lote.
+        
+        Args:
+            nino_id: ID del niño
+            posiciones: Lista de dicts con latitud, longitud y opcionalmente
+                timestamp, precision_metros, altitud, velocidad_kmh, nivel_bateria
+        
+        Returns:
+            tuple: (posiciones creadas en orden cronológico, alertas generadas)
+        """
+        nino = Nino.objects.select_related('centro_educativo').get(id=nino_id)
+        geocerca = geofence_cache.obtener(nino.centro_educativo_id)
+        
+        ahora = timezone.now()
+        nuevas = []
+        for dato in posiciones:
+            punto = Point(dato['longitud'], dato['latitud'], srid=4326)
+            posicion = PosicionGPS(
+                nino=nino,
+                ubicacion=punto,
+                timestamp=dato.get('timestamp') or ahora,
+                precision_metros=dato.get('precision_metros'),
+                altitud=dato.get('altitud'),
+                velocidad_kmh=dato.get('velocidad_kmh'),
+                nivel_bateria=dato.get('nivel_bateria'),
+            )
+            posicion.zona = geocerca.zona(punto)
+            posicion.dentro_area_segura = posicion.zona != FUERA
+            nuevas.append(posicion)
+        
+        return TrackingService.guardar_posiciones(nuevas)
+    
+    @staticmethod
+    def guardar_posiciones(posiciones):
+        """
+        Inserta posiciones ya evaluadas contra la geocerca
+        
+        Usa un único bulk_create (no pasa por PosicionGPS.save) y solo
+        genera alertas en las transiciones dentro <-> fuera de cada niño
+        (máquina de estados de apps/gis_tracking/transiciones.py).
+        Lo usan el endpoint de lotes y la ingesta write-behind del WebSocket.
+        
+        Args:
+            posiciones: Instancias de PosicionGPS sin guardar, con
+                dentro_area_segura ya calculado (pueden ser de varios niños)
+        
+        Returns:
+            tuple: (posiciones creadas en orden cronológico, alertas generadas)
+        """
+        if not posiciones:
+            return [], []
+        
+        posiciones = sorted(posiciones, key=lambda p: p.timestamp)
+        ninos_ids = {posicion.nino_id for posicion in posiciones}
+        
+        # Un solo proceso a la vez por niño hasta que su estado quede escrito
+        with maquina_geocerca.bloqueo(ninos_ids):
+            # Estado de geocerca de cada niño; UltimaPosicion solo se consulta
+            # para los que no tienen estado en caché
+            estados = maquina_geocerca.cargar(ninos_ids, UltimaPosicion.estados_dentro)
+            
+            with transaction.atomic():
+                creadas = PosicionGPS.objects.bulk_create(posiciones)
+                if UltimaPosicion.registrar(creadas):
+                    DashboardService.invalidar_estadisticas()
+                
+                alertas = maquina_geocerca.procesar(creadas, estados)
+        
+        return creadas, alertas
+    
     @staticmethod
     def obtener_ultima_posicion(nino_id):
         """Obtiene la última posición registrada del niño"""
-        return PosicionGPS.objects.filter(
-            nino_id=nino_id
-        ).order_by('-timestamp').first()
+        ultima = UltimaPosicion.objects.filter(nino_id=nino_id).first()
+        return ultima.como_posicion() if ultima else None
     
     @staticmethod
-    def obtener_historial_posiciones(nino_id, fecha_inicio=None, fecha_fin=None):
+    def obtener_historial_posiciones(nino_id, fecha_inicio=None, fecha_fin=None,
+                                     despues_de=None):
         """
-        Obtiene el historial de posiciones de un niño
+        Obtiene el historial de posiciones de un niño (más recientes primero)
+        
+        Args:
+            despues_de: (timestamp, id) de la última posición ya entregada,
+                para paginar por cursor sobre el índice (nino, -timestamp)
         """
         queryset = PosicionGPS.objects.filter(nino_id=nino_id)
         
@@ -60,8 +147,31 @@ class TrackingService:
             queryset = queryset.filter(timestamp__gte=fecha_inicio)
         if fecha_fin:
             queryset = queryset.filter(timestamp__lte=fecha_fin)
+        if despues_de:
+            timestamp, posicion_id = despues_de
+            queryset = queryset.filter(
+                Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=posicion_id)
+            )
+        
+        return queryset.order_by('-timestamp', '-id')
+    
+    @staticmethod
+    def obtener_historial_resumido(nino_id, fecha_inicio=None, fecha_fin=None):
+        """
+        Obtiene los resúmenes de posiciones (por minuto / 5 minutos) de un
+        niño, para períodos cuyas posiciones crudas ya fueron resumidas
+        """
+        queryset = ResumenPosicion.objects.filter(
+            nino_id=nino_id,
+            resolucion_segundos=settings.GPS_RESUMEN_RESOLUCION_SEGUNDOS
+        )
+        
+        if fecha_inicio:
+            queryset = queryset.filter(inicio__gte=fecha_inicio)
+        if fecha_fin:
+            queryset = queryset.filter(inicio__lte=fecha_fin)
         
-        return queryset.order_by('-timestamp')
+        return queryset.order_by('-inicio')
     
     @staticmethod
     def verificar_estado_nino(nino_id):
@@ -92,6 +202,162 @@ class TrackingService:
         }
 
 
+class DashboardService:
+    """
+    Estadísticas del dashboard web, cacheadas por unos segundos
+    
+    Se invalidan desde la ingesta cuando algún niño cambia de estado
+    dentro/fuera del área y cuando se crea o se atiende una alerta
+    (signals.py), así la carga de la página no depende de cuántos niños
+    hay.
+    """
+    
+    CACHE_KEY = 'dashboard_estadisticas'
+    
+    @staticmethod
+    def obtener_estadisticas():
+        """
+        Returns:
+            dict: total_ninos, total_centros, dentro_area, alertas_activas
+        """
+        estadisticas = cache.get(DashboardService.CACHE_KEY)
+        if estadisticas is None:
+            estadisticas = DashboardService.calcular_estadisticas()
+            cache.set(
+                DashboardService.CACHE_KEY,
+                estadisticas,
+                settings.DASHBOARD_CACHE_SEGUNDOS
+            )
+        return estadisticas
+    
+    @staticmethod
+    def calcular_estadisticas():
+        """Calcula todas las estadísticas con una sola consulta agregada"""
+        from apps.alerts.models import Alerta
+        
+        query = f"""
+            SELECT
+                COUNT(*) AS total_ninos,
+                COUNT(*) FILTER (WHERE u.dentro_area_segura) AS dentro_area,
+                (
+                    SELECT COUNT(*) FROM {CentroEducativo._meta.db_table}
+                    WHERE activo = TRUE
+                ) AS total_centros,
+                (
+                    SELECT COUNT(*) FROM {Alerta._meta.db_table}
+                    WHERE estado IN ('PENDIENTE', 'ENVIADA')
+                      AND tipo_alerta <> 'REGRESO_AREA'
+                ) AS alertas_activas
+            FROM
+                {Nino._meta.db_table} n
+            LEFT JOIN
+                {UltimaPosicion._meta.db_table} u ON u.nino_id = n.id
+            WHERE
+                n.activo = TRUE
+        """
+        
+        with connection.cursor() as cursor:
+            cursor.execute(query)
+            total_ninos, dentro_area, total_centros, alertas_activas = cursor.fetchone()
+        
+        return {
+            'total_ninos': total_ninos,
+            'total_centros': total_centros,
+            'dentro_area': dentro_area,
+            'alertas_activas': alertas_activas,
+        }
+    
+    @staticmethod
+    def invalidar_estadisticas():
+        """
+        Descarta las estadísticas al confirmarse la transacción actual (de
+        inmediato si no hay ninguna): antes, otra request podría volver a
+        cachear los valores viejos
+        """
+        transaction.on_commit(lambda: cache.delete(DashboardService.CACHE_KEY))
+
+
+class BusquedaCercanosService:
+    """
+    Búsqueda espacial de niños cercanos a un punto
+    
+    Trabaja sobre la última posición de cada niño (UltimaPosicion) con
+    ST_DWithin sobre el índice GiST de ubicacion::geography y ordena con
+    el operador KNN <->, así el costo no depende del tamaño del historial.
+    """
+    
+    COLUMNAS = [
+        'id', 'nombre', 'apellido_paterno', 'apellido_materno', 'lat', 'lng',
+        'distancia_metros', 'timestamp', 'dentro_area_segura', 'velocidad_kmh',
+        'precision_metros', 'nivel_bateria', 'kinder_nombre', 'kinder_direccion',
+    ]
+    
+    @staticmethod
+    def buscar(lat, lng, radio_metros, limite=None, despues_de=None):
+        """
+        Busca niños activos cuya última posición está dentro del radio
+        
+        Args:
+            lat, lng: Centro de la búsqueda
+            radio_metros: Radio de búsqueda en metros
+            limite: Máximo de filas a devolver (None = todas)
+            despues_de: Cursor (distancia_metros, nino_id) de la última fila
+                de la página anterior
+        
+        Returns:
+            list: Tuplas en el orden de COLUMNAS, ordenadas por distancia
+        """
+        parametros = [lng, lat, radio_metros]
+        filtro_cursor = ''
+        if despues_de is not None:
+            filtro_cursor = 'AND (u.ubicacion::geography <-> q.punto, n.id) > (%s, %s)'
+            parametros.extend(despues_de)
+        
+        limite_sql = ''
+        if limite is not None:
+            limite_sql = 'LIMIT %s'
+            parametros.append(limite)
+        
+        # La distancia KNN (<->) sobre geography es en metros (esfera) y se
+        # calcula una sola vez por fila candidata
+        query = f"""
+            SELECT
+                n.id,
+                n.nombre,
+                n.apellido_paterno,
+                n.apellido_materno,
+                ST_Y(u.ubicacion) AS lat,
+                ST_X(u.ubicacion) AS lng,
+                u.ubicacion::geography <-> q.punto AS distancia_metros,
+                u.timestamp,
+                u.dentro_area_segura,
+                u.velocidad_kmh,
+                u.precision_metros,
+                u.nivel_bateria,
+                ce.nombre AS kinder_nombre,
+                ce.direccion AS kinder_direccion
+            FROM
+                (SELECT ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography AS punto) q
+            CROSS JOIN
+                {UltimaPosicion._meta.db_table} u
+            INNER JOIN
+                {Nino._meta.db_table} n ON n.id = u.nino_id
+            INNER JOIN
+                {CentroEducativo._meta.db_table} ce ON n.centro_educativo_id = ce.id
+            WHERE
+                ST_DWithin(u.ubicacion::geography, q.punto, %s)
+                AND n.activo = TRUE
+                {filtro_cursor}
+            ORDER BY
+                u.ubicacion::geography <-> q.punto, n.id
+            {limite_sql}
+        """
+        
+        with connection.cursor() as cursor:
+            cursor.execute(query, parametros)
+            return cursor.fetchall()
+
+
 class AnalisisSpatial:
     """
     Servicios de análisis espacial avanzado
@@ -101,6 +367,9 @@ class AnalisisSpatial:
     def calcular_ruta_movimiento(nino_id, fecha_inicio, fecha_fin):
         """
         Genera una LineString con la ruta de movimiento del niño
+        
+        Los tramos más antiguos que la retención de posiciones crudas se
+        arman con los centroides de ResumenPosicion.
         """
         from django.contrib.gis.geos import LineString
         
@@ -108,13 +377,17 @@ class AnalisisSpatial:
             nino_id=nino_id,
             timestamp__gte=fecha_inicio,
             timestamp__lte=fecha_fin
-        ).order_by('timestamp')
+        ).values_list('timestamp', 'ubicacion')
+        
+        resumenes = TrackingService.obtener_historial_resumido(
+            nino_id, fecha_inicio, fecha_fin
+        ).values_list('inicio', 'centroide')
         
-        if posiciones.count() < 2:
+        puntos = sorted([*posiciones, *resumenes], key=lambda punto: punto[0])
+        if len(puntos) < 2:
             return None
         
-        puntos = [pos.ubicacion for pos in posiciones]
-        return LineString(puntos, srid=4326)
+        return LineString([ubicacion for _, ubicacion in puntos], srid=4326)
     
     @staticmethod
     def detectar_puntos_salida(nino_id, fecha_inicio=None, fecha_fin=None):
@@ -0,0 +1,32 @@
+"""
+Señales del módulo de tracking
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.alerts.models import Alerta
+
+from .geofence import geofence_cache
+from .models import CentroEducativo
+from .services import DashboardService
+
+
+@receiver(post_save, sender=CentroEducativo)
+@receiver(post_delete, sender=CentroEducativo)
+def invalidar_geocerca(sender, instance, **kwargs):
+    """
+    Descarta la geocerca en caché cuando cambia el área del centro
+    
+    Al confirmar: si otro proceso viera la versión nueva antes del commit,
+    leería el polígono viejo y lo guardaría como vigente.
+    """
+    centro_id = instance.pk  # post_delete: el pk se borra después
+    transaction.on_commit(lambda: geofence_cache.invalidar(centro_id))
+
+
+@receiver(post_save, sender=Alerta)
+@receiver(post_delete, sender=Alerta)
+def invalidar_estadisticas_alertas(sender, instance, **kwargs):
+    """Las alertas activas del dashboard cambian al crear o atender una alerta"""
+    DashboardService.invalidar_estadisticas()
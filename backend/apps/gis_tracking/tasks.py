@@ -0,0 +1,25 @@
+"""
+Tareas periódicas (Celery) de tracking GPS
+"""
+from celery import shared_task
+
+from .particiones import crear_particiones_futuras, expirar_particiones
+from .retencion import resumir_posiciones_antiguas
+
+
+@shared_task(ignore_result=True)
+def gestionar_particiones_gps():
+    """Crea las particiones mensuales futuras y expira las antiguas"""
+    creadas = crear_particiones_futuras()
+    expiradas = expirar_particiones()
+    return {'creadas': creadas, 'expiradas': expiradas}
+
+
+@shared_task(ignore_result=True)
+def resumir_posiciones_gps():
+    """Resume y elimina las posiciones crudas fuera del período de retención"""
+    resultado = resumir_posiciones_antiguas()
+    if resultado['pendiente']:
+        # Quedó trabajo atrasado: continuar sin esperar al próximo ciclo
+        resumir_posiciones_gps.apply_async(countdown=5)
+    return resultado
@@ -0,0 +1,270 @@
+"""
+Máquina de estados de geocerca por niño (dentro / fuera del área)
+
+En lugar de intentar crear una alerta con cada fix fuera del área, cada
+niño tiene un estado DENTRO o FUERA que solo cambia con una transición
+confirmada, y solo las transiciones generan eventos:
+
+- DENTRO -> FUERA: alerta SALIDA_AREA
+- FUERA -> DENTRO: alerta REGRESO_AREA
+
+Histéresis: para salir hay que estar fuera del área con margen y para
+volver hay que estar dentro del área estricta; en la franja del margen
+(BORDE) el estado no cambia, así el ruido del GPS en el límite no genera
+salidas y regresos alternados.
+
+Permanencia: la zona nueva debe sostenerse GEOFENCE_PERMANENCIA_SEGUNDOS
+(medidos con el timestamp de los fixes) antes de confirmar la transición.
+Con 0, la primera posición fuera del margen ya es una salida.
+
+El estado vive en la caché de Django. Sin estado en caché se parte del
+último estado conocido que indique el llamador o, si no hay, de DENTRO.
+
+Concurrencia: quien procesa posiciones de un niño toma su bloqueo()
+(cargar -> transiciones -> commit) y el estado nuevo se escribe con
+transaction.on_commit, así un rollback no deja en caché transiciones
+cuyas alertas no existen. El bloqueo y el estado son tan compartidos
+como la caché: con más de un proceso (workers de gunicorn/daphne,
+Celery) CACHE_URL debe apuntar a Redis; con la caché local cada proceso
+tendría su propia máquina de estados.
+"""
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+DENTRO = 'DENTRO'
+FUERA = 'FUERA'
+BORDE = 'BORDE'
+
+# Evento que genera cada transición confirmada (estado de llegada -> tipo de alerta)
+EVENTOS = {
+    FUERA: 'SALIDA_AREA',
+    DENTRO: 'REGRESO_AREA',
+}
+
+
+def zona_de(posicion):
+    """
+    Zona de la posición: la calculada con la geocerca al construirla
+    (atributo `zona`) o, si no se calculó, la que indica dentro_area_segura
+    """
+    zona = getattr(posicion, 'zona', None)
+    if zona is not None:
+        return zona
+    return DENTRO if posicion.dentro_area_segura else FUERA
+
+
+class EstadoGeocerca:
+    """Estado de un niño: (estado, candidato, desde, último fix) en epoch"""
+
+    __slots__ = ('estado', 'candidato', 'desde', 'ultimo')
+
+    def __init__(self, estado=DENTRO, candidato=None, desde=None, ultimo=None):
+        self.estado = estado
+        self.candidato = candidato
+        self.desde = desde
+        self.ultimo = ultimo
+
+    def como_tupla(self):
+        return (self.estado, self.candidato, self.desde, self.ultimo)
+
+    def avanzar(self, zona, momento, permanencia):
+        """
+        Aplica un fix y devuelve el nuevo estado si hubo transición (o None)
+
+        Los fixes más antiguos que el último procesado (lotes atrasados)
+        no cambian el estado.
+        """
+        if self.ultimo is not None and momento < self.ultimo:
+            return None
+        self.ultimo = momento
+
+        objetivo = self.estado if zona == BORDE else zona
+        if objetivo == self.estado:
+            self.candidato = self.desde = None
+            return None
+
+        if self.candidato != objetivo:
+            self.candidato, self.desde = objetivo, momento
+        if momento - self.desde < permanencia:
+            return None
+
+        self.estado = objetivo
+        self.candidato = self.desde = None
+        return objetivo
+
+
+class BloqueoGeocercaOcupado(Exception):
+    """Otro proceso retiene el bloqueo de un niño más de lo esperable"""
+
+
+class MaquinaGeocerca:
+    """Procesa posiciones y genera las alertas de las transiciones"""
+
+    def __init__(self):
+        # Token por hilo: identifica los bloqueos cuyo commit está pendiente
+        self._hilo = threading.local()
+
+    @staticmethod
+    def _clave(nino_id):
+        return f'geocerca_estado_{nino_id}'
+
+    @staticmethod
+    def _clave_bloqueo(nino_id):
+        return f'geocerca_bloqueo_{nino_id}'
+
+    @contextmanager
+    def bloqueo(self, ninos_ids):
+        """
+        Serializa entre procesos el procesamiento de los niños
+
+        Debe envolver cargar(), la transacción que llama a procesar() y su
+        commit, para que otro proceso no lea el estado antes de que se
+        escriba. Es un lock en la caché (cache.add es atómico en Redis)
+        que expira tras GEOFENCE_BLOQUEO_SEGUNDOS si quien lo tenía murió.
+
+        Si el llamador ya está en una transacción, el estado se escribe
+        recién en su commit: el bloqueo se libera también al commit (o
+        al vencer, si la transacción se revierte). Mientras tanto el mismo
+        hilo puede volver a tomarlo.
+
+        Raises:
+            BloqueoGeocercaOcupado: Si otro proceso lo retiene más de
+                GEOFENCE_BLOQUEO_ESPERA_SEGUNDOS
+        """
+        token = self._token_del_hilo()
+        tomadas = []
+        try:
+            # Siempre en el mismo orden: dos lotes con niños en común no se bloquean entre sí
+            for nino_id in sorted(ninos_ids):
+                clave = self._clave_bloqueo(nino_id)
+                if self._esperar(clave, token):
+                    tomadas.append(clave)
+            yield
+        except BaseException:
+            # Las escrituras de estado de una transacción revertida no ocurren
+            self._liberar(tomadas, token)
+            raise
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: self._liberar(tomadas, token))
+        else:
+            self._liberar(tomadas, token)
+
+    def _token_del_hilo(self):
+        if not hasattr(self._hilo, 'token'):
+            self._hilo.token = uuid.uuid4().hex
+        return self._hilo.token
+
+    @staticmethod
+    def _esperar(clave, token):
+        """Toma la clave; False si este hilo ya la tenía (commit pendiente)"""
+        limite = time.monotonic() + settings.GEOFENCE_BLOQUEO_ESPERA_SEGUNDOS
+        while not cache.add(clave, token, settings.GEOFENCE_BLOQUEO_SEGUNDOS):
+            if cache.get(clave) == token:
+                return False
+            if time.monotonic() > limite:
+                logger.error(f'❌ Bloqueo de geocerca {clave} ocupado por más de '
+                             f'{settings.GEOFENCE_BLOQUEO_ESPERA_SEGUNDOS}s')
+                raise BloqueoGeocercaOcupado(clave)
+            time.sleep(0.01)
+        return True
+
+    @staticmethod
+    def _liberar(tomadas, token):
+        if tomadas:
+            propias = [clave for clave, valor in cache.get_many(tomadas).items() if valor == token]
+            cache.delete_many(propias)
+
+    def cargar(self, ninos_ids, previos=None):
+        """
+        Estados de los niños desde la caché (una sola lectura)
+
+        Args:
+            previos: Función que recibe los ids sin estado en caché y
+                devuelve {nino_id: dentro_area_segura} (p. ej.
+                UltimaPosicion.estados_dentro); solo se llama si falta alguno
+        """
+        en_cache = cache.get_many([self._clave(nino_id) for nino_id in ninos_ids])
+        estados = {}
+        faltantes = []
+        for nino_id in ninos_ids:
+            guardado = en_cache.get(self._clave(nino_id))
+            if guardado is not None:
+                estados[nino_id] = EstadoGeocerca(*guardado)
+            else:
+                faltantes.append(nino_id)
+
+        conocidos = previos(faltantes) if faltantes and previos else {}
+        for nino_id in faltantes:
+            estados[nino_id] = EstadoGeocerca(DENTRO if conocidos.get(nino_id, True) else FUERA)
+        return estados
+
+    def guardar(self, estados):
+        cache.set_many(
+            {self._clave(nino_id): estado.como_tupla() for nino_id, estado in estados.items()},
+            settings.GEOFENCE_ESTADO_TTL_SEGUNDOS
+        )
+
+    def transiciones(self, posiciones, estados=None):
+        """
+        Avanza la máquina con las posiciones (en orden cronológico)
+
+        El estado se guarda en la caché al confirmarse la transacción en
+        curso (de inmediato si no hay ninguna).
+
+        Args:
+            estados: Resultado de cargar() si se leyó antes (p. ej. antes
+                de actualizar UltimaPosicion); si no, se carga aquí
+
+        Returns:
+            list: [(posicion, tipo de evento), ...] de las transiciones
+            confirmadas
+        """
+        if not posiciones:
+            return []
+
+        permanencia = settings.GEOFENCE_PERMANENCIA_SEGUNDOS
+        if estados is None:
+            estados = self.cargar({posicion.nino_id for posicion in posiciones})
+
+        eventos = []
+        for posicion in posiciones:
+            nuevo = estados[posicion.nino_id].avanzar(
+                zona_de(posicion), posicion.timestamp.timestamp(), permanencia
+            )
+            if nuevo is not None:
+                eventos.append((posicion, EVENTOS[nuevo]))
+
+        # Recién con el commit: si la transacción se revierte el estado no avanza
+        transaction.on_commit(lambda: self.guardar(estados))
+        return eventos
+
+    def procesar(self, posiciones, estados=None):
+        """
+        Avanza la máquina y crea las alertas de las transiciones
+
+        Returns:
+            list: Alertas creadas
+        """
+        from apps.alerts.models import Alerta
+
+        alertas = []
+        for posicion, evento in self.transiciones(posiciones, estados):
+            if evento == 'SALIDA_AREA':
+                alerta = Alerta.crear_alerta_salida(posicion)
+            else:
+                alerta = Alerta.crear_alerta_regreso(posicion)
+            if alerta:
+                alertas.append(alerta)
+        return alertas
+
+
+maquina_geocerca = MaquinaGeocerca()
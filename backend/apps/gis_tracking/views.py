@@ -1,29 +1,14 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.utils import timezone
-from datetime import timedelta
-from .models import CentroEducativo, Nino, PosicionGPS
+from .services import DashboardService
 from apps.alerts.models import Alerta
 
 
 @login_required
 def dashboard(request):
     """Vista principal del dashboard"""
-    # Estadísticas
-    total_ninos = Nino.objects.filter(activo=True).count()
-    total_centros = CentroEducativo.objects.filter(activo=True).count()
-    
-    # Contar niños dentro del área (última posición)
-    dentro_area = 0
-    for nino in Nino.objects.filter(activo=True):
-        ultima_pos = PosicionGPS.objects.filter(nino=nino).order_by('-timestamp').first()
-        if ultima_pos and ultima_pos.dentro_area_segura:
-            dentro_area += 1
-    
-    # Alertas activas
-    alertas_activas = Alerta.objects.filter(
-        estado__in=['PENDIENTE', 'ENVIADA']
-    ).count()
+    # Estadísticas (una consulta agregada, cacheada unos segundos)
+    estadisticas = DashboardService.obtener_estadisticas()
     
     # Alertas recientes (últimas 5)
     alertas_recientes = Alerta.objects.select_related(
@@ -31,10 +16,7 @@ def dashboard(request):
     ).order_by('-fecha_creacion')[:5]
     
     context = {
-        'total_ninos': total_ninos,
-        'total_centros': total_centros,
-        'dentro_area': dentro_area,
-        'alertas_activas': alertas_activas,
+        **estadisticas,
         'alertas_recientes': alertas_recientes,
     }
     
@@ -1,6 +1,5 @@
 # Config package
-# Celery comentado temporalmente
-# from .celery import app as celery_app
-
-# __all__ = ('celery_app',)
+# Celery app cargada al iniciar Django para que @shared_task use su configuración
+from .celery import app as celery_app
 
+__all__ = ('celery_app',)
@@ -82,6 +82,20 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Cache: Redis compartido entre procesos si se configura, si no memoria local.
+# Obligatorio con más de un proceso: el estado y el bloqueo de la máquina de
+# geocerca (apps/gis_tracking/transiciones.py), las versiones de las geocercas
+# en memoria (geofence.py) y el cooldown de alertas viven aquí
+CACHE_URL = config('CACHE_URL', default='')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_URL,
+    } if CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
 # Database - PostgreSQL with PostGIS (DigitalOcean)
 DATABASES = {
     'default': {
@@ -145,6 +159,8 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
 }
+# Serializadores rápidos desde .values() en los listados más usados (apps/api/fast_serializers.py)
+API_SERIALIZACION_RAPIDA = config('API_SERIALIZACION_RAPIDA', default=True, cast=bool)
 
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # Solo para desarrollo
@@ -160,18 +176,87 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    # Particiones mensuales de posiciones GPS (ver apps/gis_tracking/particiones.py)
+    'gestionar-particiones-gps': {
+        'task': 'apps.gis_tracking.tasks.gestionar_particiones_gps',
+        'schedule': 60 * 60 * 24,  # Diario
+    },
+    # Resumen de posiciones antiguas (ver apps/gis_tracking/retencion.py)
+    'resumir-posiciones-gps': {
+        'task': 'apps.gis_tracking.tasks.resumir_posiciones_gps',
+        'schedule': 60 * 15,  # Cada 15 minutos
+    },
+    # Limpieza de tokens FCM inválidos o abandonados (ver alerts.DeviceToken)
+    'podar-tokens-dispositivo': {
+        'task': 'apps.alerts.tasks.podar_tokens_dispositivo',
+        'schedule': 60 * 60 * 24,  # Diario
+    },
+}
 
 # GeoDjango settings
 GDAL_LIBRARY_PATH = config('GDAL_LIBRARY_PATH', default=None)
 GEOS_LIBRARY_PATH = config('GEOS_LIBRARY_PATH', default=None)
 DEFAULT_SRID = 4326  # WGS84 - GPS estándar
+GEOFENCE_SRID_METRICO = 32720  # WGS84 / UTM zona 20S (Santa Cruz) para márgenes en metros
 
 # Firebase (Push notifications)
 FIREBASE_CREDENTIALS_PATH = config('FIREBASE_CREDENTIALS_PATH', default='')
+# Enviar las notificaciones de alertas en Celery (False = en el mismo request)
+ALERTAS_ENVIO_ASINCRONO = config('ALERTAS_ENVIO_ASINCRONO', default=True, cast=bool)
+# Transporte de push: FCM si hay credenciales, si no TransporteNulo (descarta).
+# apps.alerts.transportes.TransporteLocal = fake en memoria para tests/benchmarks
+NOTIFICACIONES_TRANSPORTE = config(
+    'NOTIFICACIONES_TRANSPORTE',
+    default='apps.alerts.transportes.TransporteFCM' if FIREBASE_CREDENTIALS_PATH
+    else 'apps.alerts.transportes.TransporteNulo'
+)
+PUSH_TOKEN_MAX_FALLOS = 5  # Fallos seguidos para desactivar un DeviceToken
+PUSH_TOKEN_DIAS_SIN_EXITO = 60  # Eliminar tokens sin un envío exitoso en 60 días
 
 # Tracking settings
 GPS_UPDATE_INTERVAL_SECONDS = 30  # Actualización GPS cada 30 segundos
 ALERT_COOLDOWN_MINUTES = 5  # No enviar alertas repetidas en 5 minutos
+# Cooldown en caché (sin consultar la BD); requiere la caché compartida de
+# CACHE_URL: con la local, una alerta atendida en un proceso no libera a los demás
+ALERT_COOLDOWN_EN_CACHE = config('ALERT_COOLDOWN_EN_CACHE', default=bool(CACHE_URL), cast=bool)
+# Máquina de estados de geocerca (apps/gis_tracking/transiciones.py)
+GEOFENCE_PERMANENCIA_SEGUNDOS = config('GEOFENCE_PERMANENCIA_SEGUNDOS', default=0, cast=int)  # 0 = transición en el primer fix
+GEOFENCE_ESTADO_TTL_SEGUNDOS = 60 * 60 * 24  # Estado dentro/fuera en caché
+GEOFENCE_BLOQUEO_SEGUNDOS = 30  # Vencimiento del bloqueo por niño si el proceso que lo tenía murió
+GEOFENCE_BLOQUEO_ESPERA_SEGUNDOS = 10  # Espera máxima por el bloqueo antes de fallar
+GPS_BATCH_MAX_POSICIONES = 1000  # Máximo de posiciones por lote (dispositivos que estuvieron offline)
+GEOFENCE_CACHE_VERSION_SEGUNDOS = 5  # Cada cuánto revisar si otro proceso cambió una geocerca
+DASHBOARD_CACHE_SEGUNDOS = 15  # Estadísticas del dashboard (se invalidan al cambiar un estado)
+GPS_HISTORIAL_CHUNK_SIZE = 2000  # Filas por bloque al transmitir el historial en streaming
+
+# Ingesta GPS por WebSocket: transmitir de inmediato y escribir en lotes (write-behind)
+GPS_WS_WRITE_BEHIND = config('GPS_WS_WRITE_BEHIND', default=False, cast=bool)
+GPS_WS_FLUSH_MS = 200  # Escribir el buffer como máximo cada 200 ms
+GPS_WS_FLUSH_FILAS = 500  # ... o al acumular 500 posiciones
+GPS_WS_MAX_PENDIENTES = 5000  # Sobre este límite los consumers esperan al flush (backpressure)
+GPS_WS_FLUSH_MAX_REINTENTOS = 5  # Reintentos (con backoff) de un lote que no se pudo escribir
+# Coalescing por conexión de tutor: último fix de cada niño, como máximo N veces por segundo
+GPS_WS_HZ_DEFECTO = config('GPS_WS_HZ_DEFECTO', default=1, cast=float)
+GPS_WS_HZ_MINIMO = 0.1  # Rango permitido para el "max_hz" del mensaje subscribe
+GPS_WS_HZ_MAXIMO = 10
+# Obsoleto: aceptar gps_update de la app Flutter por ws/tracking/tutor/ (antes de
+# ws/device/). Desactivar cuando todos los dispositivos usen ws/device/<dispositivo_id>/
+GPS_WS_INGESTA_TUTOR = config('GPS_WS_INGESTA_TUTOR', default=True, cast=bool)
+# Ack por lotes a los dispositivos (ws/device/): cada 20 frames o cada segundo
+GPS_DEVICE_ACK_FRAMES = 20
+GPS_DEVICE_ACK_MS = 1000
+
+# Particiones mensuales de PosicionGPS (comando gestionar_particiones / Celery beat)
+GPS_PARTICIONES_MESES_FUTUROS = 3  # Crear particiones con 3 meses de anticipación
+GPS_PARTICIONES_RETENCION_MESES = config('GPS_PARTICIONES_RETENCION_MESES', default=0, cast=int)  # 0 = conservar todo
+GPS_PARTICIONES_ELIMINAR = config('GPS_PARTICIONES_ELIMINAR', default=False, cast=bool)  # False = solo DETACH
+
+# Retención de posiciones crudas: las más antiguas se resumen en ResumenPosicion
+GPS_RETENCION_DIAS_CRUDOS = config('GPS_RETENCION_DIAS_CRUDOS', default=0, cast=int)  # 0 = conservar todas
+GPS_RESUMEN_RESOLUCION_SEGUNDOS = config('GPS_RESUMEN_RESOLUCION_SEGUNDOS', default=60, cast=int)  # 60 o 300
+GPS_RESUMEN_VENTANA_HORAS = 6  # Horas de historial procesadas por transacción
+GPS_RESUMEN_MAX_VENTANAS = 20  # Ventanas por ejecución de la tarea periódica
 
 # CSRF Configuration for HTTPS
 CSRF_TRUSTED_ORIGINS = [
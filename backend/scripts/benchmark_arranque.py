@@ -0,0 +1,121 @@
+"""
+Benchmark del tiempo de arranque (imports) de los procesos del backend
+
+Lanza cada punto de entrada en un proceso nuevo con `python -X importtime`
+y reporta el tiempo total de imports, los módulos más costosos y si se
+cargó algún SDK que debería ser perezoso (firebase_admin, google-auth).
+
+- manage.py: django.setup() + carga de URLs (lo que hace cualquier comando)
+- asgi: config.asgi (Daphne/Uvicorn, con el routing de WebSockets)
+- celery: worker con el autodiscover de todas las tareas
+
+Con --verificar termina con código 1 si se supera el presupuesto o se
+importa un módulo prohibido (lo usa el test de arranque).
+
+Uso:
+    python scripts/benchmark_arranque.py
+    python scripts/benchmark_arranque.py --top 20
+    python scripts/benchmark_arranque.py --verificar --factor 2
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+backend_dir = Path(__file__).resolve().parent.parent
+
+PUNTOS_DE_ENTRADA = {
+    'manage.py': (
+        'import django; django.setup(); '
+        'from django.urls import get_resolver; get_resolver().url_patterns'
+    ),
+    'asgi': 'import config.asgi',
+    'celery': (
+        'import django; django.setup(); '
+        'from config.celery import app; app.loader.import_default_modules()'
+    ),
+}
+
+# Presupuesto de imports (ms) por punto de entrada
+PRESUPUESTOS_MS = {
+    'manage.py': 1500,
+    'asgi': 2000,
+    'celery': 2000,
+}
+
+# SDKs que solo deben cargarse al usarlos (ver apps/alerts/transportes.py)
+MODULOS_PROHIBIDOS = ('firebase_admin', 'google.auth', 'google.cloud', 'grpc')
+
+
+def medir_imports(codigo):
+    """
+    Ejecuta `codigo` en un intérprete nuevo con -X importtime
+
+    Returns:
+        tuple: (total_ms, {módulo: acumulado_ms})
+    """
+    entorno = dict(os.environ, DJANGO_SETTINGS_MODULE='config.settings')
+    proceso = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', codigo],
+        cwd=backend_dir, env=entorno, capture_output=True, text=True,
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(proceso.stderr.strip().splitlines()[-1])
+
+    total_us = 0
+    modulos = {}
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith('import time:') or 'cumulative' in linea:
+            continue
+        propio, acumulado, modulo = linea[len('import time:'):].split('|')
+        total_us += int(propio)
+        modulos[modulo.strip()] = int(acumulado) / 1000
+    return total_us / 1000, modulos
+
+
+def prohibidos(modulos):
+    return sorted(
+        modulo for modulo in modulos
+        if any(modulo == p or modulo.startswith(f'{p}.') for p in MODULOS_PROHIBIDOS)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--top', type=int, default=10, help='Módulos más costosos a mostrar')
+    parser.add_argument('--verificar', action='store_true', help='Fallar si se supera el presupuesto')
+    parser.add_argument('--factor', type=float, default=1.0, help='Multiplicador del presupuesto (CI lentos)')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("⏱️  BENCHMARK DE ARRANQUE (python -X importtime)")
+    print("=" * 60)
+
+    todo_ok = True
+    for nombre, codigo in PUNTOS_DE_ENTRADA.items():
+        total_ms, modulos = medir_imports(codigo)
+        presupuesto = PRESUPUESTOS_MS[nombre] * args.factor
+        cargados = prohibidos(modulos)
+        ok = total_ms <= presupuesto and not cargados
+        todo_ok &= ok
+
+        print(
+            f"\n{'✅' if ok else '❌'} {nombre}: {total_ms:.0f} ms en imports "
+            f"(presupuesto {presupuesto:.0f} ms, {len(modulos)} módulos)"
+        )
+        if cargados:
+            print(f"   🚫 Módulos que deberían ser perezosos: {', '.join(cargados[:5])}")
+        mas_costosos = sorted(
+            ((ms, modulo) for modulo, ms in modulos.items() if '.' not in modulo),
+            reverse=True
+        )[:args.top]
+        for ms, modulo in mas_costosos:
+            print(f"   {ms:8.1f} ms  {modulo}")
+
+    if args.verificar:
+        sys.exit(0 if todo_ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Micro-benchmark del costo por destinatario de un gps_update transmitido
+
+Simula un grupo de N tutores suscritos a un niño y entrega el mismo
+evento a cada GPSTrackingConsumer (sin red, capa de canales ni
+coalescing, con un send() que solo cuenta), comparando:
+
+- Por destinatario: el evento trae solo los campos y cada consumer arma
+  el dict y llama a json.dumps (comportamiento anterior)
+- Serializado una vez: protocolo.evento_gps_update arma el JSON (y el
+  frame binario) en quien emite; los consumers lo reenvían tal cual
+- Binario: igual, para tutores con el subprotocolo binario
+
+Uso:
+    python scripts/benchmark_broadcast.py
+    python scripts/benchmark_broadcast.py --suscriptores 1000 --fixes 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+# Configurar Django
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django
+django.setup()
+
+from django.utils import timezone
+
+from apps.gis_tracking import protocolo
+from apps.gis_tracking.consumers import GPSTrackingConsumer
+
+
+class ConsumerMedido(GPSTrackingConsumer):
+    """Consumer sin socket: send() solo cuenta los bytes"""
+
+    def __init__(self, binario=False):
+        super().__init__()
+        self.binario = binario
+        self.bytes_enviados = 0
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        self.bytes_enviados += len(bytes_data) if bytes_data is not None else len(text_data)
+
+
+def evento_por_campos(nino_id, ahora):
+    return {
+        'type': 'gps_position_update',
+        'nino_id': nino_id,
+        'lat': -17.7833,
+        'lng': -63.1812,
+        'nivel_bateria': 80,
+        'dentro_area': True,
+        'timestamp': ahora.isoformat(),
+    }
+
+
+def evento_serializado(nino_id, ahora):
+    return protocolo.evento_gps_update(nino_id, -17.7833, -63.1812, 80, True, ahora)
+
+
+async def medir(crear_evento, suscriptores, fixes, binario=False):
+    """
+    Returns:
+        tuple: (µs por destinatario, bytes por destinatario)
+    """
+    consumers = [ConsumerMedido(binario) for _ in range(suscriptores)]
+    inicio = time.perf_counter()
+    for fix in range(fixes):
+        # El emisor arma el evento una vez por fix (se incluye en la medición)
+        evento = crear_evento(1, timezone.now())
+        for consumer in consumers:
+            await consumer.enviar_gps_update(evento)
+    duracion = time.perf_counter() - inicio
+    entregas = suscriptores * fixes
+    total_bytes = sum(consumer.bytes_enviados for consumer in consumers)
+    return duracion / entregas * 1e6, total_bytes / entregas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--suscriptores', type=int, default=1000, help='Tutores en el grupo del niño')
+    parser.add_argument('--fixes', type=int, default=100, help='Fixes transmitidos')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("⏱️  BENCHMARK BROADCAST: SERIALIZAR POR DESTINATARIO vs UNA VEZ")
+    print("=" * 60)
+
+    casos = [
+        ('Por destinatario', evento_por_campos, False),
+        ('Serializado una vez', evento_serializado, False),
+        ('Binario', evento_serializado, True),
+    ]
+    base = None
+    print(f"\n📋 {args.suscriptores} suscriptores, {args.fixes} fixes")
+    for nombre, crear_evento, binario in casos:
+        us, bytes_entrega = asyncio.run(medir(crear_evento, args.suscriptores, args.fixes, binario))
+        base = base or us
+        print(f"   {nombre:20s} {us:8.2f} µs/destinatario  {bytes_entrega:6.0f} bytes  x{base / us:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark de la búsqueda de niños cercanos (KNN sobre UltimaPosicion)
+
+Mide la latencia de BusquedaCercanosService.buscar con un historial
+grande de PosicionGPS, para verificar que no depende de su tamaño.
+
+Uso:
+    python scripts/benchmark_busqueda_cercanos.py
+    python scripts/benchmark_busqueda_cercanos.py --generar 10000000
+
+--generar inserta posiciones históricas sintéticas para los niños activos
+existentes (usar solo en una BD de pruebas).
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Configurar Django
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+from apps.gis_tracking.models import Nino, PosicionGPS, UltimaPosicion
+from apps.gis_tracking.services import BusquedaCercanosService
+
+
+# Centro de Santa Cruz
+LAT = -17.7833
+LNG = -63.1821
+
+
+def generar_historial(filas):
+    """Inserta posiciones sintéticas (cada 30 s) repartidas entre los niños activos"""
+    ninos = Nino.objects.filter(activo=True).count()
+    if not ninos:
+        print("❌ No hay niños activos. Ejecuta primero generar_datos_masivos.py")
+        sys.exit(1)
+
+    por_nino = filas // ninos
+    print(f"📥 Insertando {por_nino * ninos:,} posiciones ({por_nino:,} por niño)...")
+
+    inicio = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {PosicionGPS._meta.db_table} (
+                nino_id, ubicacion, timestamp, dentro_area_segura
+            )
+            SELECT
+                n.id,
+                ST_SetSRID(ST_MakePoint(
+                    %s + (random() - 0.5) * 0.2,
+                    %s + (random() - 0.5) * 0.2
+                ), 4326),
+                now() - (g * interval '30 seconds'),
+                random() > 0.1
+            FROM generate_series(1, %s) g
+            CROSS JOIN (
+                SELECT id FROM {Nino._meta.db_table} WHERE activo = TRUE
+            ) n
+        """, [LNG, LAT, por_nino])
+        cursor.execute(f"ANALYZE {PosicionGPS._meta.db_table}")
+    print(f"   ✅ Listo en {time.perf_counter() - inicio:.1f} s")
+
+
+def medir(radio, limite, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        filas = BusquedaCercanosService.buscar(LAT, LNG, radio, limite=limite)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+
+    tiempos.sort()
+    p95 = tiempos[max(0, int(len(tiempos) * 0.95) - 1)]
+    print(
+        f"   radio={radio:>6} m  limite={str(limite):>5}  filas={len(filas):>5}  "
+        f"p50={statistics.median(tiempos):7.2f} ms  p95={p95:7.2f} ms"
+    )
+    return p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--generar', type=int, default=0,
+                        help='Filas históricas sintéticas a insertar antes de medir')
+    parser.add_argument('--repeticiones', type=int, default=50)
+    parser.add_argument('--objetivo-ms', type=float, default=50.0)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("⏱️  BENCHMARK BÚSQUEDA DE NIÑOS CERCANOS")
+    print("=" * 60)
+
+    if args.generar:
+        generar_historial(args.generar)
+
+    print(f"\n📊 Historial: ~{PosicionGPS.objects.count():,} posiciones | "
+          f"Últimas posiciones: {UltimaPosicion.objects.count():,}")
+
+    print("\n🔎 Latencias:")
+    peor = 0
+    for radio in (500, 5000, 50000):
+        for limite in (None, 50):
+            peor = max(peor, medir(radio, limite, args.repeticiones))
+
+    print("\n📋 Plan de ejecución (radio 5000 m, limit 50):")
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            EXPLAIN ANALYZE
+            SELECT u.nino_id
+            FROM (SELECT ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography AS punto) q
+            CROSS JOIN {UltimaPosicion._meta.db_table} u
+            WHERE ST_DWithin(u.ubicacion::geography, q.punto, 5000)
+            ORDER BY u.ubicacion::geography <-> q.punto
+            LIMIT 50
+        """, [LNG, LAT])
+        for (linea,) in cursor.fetchall():
+            print(f"   {linea}")
+
+    resultado = "✅" if peor <= args.objetivo_ms else "❌"
+    print(f"\n{resultado} Peor p95: {peor:.2f} ms (objetivo {args.objetivo_ms:.0f} ms)")
+    sys.exit(0 if peor <= args.objetivo_ms else 1)
+
+
+if __name__ == '__main__':
+    main()
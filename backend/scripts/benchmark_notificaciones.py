@@ -0,0 +1,74 @@
+"""
+Benchmark del envío de notificaciones: un mensaje por token vs multicast
+
+Usa el transporte local (sin red) con una latencia simulada por llamada
+para comparar el envío anterior (un round trip por token) con
+enviar_notificacion_multiple (un MulticastMessage cada 500 tokens).
+
+Uso:
+    python scripts/benchmark_notificaciones.py
+    python scripts/benchmark_notificaciones.py --tokens 2000 --latencia 40
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+# Configurar Django
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django
+django.setup()
+
+from apps.alerts.notifications import NotificationService, TipoAlerta
+from apps.alerts.transportes import TransporteLocal
+
+
+def enviar_uno_por_uno(tokens, transporte):
+    """Comportamiento anterior: una llamada a FCM por token"""
+    for token in tokens:
+        NotificationService.enviar_notificacion_multiple(
+            [token], TipoAlerta.SALIDA_AREA, 'Niño Benchmark', transporte=transporte
+        )
+
+
+def enviar_multicast(tokens, transporte):
+    NotificationService.enviar_notificacion_multiple(
+        tokens, TipoAlerta.SALIDA_AREA, 'Niño Benchmark', transporte=transporte
+    )
+
+
+def medir(funcion, tokens, latencia_ms):
+    transporte = TransporteLocal(latencia_ms=latencia_ms)
+    inicio = time.perf_counter()
+    funcion(tokens, transporte)
+    return (time.perf_counter() - inicio) * 1000, len(transporte.enviados)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tokens', type=int, default=1000, help='Tokens destinatarios')
+    parser.add_argument('--latencia', type=float, default=20, help='Latencia simulada por llamada (ms)')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("⏱️  BENCHMARK NOTIFICACIONES: UNO POR UNO vs MULTICAST")
+    print("=" * 60)
+
+    tokens = [f'token-benchmark-{i}' for i in range(args.tokens)]
+    t_serial, llamadas_serial = medir(enviar_uno_por_uno, tokens, args.latencia)
+    t_multicast, llamadas_multicast = medir(enviar_multicast, tokens, args.latencia)
+
+    print(
+        f"\n📋 {args.tokens} tokens, {args.latencia:.0f} ms por llamada\n"
+        f"   Uno por uno: {t_serial:10.1f} ms  ({llamadas_serial} llamadas)\n"
+        f"   Multicast:   {t_multicast:10.1f} ms  ({llamadas_multicast} llamadas)  "
+        f"x{t_serial / t_multicast:.1f}"
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark de los serializadores rápidos vs. los serializers de DRF
+
+Para cada listado (alertas / mis-alertas, niños, posiciones) renderiza la
+misma página con ambos caminos, verifica que el JSON sea idéntico byte a
+byte y compara los tiempos (consulta + serialización + render).
+
+Uso:
+    python scripts/benchmark_serializadores.py
+    python scripts/benchmark_serializadores.py --tamano 100 --repeticiones 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Configurar Django
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from apps.api.fast_serializers import AlertaRapido, NinoRapido, PosicionGPSRapido
+from apps.api.serializers import AlertaSerializer, NinoSerializer, PosicionGPSSerializer
+from apps.api.views import AlertaViewSet, NinoViewSet
+from apps.gis_tracking.models import PosicionGPS
+
+
+# (nombre, queryset de la vista, serializer DRF, serializador rápido)
+CASOS = [
+    ('alertas', AlertaViewSet.queryset, AlertaSerializer, AlertaRapido),
+    ('ninos', NinoViewSet.queryset, NinoSerializer, NinoRapido),
+    ('posiciones',
+     PosicionGPS.objects.select_related('nino').con_distancia_centro().order_by('-timestamp'),
+     PosicionGPSSerializer, PosicionGPSRapido),
+]
+
+
+def render_drf(queryset, serializer_class, context):
+    datos = serializer_class(list(queryset), many=True, context=context).data
+    return JSONRenderer().render(datos)
+
+
+def render_rapido(queryset, serializador_class, context):
+    serializador = serializador_class(context=context)
+    return JSONRenderer().render(serializador.representar_lista(serializador.valores(queryset)))
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--tamano', type=int, default=20, help='Objetos por página')
+    parser.add_argument('--repeticiones', type=int, default=30)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("⏱️  BENCHMARK SERIALIZADORES RÁPIDOS vs DRF")
+    print("=" * 60)
+
+    # Sin request: las URLs de fotos quedan relativas en ambos caminos
+    context = {}
+    todo_identico = True
+
+    for nombre, base, serializer_class, serializador_class in CASOS:
+        queryset = base.all()[:args.tamano]
+        total = queryset.count()
+        if not total:
+            print(f"\n⚠️  {nombre}: sin datos, se omite")
+            continue
+
+        drf = lambda: render_drf(queryset, serializer_class, context)
+        rapido = lambda: render_rapido(queryset, serializador_class, context)
+
+        identico = drf() == rapido()
+        todo_identico &= identico
+
+        with CaptureQueriesContext(connection) as consultas_drf:
+            drf()
+        with CaptureQueriesContext(connection) as consultas_rapido:
+            rapido()
+
+        t_drf = medir(drf, args.repeticiones)
+        t_rapido = medir(rapido, args.repeticiones)
+        print(
+            f"\n📋 {nombre} ({total} objetos) {'✅ idéntico' if identico else '❌ DIFERENTE'}\n"
+            f"   DRF:    {t_drf:8.2f} ms  ({len(consultas_drf)} consultas)\n"
+            f"   Rápido: {t_rapido:8.2f} ms  ({len(consultas_rapido)} consultas)  "
+            f"x{t_drf / t_rapido:.1f}"
+        )
+
+    print(f"\n{'✅ JSON idéntico en todos los listados' if todo_identico else '❌ Hay diferencias'}")
+    sys.exit(0 if todo_identico else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+Prueba de carga del fan-out de tracking GPS por WebSocket
+
+Abre N sockets de tutor contra GPSTrackingConsumer (en proceso, con
+channels.testing.WebsocketCommunicator y la capa de canales configurada)
+y publica rondas de fixes: en cada ronda cada niño emite un fix con un
+solo group_send a tracking_nino_{id}, que deben recibir todos sus tutores.
+
+Cada niño tiene --tutores-por-nino tutores (principal + adicionales);
+con 10000 sockets y 5 tutores por niño son 2000 niños. Los niños de cada
+tutor se asignan en memoria (sin BD) para medir solo la capa de canales.
+
+Reporta el tiempo de conexión, los group_send por fix, las entregas
+recibidas, los bytes por entrega y la latencia de entrega (p50/p95/p99).
+Con --binario los sockets negocian el subprotocolo binario (protocolo.py).
+Cada socket pide --max-hz con un mensaje subscribe (coalescing por
+conexión); la latencia incluye la espera al próximo turno de envío.
+
+Uso:
+    python scripts/prueba_carga_websocket.py
+    python scripts/prueba_carga_websocket.py --sockets 10000 --rondas 5
+    python scripts/prueba_carga_websocket.py --capa memoria
+    python scripts/prueba_carga_websocket.py --binario
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Configurar Django
+backend_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(backend_dir))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django
+django.setup()
+
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.urls import re_path
+from django.utils import timezone
+
+from apps.gis_tracking import protocolo
+from apps.gis_tracking.consumers import GPSTrackingConsumer, grupo_nino
+
+
+class UsuarioCarga:
+    is_authenticated = True
+
+
+class ConsumerCarga(GPSTrackingConsumer):
+    """Consumer real con el acceso y los niños del tutor resueltos en memoria"""
+
+    async def verify_tutor_access(self):
+        return True
+
+    async def get_ninos_ids(self):
+        return self.scope['ninos_ids']
+
+
+def aplicacion(asignacion):
+    """URLRouter del tracking con usuario y niños inyectados en el scope"""
+    router = URLRouter([
+        re_path(r'ws/tracking/tutor/(?P<tutor_id>\d+)/$', ConsumerCarga.as_asgi()),
+    ])
+
+    async def app(scope, receive, send):
+        tutor_id = int(scope['path'].rstrip('/').rsplit('/', 1)[1])
+        scope = dict(scope, user=UsuarioCarga(), ninos_ids=asignacion[tutor_id])
+        return await router(scope, receive, send)
+
+    return app
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+async def conectar(app, sockets, lote, binario, max_hz):
+    """Conecta los sockets en lotes concurrentes; devuelve los communicators"""
+    subprotocolos = [protocolo.SUBPROTOCOLO_BINARIO] if binario else None
+    conectados = []
+    for inicio in range(0, sockets, lote):
+        grupo = [
+            WebsocketCommunicator(app, f'/ws/tracking/tutor/{tutor_id}/', subprotocols=subprotocolos)
+            for tutor_id in range(inicio, min(inicio + lote, sockets))
+        ]
+        resultados = await asyncio.gather(*(c.connect(timeout=30) for c in grupo))
+        for communicator, (aceptado, _) in zip(grupo, resultados):
+            if not aceptado:
+                raise RuntimeError('Conexión rechazada por el consumer')
+            await communicator.receive_from(timeout=30)  # connection_established
+            await communicator.send_json_to({'type': 'subscribe', 'max_hz': max_hz})
+            await communicator.receive_from(timeout=30)  # subscribed
+        conectados.extend(grupo)
+    return conectados
+
+
+async def recibir(communicator, esperados, enviados, latencias, bytes_recibidos, timeout):
+    """Recibe `esperados` gps_update y registra la latencia de cada uno"""
+    for _ in range(esperados):
+        frame = await communicator.receive_from(timeout=timeout)
+        if isinstance(frame, bytes):
+            mensaje = protocolo.decodificar_gps_update(frame)
+            bytes_recibidos.append(len(frame))
+        else:
+            mensaje = json.loads(frame)
+            bytes_recibidos.append(len(frame.encode()))
+        latencias.append(time.perf_counter() - enviados[mensaje['nino_id']])
+
+
+async def ronda(communicators, asignacion, ninos, timeout):
+    """Un fix por niño (un group_send cada uno) y espera todas las entregas"""
+    capa = get_channel_layer()
+    enviados = {}
+    latencias = []
+    bytes_recibidos = []
+    receptores = [
+        asyncio.create_task(recibir(
+            c, len(asignacion[tutor_id]), enviados, latencias, bytes_recibidos, timeout
+        ))
+        for tutor_id, c in enumerate(communicators)
+    ]
+
+    inicio = time.perf_counter()
+    for nino_id in range(ninos):
+        enviados[nino_id] = time.perf_counter()
+        await capa.group_send(grupo_nino(nino_id), protocolo.evento_gps_update(
+            nino_id, -17.7833, -63.1812, 80, True, timezone.now()
+        ))
+    await asyncio.gather(*receptores)
+    return time.perf_counter() - inicio, latencias, bytes_recibidos
+
+
+async def ejecutar(args):
+    ninos = max(1, args.sockets // args.tutores_por_nino)
+    # Tutor i sigue al niño i % ninos: cada niño queda con ~tutores_por_nino tutores
+    asignacion = {tutor_id: [tutor_id % ninos] for tutor_id in range(args.sockets)}
+    app = aplicacion(asignacion)
+
+    print(f"\n🔌 Conectando {args.sockets} sockets ({ninos} niños, "
+          f"{args.tutores_por_nino} tutores por niño)...")
+    inicio = time.perf_counter()
+    communicators = await conectar(app, args.sockets, args.lote, args.binario, args.max_hz)
+    t_conexion = time.perf_counter() - inicio
+    print(f"   {t_conexion:.1f} s ({args.sockets / t_conexion:.0f} conexiones/s)")
+
+    for numero in range(1, args.rondas + 1):
+        duracion, latencias, bytes_recibidos = await ronda(communicators, asignacion, ninos, args.timeout)
+        ms = [latencia * 1000 for latencia in latencias]
+        print(
+            f"\n📡 Ronda {numero}: {ninos} group_send (1 por fix), "
+            f"{len(latencias)} entregas en {duracion * 1000:.0f} ms, "
+            f"{statistics.mean(bytes_recibidos):.0f} bytes por entrega\n"
+            f"   Latencia p50 {percentil(ms, 50):.1f} ms · p95 {percentil(ms, 95):.1f} ms · "
+            f"p99 {percentil(ms, 99):.1f} ms · media {statistics.mean(ms):.1f} ms"
+        )
+
+    await asyncio.gather(*(c.disconnect() for c in communicators))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sockets', type=int, default=10000, help='Sockets de tutor concurrentes')
+    parser.add_argument('--tutores-por-nino', type=int, default=5, help='Tutores que siguen a cada niño')
+    parser.add_argument('--rondas', type=int, default=3, help='Rondas de un fix por niño')
+    parser.add_argument('--lote', type=int, default=500, help='Conexiones concurrentes al conectar')
+    parser.add_argument('--timeout', type=float, default=60, help='Espera máxima por entrega (s)')
+    parser.add_argument('--max-hz', type=float, default=10, help='Frecuencia máxima pedida por cada socket')
+    parser.add_argument('--binario', action='store_true', help='Negociar el formato binario de gps_update')
+    parser.add_argument('--capa', choices=['configurada', 'memoria'], default='configurada',
+                        help='Capa de canales: la de settings (Redis) o InMemoryChannelLayer')
+    args = parser.parse_args()
+
+    if args.capa == 'memoria':
+        settings.CHANNEL_LAYERS = {
+            'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+        }
+
+    print("=" * 60)
+    print("📡 PRUEBA DE CARGA: FAN-OUT WEBSOCKET POR NIÑO")
+    print("=" * 60)
+    print(f"   Capa de canales: {settings.CHANNEL_LAYERS['default']['BACKEND']}")
+
+    asyncio.run(ejecutar(args))
+
+
+if __name__ == '__main__':
+    main()